@@ -1,22 +1,35 @@
 import logging
 import json
+import csv
+import io
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove, CallbackQuery
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (Application, CommandHandler, MessageHandler, filters,
                           ConversationHandler, ContextTypes, ChatMemberHandler,
-                          CallbackQueryHandler)
+                          CallbackQueryHandler, TypeHandler)
 from telegram.error import NetworkError, TelegramError # <--- Added NetworkError and TelegramError imports
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-import tempfile
+from user_index import UserIndex, column_letter_to_index, column_index_to_letter
+from sheet_write_queue import SheetWriteQueue
+from sheet_gateway import sheet_gateway
+from apps_script_client import AppsScriptClient, AppsScriptError
+from drive_uploader import DriveUploader
+from registry_store import RegistryStore
+from sheet_replicator import SheetReplicator
+from conversation_persistence import SQLitePersistence
+from session_store import SessionStore
+from names_refresher import NamesRefresher
+from broadcast_queue import BroadcastQueue
+from webhook_server import run_webhook, default_secret_token, start_status_server
+from bot_health import BotHealth, startup_timings
+from google_connection import GoogleConnection
+from bot_metrics import instrument_application, metrics
+from update_recorder import recorder_for
+from profiler import MODES as PROFILING_MODES, PROFILE_DEFAULT_SECONDS, profiler, window_seconds
+import sqlite3
 import os
-import requests
 import re
 import asyncio
 import telegram
-import tempfile
 from datetime import datetime
 
 # Enable logging
@@ -26,7 +39,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-user_specific_data = {}
+# Rating-flow sessions keyed by chat ID; unanswered sessions expire (FEEDBACK_SESSION_TTL)
+# and the least recently used are evicted past FEEDBACK_SESSION_MAX_ENTRIES.
+user_specific_data = SessionStore(name="feedback_sessions")
 PROFESSIONAL_ID_COL_MAIN_SHEET = 0 # Assuming 'Professional_ID' is in column A
 PROFESSIONAL_NAME_COL_MAIN_SHEET = 2 # Assuming 'Full_Name' is in column B
 # Define your conversation states (if not already defined)
@@ -42,8 +57,27 @@ if not DEBO_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN_DEBO environment variable not set.")
 # --- End Telegram Bot Token Setup ---
 
+# Telegram user allowed to run the admin commands (/request_feedback, /broadcast_feedback,
+# /reload_names, /profiling)
+ADMIN_USER_ID = int(os.environ.get("ADMIN_USER_ID", "401674551"))
+
+
+# --- Google Sheets Setup ---
+GOOGLE_CREDENTIALS_JSON_PATH = os.environ.get("GOOGLE_CREDENTIALS_JSON")
+SPREADSHEET_ID_DEBO = os.environ.get("SPREADSHEET_ID_DEBO", "16l_rYpXX1hrEUNS9DOCU2naCij-U635unpD12WDDggA")
+# Authorized and opened once by startup_task; gspread, Drive and the names refresher share its credentials.
+google_connection = GoogleConnection("Debo_registration", GOOGLE_CREDENTIALS_JSON_PATH)
+
+def open_main_worksheet(client):
+    return client.open_by_key(SPREADSHEET_ID_DEBO).worksheet("Sheet1")
+
+google_connection.add_worksheet("Sheet1", open_main_worksheet)
+# --- End Google Sheets Setup ---
+
 
 APPS_SCRIPT_WEB_APP_URL = "https://script.google.com/macros/s/AKfycbyEbwoX6hglK7cCES1GeVKFhtwmajvVAI1WDBfh03bsQbA3DKgkfCe_jJfH-8EZ0HUc/exec"
+# Shared pooled client for rating POSTs (concurrency/timeout/retries via APPS_SCRIPT_* env vars)
+apps_script_client = AppsScriptClient(APPS_SCRIPT_WEB_APP_URL)
 
 
 
@@ -106,27 +140,38 @@ yes_no_markup = ReplyKeyboardMarkup(yes_no_keyboard, one_time_keyboard=True, res
 
 
 
-def find_user_row(user_id, worksheet_from_bot_data): # IMPORTANT: Added worksheet_from_bot_data parameter
+# Local SQLite primary store for the professional registry. Every handler reads
+# and writes here; registry_replicator keeps main_worksheet in sync in the
+# background (both created in startup_task).
+registry_store = None
+registry_replicator = None
+
+# Resident User ID -> (row index, row record) index over the main worksheet,
+# used by the replicator to find the sheet row of each professional.
+user_index = UserIndex()
+
+# Write-behind queue for main_worksheet mutations (created in startup_task).
+sheet_writer = None
+
+
+def find_user_record(user_id):
     """
-    Finds the row index and data for a given user_id in the specified worksheet.
+    Looks up a registered professional in the local registry store.
     Args:
         user_id (int): The Telegram user ID.
-        worksheet_from_bot_data: The gspread worksheet object.
     Returns:
-        tuple: (row_index, row_data) or (None, None) if not found/error.
+        dict: The row record keyed by sheet header, or None if not found/error.
     """
     try:
-        records = worksheet_from_bot_data.get_all_records()
-        # enumerate starts from 0, but sheet rows are 1-based, and we skip header (row 1), so start=2
-        for idx, row in enumerate(records, start=2):
-            if str(row.get("User ID")) == str(user_id):
-                logger.info(f"User {user_id} found in sheet at row {idx}. Data: {row.get('Full_Name', 'N/A')}")
-                return idx, row
+        row = registry_store.get(user_id)
+        if row:
+            logger.info(f"User {user_id} found in registry. Data: {row.get('Full_Name', 'N/A')}")
+            return row
     except Exception as e:
-        logger.error(f"Error in find_user_row for user {user_id}: {e}", exc_info=True)
-        return None, None
-    logger.info(f"User {user_id} not found in sheet.")
-    return None, None
+        logger.error(f"Error in find_user_record for user {user_id}: {e}", exc_info=True)
+        return None
+    logger.info(f"User {user_id} not found in registry.")
+    return None
 
 # Helper function to validate phone number
 def is_valid_phone_number(phone_number: str) -> bool:
@@ -145,26 +190,59 @@ def is_valid_phone_number(phone_number: str) -> bool:
         return True
     return False
 
-#upload_to_drive
-def upload_to_drive(file_path, folder_id, filename, creds):
-    drive_service = build('drive', 'v3', credentials=creds)
-    file_metadata = {
-        'name': filename,
-        'parents': [folder_id]
-    }
-    media = MediaFileUpload(file_path, resumable=True)
-    file = drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-    file_id = file.get('id')
-    return f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
+# Background Telegram -> Drive upload pool (created in startup_task).
+drive_uploader = None
+
+TESTIMONIAL_FOLDER_ID = "1TMehhfN9tExqoaHIYya-B-SCcFeBTj2y"
+EDUCATION_FOLDER_ID = "1i9a2G7EXByrY9LxXtv4yY-CMExDWI7hM"
+
+
+def queue_drive_upload(context: ContextTypes.DEFAULT_TYPE, user_id, links_key: str, file_id, folder_id, filename):
+    """
+    Starts a background Telegram -> Drive upload for links_key. The file is also
+    recorded in user_data['pending_uploads'] (which is persisted), so uploads
+    still queued when the bot restarts are started again when collected.
+    """
+    context.user_data.setdefault('pending_uploads', {}).setdefault(links_key, []).append([file_id, folder_id, filename])
+    drive_uploader.submit((user_id, links_key), context.bot, file_id, folder_id, filename)
+
+
+def has_pending_uploads(context: ContextTypes.DEFAULT_TYPE, links_key: str) -> bool:
+    return bool(context.user_data.get('pending_uploads', {}).get(links_key))
+
+
+def discard_uploads(context: ContextTypes.DEFAULT_TYPE, user_id, links_key: str):
+    """Forgets uploads queued for links_key (the flow restarted or was cancelled)."""
+    context.user_data.get('pending_uploads', {}).pop(links_key, None)
+    if drive_uploader is not None:
+        drive_uploader.discard((user_id, links_key))
+
+
+async def collect_uploaded_links(user_id, links_key: str, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Waits for the user's background uploads for links_key and appends the
+    resulting Drive links to context.user_data[links_key]. Returns the number
+    of files that failed to upload.
+    """
+    if drive_uploader is None:
+        return 0
+    owner = (user_id, links_key)
+    queued = context.user_data.get('pending_uploads', {}).pop(links_key, [])
+    # Files queued before a restart have no job in this process any more.
+    drive_uploader.resubmit_lost(owner, context.bot, queued)
+    links, errors = await drive_uploader.collect(owner)
+    context.user_data.setdefault(links_key, []).extend(links)
+    if errors:
+        logger.error(f"{len(errors)} {links_key} upload(s) failed for user {user_id}: {errors}")
+    return len(errors)
 
 # --- Sheet Update Helper ---
 async def update_sheet_cell(context: ContextTypes.DEFAULT_TYPE, field_name: str, new_value):
     """Updates a specific cell in the user's row."""
-    row_idx = context.user_data.get('edit_row_idx')
-    user_id = context.user_data.get('user_id') # Get user_id for logging
+    user_id = context.user_data.get('user_id')
 
-    if not row_idx:
-        logger.error(f"update_sheet_cell called without row_idx in user_data for user {user_id}")
+    if not user_id:
+        logger.error("update_sheet_cell called without user_id in user_data.")
         return False
 
     col_letter = COLUMN_MAP.get(field_name)
@@ -172,23 +250,34 @@ async def update_sheet_cell(context: ContextTypes.DEFAULT_TYPE, field_name: str,
         logger.error(f"Invalid field name '{field_name}' provided for update for user {user_id}.")
         return False
 
-    # Retrieve the worksheet object
-    worksheet = context.application.bot_data.get("main_worksheet")
-    if not worksheet:
-        logger.critical(f"ERROR: worksheet not found in bot_data for update_sheet_cell for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"ERROR: registry store not available for update_sheet_cell for user {user_id}.")
         return False
 
     try:
-        # Use update_cells for potentially better performance or batching if needed later
-        worksheet.update(f"{col_letter}{row_idx}", [[new_value]])
-        logger.info(f"Updated row {row_idx}, column {col_letter} for user {user_id}. New value: '{new_value}'")
+        # Written locally; the replicator pushes it to the sheet in the background
+        if not registry_store.update_cell(user_id, column_letter_to_index(col_letter), new_value):
+            logger.error(f"update_sheet_cell could not find user {user_id} in the registry.")
+            return False
+        logger.info(f"Updated column {col_letter} for user {user_id}. New value: '{new_value}'")
         return True
     except Exception as e:
-        logger.error(f"Failed to update sheet for row {row_idx}, column {col_letter} for user {user_id}: {e}", exc_info=True)
+        logger.error(f"Failed to update column {col_letter} for user {user_id}: {e}", exc_info=True)
         return False
 
 # Global lookup for professional names (populated by startup_task)
 professional_names_lookup = {}
+# Keeps professional_names_lookup current in the background (created in startup_task)
+names_refresher = None
+
+# Liveness/performance signals behind the health check (created in build_application).
+bot_health = None
+# Polling mode only: local port of the bot's status server, which the Flask
+# health app in entrypoint.py proxies.
+HEALTH_INTERNAL_PORT = int(os.environ.get("HEALTH_INTERNAL_PORT", "8081"))
+status_server = None
+# Anonymized copy of every incoming update for replay.py (only when RECORD_UPDATES_DIR is set).
+update_recorder = None
 
 
 async def send_rating_request(chat_id: int, professional_id_to_rate: str, context: ContextTypes.DEFAULT_TYPE):
@@ -300,7 +389,7 @@ async def handle_rating_callback(update: Update, context: ContextTypes.DEFAULT_T
 
 async def send_follow_up_rating_prompt(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
     
-    # CORRECTED: Use the global user_specific_data dictionary
+    # Rating session of this chat (see session_store.SessionStore)
     user_session_data = user_specific_data.get(chat_id, {'initial_professional_ids': [], 'rated_professional_ids': set()})
     # These variables aren't directly used in *this* function's current logic,
     # but the line is kept for consistency in accessing session data.
@@ -341,11 +430,8 @@ async def send_rating_to_apps_script(professional_id: str, rating_value: int, us
     # --- END DEBUGGING LOGS ---
 
     try:
-        # !!! CRITICAL FIX: Use 'json' parameter instead of 'data'
-        response = requests.post(APPS_SCRIPT_WEB_APP_URL, json=payload) # Headers are automatically set to application/json
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-
-        response_json = response.json()
+        # Non-blocking, pooled POST; 429/5xx are retried with jittered backoff
+        response_json = await apps_script_client.post_json(payload)
         if response_json.get("success"):
             pro_name = professional_names_lookup.get(professional_id, professional_id)
             await query_object.edit_message_text(
@@ -371,7 +457,7 @@ async def send_rating_to_apps_script(professional_id: str, rating_value: int, us
             )
             logger.error(f"Error from Apps Script for rating ({professional_id}, {rating_value}): {error_message}. Full response: {response_json}")
 
-    except requests.exceptions.RequestException as e:
+    except AppsScriptError as e:
         await query_object.edit_message_text(
             text="❌ Failed to connect to rating service. Please try again later."
                  f"\n\n_Network error: {e}_",
@@ -405,6 +491,7 @@ async def request_feedback_command(update: Update, context: ContextTypes.DEFAULT
                 parse_mode='Markdown'
             )
             logger.info(f"Admin triggered initial feedback for {target_chat_id} with {professional_ids_to_send}")
+            logger.info(f"Feedback session store: {user_specific_data.stats()}")
 
         except ValueError:
             await update.message.reply_text("Invalid chat ID. Please provide a numeric user ID.", parse_mode='Markdown')
@@ -417,6 +504,93 @@ async def request_feedback_command(update: Update, context: ContextTypes.DEFAULT
             parse_mode='Markdown'
         )
 
+# Rate-limited fan-out for bulk feedback requests (BROADCAST_* env vars)
+feedback_broadcast_queue = BroadcastQueue()
+FEEDBACK_REPORT_MAX_FAILURES = 20
+
+
+def parse_feedback_csv(text: str):
+    """
+    Parses broadcast CSV rows of `chat_id, professional_id_1[, professional_id_2 ...]`.
+    A header row and blank rows are skipped. Returns (targets, invalid_rows)
+    with targets as [(chat_id, [professional_ids])].
+    """
+    targets, invalid_rows = [], []
+    for line_no, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells:
+            continue
+        try:
+            chat_id = int(cells[0])
+        except ValueError:
+            if line_no != 1:  # the first row may be a header
+                invalid_rows.append(line_no)
+            continue
+        if len(cells) < 2:
+            invalid_rows.append(line_no)
+            continue
+        targets.append((chat_id, cells[1:]))
+    return targets, invalid_rows
+
+
+async def broadcast_feedback_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin command: send the initial feedback message to every chat in an uploaded CSV.
+    Usage: upload a .csv file with the caption /broadcast_feedback; each row is
+    `<user_chat_id>,<professional_id_1>[,<professional_id_2>...]`.
+    """
+    document = update.message.document
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        content = await telegram_file.download_as_bytearray()
+        targets, invalid_rows = parse_feedback_csv(bytes(content).decode("utf-8-sig"))
+    except (TelegramError, UnicodeDecodeError) as e:
+        await update.message.reply_text(f"Could not read the CSV file: `{e}`", parse_mode='Markdown')
+        logger.error(f"Error reading feedback broadcast CSV: {e}", exc_info=True)
+        return
+
+    if not targets:
+        await update.message.reply_text("No valid rows found. Each row must be: `chat_id,professional_id[,professional_id...]`",
+                                        parse_mode='Markdown')
+        return
+
+    await update.message.reply_text(f"Sending feedback requests to {len(targets)} chat(s)... I will report back when done.")
+    logger.info(f"Admin started a feedback broadcast to {len(targets)} chat(s); {len(invalid_rows)} invalid row(s).")
+    # Runs in the background so this handler (and other updates) are not held up
+    context.application.create_task(
+        run_feedback_broadcast(update.effective_chat.id, targets, invalid_rows, context),
+        update=update,
+    )
+
+
+async def run_feedback_broadcast(admin_chat_id: int, targets, invalid_rows, context: ContextTypes.DEFAULT_TYPE):
+    jobs = [
+        (chat_id, lambda chat_id=chat_id, ids=ids: send_initial_feedback_message(chat_id, ids, context))
+        for chat_id, ids in targets
+    ]
+    report = await feedback_broadcast_queue.run(jobs)
+    for chat_id, _ in report["failed"]:
+        user_specific_data.pop(chat_id, None)
+
+    lines = [
+        "📊 Feedback broadcast finished",
+        f"Sent: {report['sent']}/{report['total']}",
+        f"Failed: {len(report['failed'])}",
+        f"Unknown (timed out, not resent): {len(report['unknown'])}",
+        f"Retries: {report['retries']}",
+        f"Time: {report['elapsed']:.1f}s ({report['throughput']:.1f} msg/s)",
+    ]
+    if invalid_rows:
+        lines.append(f"Skipped invalid CSV rows: {', '.join(map(str, invalid_rows[:FEEDBACK_REPORT_MAX_FAILURES]))}")
+    for chat_id, reason in report["failed"][:FEEDBACK_REPORT_MAX_FAILURES]:
+        lines.append(f"❌ {chat_id}: {reason}")
+    if len(report["failed"]) > FEEDBACK_REPORT_MAX_FAILURES:
+        lines.append(f"... and {len(report['failed']) - FEEDBACK_REPORT_MAX_FAILURES} more failure(s).")
+    for chat_id, reason in report["unknown"][:FEEDBACK_REPORT_MAX_FAILURES]:
+        lines.append(f"❔ {chat_id}: {reason}")
+    await context.bot.send_message(chat_id=admin_chat_id, text="\n".join(lines))
+    logger.info(f"Feedback session store: {user_specific_data.stats()}")
+
 # ... rest of your functions ...
 
 # CODE.txt (modify the existing handle_initial_feedback_callback function)
@@ -432,7 +606,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
     await query.answer()
 
     # --- Retrieve user data for current session ---
-    # CORRECTED: Use the global user_specific_data dictionary
+    # Rating session of this chat (see session_store.SessionStore)
     user_session_data = user_specific_data.get(user_chat_id, {'initial_professional_ids': [], 'rated_professional_ids': set()})
     # --- END Retrieve user data ---
 
@@ -443,8 +617,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
             reply_markup=None
         )
         # Clear session data
-        if user_chat_id in user_specific_data:
-            del user_specific_data[user_chat_id]
+        user_specific_data.pop(user_chat_id, None)
         logger.info(f"User {user_chat_id} chose 'no contact'. Session data cleared.")
 
     elif callback_data == "feedback_will_contact":
@@ -453,8 +626,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
             reply_markup=None
         )
         # Clear session data
-        if user_chat_id in user_specific_data:
-            del user_specific_data[user_chat_id]
+        user_specific_data.pop(user_chat_id, None)
         logger.info(f"User {user_chat_id} chose 'will contact soon'. Session data cleared.")
 
     elif callback_data == "feedback_opt_out":
@@ -465,8 +637,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
         # IMPORTANT: Implement logic here to store this opt-out preference persistently
         # e.g., in your Google Sheet for this user ID.
         # Clear session data
-        if user_chat_id in user_specific_data:
-            del user_specific_data[user_chat_id]
+        user_specific_data.pop(user_chat_id, None)
         logger.info(f"User {user_chat_id} opted out of feedback requests. Session data cleared.")
         
     elif callback_data.startswith("feedback_select_pro_"):
@@ -513,8 +684,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
                 reply_markup=None
             )
             # Clear session data as all Professionals have been rated
-            if user_chat_id in user_specific_data:
-                del user_specific_data[user_chat_id]
+            user_specific_data.pop(user_chat_id, None)
             logger.info(f"User {user_chat_id} rated all Professionals. Session data cleared.")
 
     elif callback_data == "followup_end_rating":
@@ -523,8 +693,7 @@ async def handle_initial_feedback_callback(update: Update, context: ContextTypes
             reply_markup=None
         )
         # Clear session data
-        if user_chat_id in user_specific_data:
-            del user_specific_data[user_chat_id]
+        user_specific_data.pop(user_chat_id, None)
         logger.info(f"User {user_chat_id} ended the rating process. Session data cleared.")
 
     return
@@ -566,14 +735,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    # IMPORTANT: Retrieve worksheet from bot_data and pass it
-    worksheet = context.application.bot_data.get("main_worksheet")
-    if not worksheet:
-        logger.critical(f"main_worksheet not available in register function for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"registry store not available in register function for user {user_id}.")
         await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
         return ConversationHandler.END
 
-    _, existing = find_user_row(user_id, worksheet) # <--- MODIFIED
+    existing = find_user_record(user_id)
     if existing:
         await update.message.reply_text("ℹ️You are already registered muya. / ሙያ ላይ ተመዝግበዋል", reply_markup=main_menu_markup)
         return ConversationHandler.END
@@ -644,12 +811,11 @@ async def ask_for_testimonials(update: Update, context: ContextTypes.DEFAULT_TYP
         reply_markup=skip_done_markup # Show keyboard immediately
     )
     context.user_data['testimonial_links'] = []
+    discard_uploads(context, update.effective_user.id, 'testimonial_links')
     return TESTIMONIALS
 
 async def handle_testimonials(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Retrieve credentials from bot_data
-    creds = context.application.bot_data.get("gdrive_creds")
-    if not creds:
+    if drive_uploader is None:
         logger.error(f"Google Drive credentials not found in bot_data for user {update.effective_user.id}.")
         await update.message.reply_text("Error: Could not access Google Drive for uploads. Please try again later or contact support.")
         return ConversationHandler.END # Or a more appropriate return state
@@ -660,7 +826,7 @@ async def handle_testimonials(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.info(f"User {update.effective_user.id} skipped testimonials. Proceeding to ask for educational docs.")
             return await ask_for_educational_docs(update, context)
         elif "done" in text or "ተጠናቋል" in text:
-            if not context.user_data.get('testimonial_links'):
+            if not context.user_data.get('testimonial_links') and not has_pending_uploads(context, 'testimonial_links'):
                 await update.message.reply_text("No testimonial files were uploaded. Skipping. \n ምንም አይነት የሰሯቸውን ስራዎች ማስርጃ አላስገቡም!", reply_markup=ReplyKeyboardRemove())
             logger.info(f"User {update.effective_user.id} finished testimonials. Proceeding to ask for educational docs.")
             return await ask_for_educational_docs(update, context)
@@ -670,37 +836,16 @@ async def handle_testimonials(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 
     if update.message.document or update.message.photo:
-        testimonial_folder_id = "1TMehhfN9tExqoaHIYya-B-SCcFeBTj2y" # Your folder ID
-
         file = update.message.document or update.message.photo[-1]
         file_id = file.file_id
-        file_obj = await context.bot.get_file(file_id)
-
         filename = file.file_name if update.message.document else f"photo_{file_id}.jpg"
 
-        with tempfile.NamedTemporaryFile(delete=False) as tf:
-            temp_path = tf.name
-            await file_obj.download_to_drive(temp_path)
+        # Uploaded in the background; finish_registration collects the links.
+        queue_drive_upload(context, update.effective_user.id, 'testimonial_links', file_id, TESTIMONIAL_FOLDER_ID, filename)
+        logger.info(f"Queued testimonial file {filename} for user {update.effective_user.id}.")
 
-        try:
-            link = upload_to_drive(temp_path, testimonial_folder_id, filename, creds)
-
-            if 'testimonial_links' not in context.user_data:
-                context.user_data['testimonial_links'] = []
-            context.user_data['testimonial_links'].append(link)
-            logger.info(f"Uploaded testimonial file for user {update.effective_user.id}: {link}")
-
-            await update.message.reply_text("📥  File received. Upload more or select an option:\n\n ማስረጃዎን በትክክል አስገብተዋል። ተጨማሪ ማስረጃ ያስገቡ ወይም ታች ካሉት አማርጮች አንዱን ይጠቀሙ።", reply_markup=skip_done_markup)
-            return TESTIMONIALS
-
-        except Exception as e:
-            logger.error(f"Error uploading testimonial file {filename} to Drive for user {update.effective_user.id}: {e}", exc_info=True)
-            await update.message.reply_text("There was an error uploading your file. Please try again.")
-            return TESTIMONIALS
-
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        await update.message.reply_text("📥  File received. Upload more or select an option:\n\n ማስረጃዎን በትክክል አስገብተዋል። ተጨማሪ ማስረጃ ያስገቡ ወይም ታች ካሉት አማርጮች አንዱን ይጠቀሙ።", reply_markup=skip_done_markup)
+        return TESTIMONIALS
 
     else:
         await update.message.reply_text("Please upload a document/photo or use the buttons. የትኛውንም የፋይል አይነት ማስገባት ይችላሉ። አስገብተው ከጨረሱ skip / አሳልፍ ይጫኑይጫኑ ", reply_markup=skip_done_markup)
@@ -713,13 +858,12 @@ async def ask_for_educational_docs(update: Update, context: ContextTypes.DEFAULT
          reply_markup=skip_done_markup # Show keyboard immediately
     )
     context.user_data['education_links'] = []
+    discard_uploads(context, update.effective_user.id, 'educational_links')
     logger.info(f"User {update.effective_user.id} asked for educational docs. Initializing education_links.")
     return EDUCATIONAL_DOCS
 
 async def handle_educational_docs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    # Retrieve credentials from bot_data
-    creds = context.application.bot_data.get("gdrive_creds")
-    if not creds:
+    if drive_uploader is None:
         logger.error(f"Google Drive credentials not found in bot_data for user {update.effective_user.id}.")
         await update.message.reply_text("Error: Could not access Google Drive for uploads. Please try again later or contact support.")
         return ConversationHandler.END # Or a more appropriate return state
@@ -730,7 +874,7 @@ async def handle_educational_docs(update: Update, context: ContextTypes.DEFAULT_
             logger.info(f"User {update.effective_user.id} skipped educational documents. Calling finish_registration.")
             return await finish_registration(update, context) # <--- CRITICAL CHANGE: Call finish_registration
         elif "done" in text or "ተጠናቋል" in text:
-            if not context.user_data.get('educational_links'):
+            if not context.user_data.get('educational_links') and not has_pending_uploads(context, 'educational_links'):
                 await update.message.reply_text("No educational files were uploaded. Skipping. ምንም አይነት የሰሯቸውን ስራዎች ማስርጃ አላስገቡም!", reply_markup=ReplyKeyboardRemove())
             logger.info(f"User {update.effective_user.id} finished educational documents. Calling finish_registration.")
             return await finish_registration(update, context) # <--- CRITICAL CHANGE: Call finish_registration
@@ -739,37 +883,16 @@ async def handle_educational_docs(update: Update, context: ContextTypes.DEFAULT_
             return EDUCATIONAL_DOCS
 
     if update.message.document or update.message.photo:
-        education_folder_id = "1i9a2G7EXByrY9LxXtv4yY-CMExDWI7hM" # Replace with your actual folder ID
-
         file = update.message.document or update.message.photo[-1]
         file_id = file.file_id
-        file_obj = await context.bot.get_file(file_id)
-
         filename = file.file_name if update.message.document else f"edu_photo_{file_id}.jpg"
 
-        with tempfile.NamedTemporaryFile(delete=False) as tf:
-            temp_path = tf.name
-            await file_obj.download_to_drive(temp_path)
-
-        try:
-            link = upload_to_drive(temp_path, education_folder_id, filename, creds)
-
-            if 'educational_links' not in context.user_data:
-                context.user_data['educational_links'] = []
-            context.user_data['educational_links'].append(link)
-            logger.info(f"Uploaded educational file for user {update.effective_user.id}: {link}")
-
-            await update.message.reply_text("📥  File received. Upload more or select an option:\n\n ማስረጃዎን በትክክል አስገብተዋል። ተጨማሪ ማስረጃ ያስገቡ ወይም ታች ካሉት አማርጮች አንዱን ይጠቀሙ።", reply_markup=skip_done_markup)
-            return EDUCATIONAL_DOCS
+        # Uploaded in the background; finish_registration collects the links.
+        queue_drive_upload(context, update.effective_user.id, 'educational_links', file_id, EDUCATION_FOLDER_ID, filename)
+        logger.info(f"Queued educational file {filename} for user {update.effective_user.id}.")
 
-        except Exception as e:
-            logger.error(f"Error uploading educational file {filename} to Drive for user {update.effective_user.id}: {e}", exc_info=True)
-            await update.message.reply_text("There was an error uploading your file. Please try again.")
-            return EDUCATIONAL_DOCS
-
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        await update.message.reply_text("📥  File received. Upload more or select an option:\n\n ማስረጃዎን በትክክል አስገብተዋል። ተጨማሪ ማስረጃ ያስገቡ ወይም ታች ካሉት አማርጮች አንዱን ይጠቀሙ።", reply_markup=skip_done_markup)
+        return EDUCATIONAL_DOCS
 
     else:
         await update.message.reply_text("Please upload a document/photo or use the buttons. የትኛውንም የፋይል አይነት ማስገባት ይችላሉ። አስገብተው ከጨረሱ skip / አሳልፍ ይጫኑይጫኑ ", reply_markup=skip_done_markup)
@@ -779,21 +902,23 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.message.from_user.id
     logger.info(f"finish_registration initiated for user ID: {user_id}")
 
-    # --- Step 1: Retrieve the worksheet object ---
-    # This is CRUCIAL. The 'sheet' global might not be correctly initialized or accessible.
-    # Always get the worksheet from bot_data if it was stored in startup_task.
-    worksheet = context.application.bot_data.get("main_worksheet")
-    if not worksheet:
-        logger.critical(f"ERROR: Google Sheet worksheet 'main_worksheet' not found in bot_data for user {user_id}. Bot startup might have failed.")
+    # --- Step 1: Make sure the registry store is available ---
+    if registry_store is None:
+        logger.critical(f"ERROR: registry store not available for user {user_id}. Bot startup might have failed.")
         await update.message.reply_text(
             "❌ System Error: Could not access the registration sheet. Please contact support. / ስህተት: ምዝገባው አልተሳካም። እባክዎ ድጋፍ ያግኙ።",
             reply_markup=main_menu_markup
         )
         return ConversationHandler.END
 
-    logger.info(f"Worksheet '{worksheet.title}' successfully retrieved from bot_data.")
+    # --- Step 2: Wait for background Drive uploads, then prepare the data ---
+    failed_uploads = await collect_uploaded_links(user_id, 'testimonial_links', context)
+    failed_uploads += await collect_uploaded_links(user_id, 'educational_links', context)
+    if failed_uploads:
+        await update.message.reply_text(
+            f"⚠️ {failed_uploads} file(s) could not be uploaded and were skipped. You can add them later with /editprofile."
+        )
 
-    # --- Step 2: Prepare the data to be written ---
     testimonial_links = ", ".join(context.user_data.get('testimonial_links', []))
     education_links = ", ".join(context.user_data.get('educational_links', []))
 
@@ -811,23 +936,13 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
         testimonial_links,                          # Column J: Testimonials
         education_links                             # Column K: Educational Docs
     ]
-    logger.info(f"Data prepared for writing to sheet for user {user_id}: {data}")
+    logger.info(f"Data prepared for writing to registry for user {user_id}: {data}")
 
-    # --- Step 3: Attempt to write data to Google Sheet ---
+    # --- Step 3: Write data to the registry (replicated to Google Sheet in the background) ---
     try:
-        # Pass the retrieved worksheet to find_user_row
-        row_idx, existing_row_data = find_user_row(user_id, worksheet) # <--- MODIFIED: Pass worksheet
-
-        if row_idx:
-            logger.info(f"User {user_id} found at row {row_idx}. Attempting to UPDATE existing row.")
-            # Update the entire row from A to K with the new data
-            worksheet.update(f"A{row_idx}:K{row_idx}", [data])
-            logger.info(f"Successfully UPDATED row {row_idx} for user {user_id}.")
-        else:
-            logger.info(f"User {user_id} not found. Attempting to APPEND new row.")
-            # Append a new row with the collected data
-            worksheet.append_row(data)
-            logger.info(f"Successfully APPENDED new row for user {user_id}.")
+        # Creates the row, or replaces the entire row A to K if the user already exists
+        registry_store.upsert(user_id, data)
+        logger.info(f"Successfully saved registry row for user {user_id}.")
 
         # --- Step 4: Confirm success to the user and clear data ---
         await update.message.reply_text(
@@ -839,11 +954,11 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Clear user data to avoid storing stale information
         context.user_data.clear()
 
-    except gspread.exceptions.APIError as api_e:
-        # This catches errors directly from the Google Sheets API (e.g., permission denied, invalid range)
-        logger.error(f"Google Sheets API Error while saving data for user {user_id}: {api_e.response.text}", exc_info=True)
+    except sqlite3.Error as db_e:
+        # This catches errors from the local registry database (e.g., disk full, locked database)
+        logger.error(f"Registry database error while saving data for user {user_id}: {db_e}", exc_info=True)
         await update.message.reply_text(
-            f"❌ Error saving your data to Google Sheet due to API issue. Please contact support. / በመረጃ ማስቀመጥ ላይ የኤፒአይ ስህተት ተከስቷል። እባክዎ ድጋፍ ያግኙ።",
+            f"❌ Error saving your data due to a database issue. Please contact support. / በመረጃ ማስቀመጥ ላይ ስህተት ተከስቷል። እባክዎ ድጋፍ ያግኙ።",
             reply_markup=main_menu_markup
         )
     except Exception as e:
@@ -894,13 +1009,12 @@ async def send_manual_rating_command(update: Update, context: ContextTypes.DEFAU
 
 async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
-    if not worksheet:
-        logger.critical(f"main_worksheet not available in profile function for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"registry store not available in profile function for user {user_id}.")
         await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
         return
 
-    _, row = find_user_row(user_id, worksheet) # <--- MODIFIED
+    row = find_user_record(user_id)
     if not row:
         await update.message.reply_text("You are not registered. please click regiser. / አልተመዘገቡም. እባክዎ ምዝገባ የሚለውን ተጭነው ይመዝገቡ", reply_markup=main_menu_markup)
         return
@@ -925,19 +1039,17 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def editprofile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Starts the edit profile conversation."""
     user_id = update.message.from_user.id
-    worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
-    if not worksheet:
-        logger.critical(f"main_worksheet not available in editprofile function for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"registry store not available in editprofile function for user {user_id}.")
         await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
         return ConversationHandler.END
 
-    row_idx, row_data = find_user_row(user_id, worksheet) # <--- MODIFIED
+    row_data = find_user_record(user_id)
 
     if not row_data:
         await update.message.reply_text("You are not registered. Please use /register. / ከዚህ በፊት አልተመዘገቡም እባክዎን /ምዝገባን ተጭነው ይመዝገቡ።", reply_markup=main_menu_markup)
         return ConversationHandler.END
 
-    context.user_data['edit_row_idx'] = row_idx
     context.user_data['user_id'] = user_id # Store user_id for logging if needed
 
     keyboard = [
@@ -996,6 +1108,7 @@ async def ask_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif edit_option['name'] in ["Testimonials", "Educational Docs"]:
         context.user_data['new_file_links'] = []
         context.user_data['file_type_being_edited'] = edit_option['name']
+        discard_uploads(context, user_id, 'new_file_links')
         reply_markup_to_send = skip_done_markup
         logger.info(f"For user {user_id}: Prepared skip_done_markup for {edit_option['name']}.")
     else:
@@ -1078,6 +1191,9 @@ async def handle_new_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text:
         text = update.message.text.lower()
         if "done" in text or "skip" in text or "ተጠናቋል" in text or "አሳልፍ" in text:
+            failed_uploads = await collect_uploaded_links(update.effective_user.id, 'new_file_links', context)
+            if failed_uploads:
+                await update.message.reply_text(f"⚠️ {failed_uploads} file(s) could not be uploaded and were skipped.")
             final_links = ", ".join(context.user_data.get('new_file_links', []))
             if ("skip" in text or "አሳልፍ" in text) and not final_links:
                 final_links = "Skipped"
@@ -1095,31 +1211,17 @@ async def handle_new_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
 
     if update.message.document or update.message.photo:
-        testimonial_folder_id = "1TMehhfN9tExqoaHIYya-B-SCcFeBTj2y"
-        education_folder_id = "1i9a2G7EXByrY9LxXtv4yY-CMExDWI7hM"
-
-        folder_id = testimonial_folder_id if field_name == "Testimonials" else education_folder_id
+        folder_id = TESTIMONIAL_FOLDER_ID if field_name == "Testimonials" else EDUCATION_FOLDER_ID
 
         file = update.message.document or update.message.photo[-1]
         file_id = file.file_id
         try:
-            file_obj = await context.bot.get_file(file_id)
-            with tempfile.NamedTemporaryFile(delete=False) as tf:
-                temp_path = tf.name
-                await file_obj.download_to_drive(temp_path)
-
             filename = getattr(file, 'file_name', None) or f"photo_{file_id}.jpg"
-            creds = context.application.bot_data.get("gdrive_creds") # Get creds for upload_to_drive
-            if not creds:
-                raise ValueError("Google Drive credentials not found for file upload.")
-
-            link = upload_to_drive(temp_path, folder_id, filename, creds)
+            if drive_uploader is None:
+                raise ValueError("Google Drive uploader not available for file upload.")
 
-            if 'new_file_links' not in context.user_data:
-                context.user_data['new_file_links'] = []
-            context.user_data['new_file_links'].append(link)
-
-            os.remove(temp_path)
+            # Uploaded in the background; collected when the user presses done.
+            queue_drive_upload(context, update.effective_user.id, 'new_file_links', file_id, folder_id, filename)
 
             await update.message.reply_text("File received. Upload more or select an option:", reply_markup=skip_done_markup)
             return context.user_data['next_edit_state']
@@ -1135,39 +1237,37 @@ async def handle_new_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def deleteprofile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
-    if not worksheet:
-        logger.critical(f"main_worksheet not available in deleteprofile function for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"registry store not available in deleteprofile function for user {user_id}.")
         await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
         return ConversationHandler.END
 
-    row_idx, row = find_user_row(user_id, worksheet) # <--- MODIFIED
+    row = find_user_record(user_id)
     if not row:
         await update.message.reply_text("You are not registered. / አልተመዘገቡም", reply_markup=main_menu_markup)
         return ConversationHandler.END
     await update.message.reply_text("Are you sure you want to delete your profile? / መርጃዎን ለማጥፋት እርግጠኛ ነዎት?", reply_markup=yes_no_markup)
-    context.user_data['row_idx'] = row_idx
     return CONFIRM_DELETE
 
 
 
 async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text and ("yes" in update.message.text.lower() or "አዎ" in update.message.text.lower()):
-        row_idx = context.user_data.get('row_idx')
         user_id = update.message.from_user.id
-        worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
 
-        if not worksheet:
-            logger.critical(f"main_worksheet not available for delete operation for user {user_id}.")
+        if registry_store is None:
+            logger.critical(f"registry store not available for delete operation for user {user_id}.")
             await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
+            context.user_data.clear()
             return ConversationHandler.END
 
         try:
-            worksheet.delete_rows(row_idx)
-            logger.info(f"Successfully deleted row {row_idx} for user {user_id}.")
+            if not registry_store.delete(user_id):
+                raise LookupError(f"user {user_id} is not registered")
+            logger.info(f"Successfully deleted profile for user {user_id}.")
             await update.message.reply_text("Profile deleted. / መረጃዎ ተደምስሷል", reply_markup=main_menu_markup)
         except Exception as e: # <--- MODIFIED: Catch specific exception and log it
-            logger.error(f"Failed to delete profile for user {user_id} at row {row_idx}: {e}", exc_info=True)
+            logger.error(f"Failed to delete profile for user {user_id}: {e}", exc_info=True)
             await update.message.reply_text(f"Service is temporarily unavailable. Please try again later. Error: {e}", reply_markup=main_menu_markup) # Show specific error
     else:
         await update.message.reply_text("Deletion cancelled. / ድምሰሳው ትቋርጧል", reply_markup=main_menu_markup)
@@ -1176,38 +1276,33 @@ async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
-    if not worksheet:
-        logger.critical(f"main_worksheet not available in comment function for user {user_id}.")
+    if registry_store is None:
+        logger.critical(f"registry store not available in comment function for user {user_id}.")
         await update.message.reply_text("Error: Database connection not ready. Please try again later.", reply_markup=main_menu_markup)
         return ConversationHandler.END
 
-    row_idx, row = find_user_row(user_id, worksheet) # <--- MODIFIED
+    row = find_user_record(user_id)
     if not row:
         await update.message.reply_text("You are not registered. / አልተመዘገቡም", reply_markup=main_menu_markup)
         return ConversationHandler.END
     await update.message.reply_text("Send your comment:  / አስተያየቶን ያላኩ፡", reply_markup=ReplyKeyboardRemove())
-    context.user_data['row_idx'] = row_idx
     return COMMENT
 
 
 async def save_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     comment_text = update.message.text
-    row_idx = context.user_data.get('row_idx')
     user_id = update.message.from_user.id
-    worksheet = context.application.bot_data.get("main_worksheet") # <--- MODIFIED: Get worksheet
-
-    if not worksheet or not row_idx:
-        logger.critical(f"worksheet or row_idx not available for save_comment for user {user_id}.")
-        await update.message.reply_text("Could not locate your registration. ምዝገባዎን ማገኘት አልቻልንም", reply_markup=main_menu_markup)
-        return ConversationHandler.END
 
     try:
-        worksheet.update(range_name=f'I{row_idx}', values=[[comment_text]])
-        logger.info(f"Comment saved for user {user_id} at row {row_idx}.")
+        if registry_store is None or not registry_store.update_cell(user_id, column_letter_to_index(COLUMN_MAP["COMMENT"]), comment_text):
+            logger.critical(f"registry store or registration not available for save_comment for user {user_id}.")
+            await update.message.reply_text("Could not locate your registration. ምዝገባዎን ማገኘት አልቻልንም", reply_markup=main_menu_markup)
+            context.user_data.clear()
+            return ConversationHandler.END
+        logger.info(f"Comment saved for user {user_id}.")
         await update.message.reply_text("Comment saved.", reply_markup=main_menu_markup)
     except Exception as e: # <--- MODIFIED: Catch specific exception and log it
-        logger.error(f"Failed to save comment for user {user_id} at row {row_idx}: {e}", exc_info=True)
+        logger.error(f"Failed to save comment for user {user_id}: {e}", exc_info=True)
         await update.message.reply_text(f"Service is temporarily unavailable. Please try again later. Error: {e}", reply_markup=main_menu_markup)
     context.user_data.clear() # Clear user_data after comment is saved/failed
     return ConversationHandler.END
@@ -1245,135 +1340,183 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    for links_key in ('testimonial_links', 'educational_links', 'new_file_links'):
+        discard_uploads(context, update.effective_user.id, links_key)
     await update.message.reply_text("Cancelled.", reply_markup=main_menu_markup)
     return ConversationHandler.END
 
 async def startup_task(application: Application):
+    global sheet_writer, drive_uploader, registry_store, registry_replicator, names_refresher, status_server
     logger.info("Running startup_task...")
-    # Google Sheets setup
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-
-    # Get the Google Credentials JSON path from its dedicated environment variable
-    GOOGLE_CREDENTIALS_JSON_PATH = os.environ.get("GOOGLE_CREDENTIALS_JSON")
-
-    try:
-        logger.info(f"DEBUG: GOOGLE_CREDENTIALS_JSON_PATH within script: '{GOOGLE_CREDENTIALS_JSON_PATH}'")
-
-        if not GOOGLE_CREDENTIALS_JSON_PATH:
-            logger.error("GOOGLE_CREDENTIALS_JSON environment variable not set. Cannot proceed with Google Sheets connection.")
-            raise ValueError("GOOGLE_CREDENTIALS_JSON environment variable not set.")
-
-        logger.info("Attempting to authorize gspread client...")
-        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_JSON_PATH, scope)
-        gc = gspread.authorize(creds)
-        logger.info("gspread client authorized successfully.")
-        # Store credentials for later use by other functions
-        application.bot_data["gdrive_creds"] = creds # <--- ADD THIS LINE
+    startup_timings.mark("post_init")
+    bot_health.start()
 
+    async def start_status():
+        global status_server
         try:
-            logger.info("Attempting to open Google Spreadsheet 'debo_registration'...")
-            # Use 'gc' for the client, as defined above
-            spreadsheet_id = "16l_rYpXX1hrEUNS9DOCU2naCij-U635unpD12WDDggA"
-            spreadsheet = gc.open_by_key(spreadsheet_id)
-            logger.info(f"Successfully opened Google Spreadsheet: '{spreadsheet.title}' (ID: {spreadsheet.id})")
-
-            logger.info("Attempting to open worksheet 'Sheet1' within 'debo_registration'...")
-            worksheet = spreadsheet.worksheet("Sheet1")
-            logger.info(f"Successfully opened worksheet: '{worksheet.title}'")
-
-            application.bot_data["main_worksheet"] = worksheet
-            logger.info("Worksheet 'Sheet1' loaded into bot_data successfully as 'main_worksheet'.")
-
-        except gspread.exceptions.SpreadsheetNotFound:
-            logger.error(f"Google Spreadsheet 'debo_registration' not found. Please check the name and sharing permissions for service account {creds.service_account_email}.", exc_info=True)
-            raise ValueError("Worksheet not loaded in bot_data. Spreadsheet not found.")
-        except gspread.exceptions.WorksheetNotFound:
-            logger.error(f"Worksheet 'Sheet1' not found within spreadsheet 'debo_registration'. Please check the worksheet name.", exc_info=True)
-            raise ValueError("Worksheet not loaded in bot_data. Worksheet not found.")
-        except Exception as e:
-            logger.error(f"Failed to open Google Sheet 'debo_registration' or 'Sheet1' with gspread: {e}", exc_info=True)
-            raise ValueError(f"Worksheet not loaded in bot_data. Detailed error: {e}")
+            status_server = await start_status_server(bot_health, HEALTH_INTERNAL_PORT)
+        except OSError as e:
+            logger.error(f"Could not start the bot status server on port {HEALTH_INTERNAL_PORT}: {e}")
 
+    # Google Sheets setup: one authorization shared by gspread, Drive and the
+    # names refresher, opened while the status server starts
+    try:
+        await asyncio.gather(
+            google_connection.connect(),
+            *([] if os.environ.get("WEBHOOK_URL") else [start_status()]),
+        )
     except Exception as e:
         logger.error(f"Critical error during gspread authorization or initial sheet loading: {e}", exc_info=True)
         # Re-raise the ValueError to ensure the bot startup fails if the sheet isn't loaded
         raise ValueError(f"Worksheet not loaded in bot_data. Critical startup error: {e}")
+    startup_timings.mark("google_connected")
+    creds = google_connection.creds
+    worksheet = google_connection.worksheet("Sheet1")
+    # Store credentials for later use by other functions
+    application.bot_data["gdrive_creds"] = creds
+    application.bot_data["main_worksheet"] = worksheet
+    logger.info(f"Worksheet '{worksheet.title}' loaded into bot_data successfully as 'main_worksheet'.")
+    drive_uploader = DriveUploader(creds)
+
+    registry_store = RegistryStore()
+    sheet_writer = SheetWriteQueue(worksheet, index=user_index)
+    sheet_writer.start()
+    registry_replicator = SheetReplicator(registry_store, worksheet=worksheet, writer=sheet_writer, index=user_index)
+    names_refresher = NamesRefresher(
+        professional_names_lookup, worksheet, creds=creds,
+        id_col=column_index_to_letter(PROFESSIONAL_ID_COL_MAIN_SHEET),
+        name_col=column_index_to_letter(PROFESSIONAL_NAME_COL_MAIN_SHEET),
+    )
 
-    # Ensure main_worksheet is available before proceeding
-    worksheet = application.bot_data.get("main_worksheet")
-    if not worksheet:
-        logger.critical("main_worksheet is still None after attempts to load. This should not happen if previous errors are handled correctly.")
-        raise ValueError("Worksheet not loaded in bot_data during final check.")
-
-    await load_professional_names_from_sheet(worksheet)
-    logger.info(f"DEBUG: professional_names_lookup content after startup: {professional_names_lookup}")
-    logger.info("Professional names loaded successfully on startup.")
-
-async def load_professional_names_from_sheet(worksheet):
+    async def pull_registry():
+        try:
+            # Seed/refresh the local registry (and the user index) from the sheet
+            await registry_replicator.pull()
+        except Exception as e:
+            # Keep serving from the local store; the replicator retries the pull.
+            logger.error(f"Failed to pull registry from sheet on startup: {e}", exc_info=True)
+
+    # The registry pull and the names load read the sheet independently
+    await asyncio.gather(pull_registry(), load_professional_names_from_sheet())
+    registry_replicator.start()
+    names_refresher.start()
+    logger.info("Registry store, sheet replicator and professional names loaded.")
+    startup_timings.mark("ready")
+    logger.info(f"Startup timings: {startup_timings.summary()}.")
+
+async def shutdown_task(application: Application):
+    """Flushes pending sheet writes before the bot exits."""
+    if status_server is not None:
+        await status_server.cleanup()
+    await bot_health.stop()
+    if names_refresher is not None:
+        await names_refresher.stop()
+    if registry_replicator is not None:
+        await registry_replicator.stop()
+    if sheet_writer is not None:
+        await sheet_writer.stop()
+        logger.info("Sheet write-behind queue flushed and stopped.")
+    if drive_uploader is not None:
+        await drive_uploader.close()
+    if update_recorder is not None:
+        update_recorder.close()
+    sheet_gateway.shutdown()
+    await apps_script_client.close()
+    if registry_store is not None:
+        registry_store.close()
+
+async def load_professional_names_from_sheet(force=True):
     """
-    Loads all professional IDs and their full names from the provided Google Sheet
-    into the global `professional_names_lookup` dictionary.
+    Refreshes the global `professional_names_lookup` dictionary from the sheet's
+    ID and name columns, changing only the entries that differ. Returns the
+    number of changed entries, or None if the refresh failed.
     """
-    global professional_names_lookup
     logger.info("Loading professional names from Google Sheet...")
-
     try:
-        all_data = worksheet.get_all_values()
+        changed = await names_refresher.refresh(force=force)
+        logger.info(f"✅ Loaded {len(professional_names_lookup)} professional names ({changed} changed).")
+        return changed
+    except Exception as e:
+        logger.error(f"❌ Error loading professional names from sheet: {e}")
+        return None
 
-        if not all_data:
-            logger.warning("No data found in the Professionals sheet.")
-            return
 
-        # Skip header row
-        data_rows = all_data[1:] if len(all_data) > 1 else []
+async def reload_names_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: refresh professional names now instead of waiting for the background refresh."""
+    if names_refresher is None:
+        await update.message.reply_text("Professional names are not available yet. Please try again later.")
+        return
+    changed = await load_professional_names_from_sheet()
+    if changed is None:
+        await update.message.reply_text("❌ Failed to reload professional names. Check the logs.")
+    else:
+        await update.message.reply_text(f"✅ Professional names reloaded: {changed} changed, {len(professional_names_lookup)} total.")
 
-        lookup = {}
-        for row in data_rows:
-            if len(row) > max(PROFESSIONAL_ID_COL_MAIN_SHEET, PROFESSIONAL_NAME_COL_MAIN_SHEET):
-                pro_id = row[PROFESSIONAL_ID_COL_MAIN_SHEET].strip()
-                pro_name = row[PROFESSIONAL_NAME_COL_MAIN_SHEET].strip()
-                if pro_id:  # Only add if professional ID is not empty
-                    lookup[pro_id] = pro_name
 
-        professional_names_lookup = lookup
-        logger.info(f"✅ Loaded {len(professional_names_lookup)} professional names.")
+async def profiling_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin command: profile the running bot for a while and send back a
+    collapsed-stack file (for flamegraph.pl or speedscope) and a summary.
+    Usage: /profiling [stack|cprofile] [seconds]
+    """
+    args = context.args or []
+    mode = args[0].lower() if args else "stack"
+    try:
+        seconds = window_seconds(args[1] if len(args) > 1 else PROFILE_DEFAULT_SECONDS)
+    except ValueError:
+        seconds = None
+    if mode not in PROFILING_MODES or seconds is None:
+        await update.message.reply_text(f"Usage: `/profiling [{'|'.join(PROFILING_MODES)}] [seconds]`", parse_mode='Markdown')
+        return
+    if profiler.busy:
+        await update.message.reply_text("A profiling window is already running; wait for its results.")
+        return
+    await update.message.reply_text(f"Profiling ({mode}) for {seconds:.0f}s... I will send the results when done.")
+    logger.info(f"Admin {update.effective_user.id} started profiling ({mode}, {seconds:.0f}s).")
+    # Runs in the background so the window covers ordinary traffic, not this handler
+    context.application.create_task(run_profiling(update.effective_chat.id, mode, seconds, context), update=update)
+
 
+async def run_profiling(admin_chat_id: int, mode: str, seconds: float, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        collapsed, summary = await profiler.run(mode, seconds)
     except Exception as e:
-        logger.error(f"❌ Error loading professional names from sheet: {e}")
+        logger.error(f"Profiling ({mode}) failed: {e}", exc_info=True)
+        await context.bot.send_message(chat_id=admin_chat_id, text=f"❌ Profiling failed: {e}")
+        return
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    await context.bot.send_document(
+        chat_id=admin_chat_id,
+        document=io.BytesIO(collapsed.encode("utf-8")),
+        filename=f"muya-{mode}-{stamp}.folded",
+        caption=summary[:1000],
+    )
+    await context.bot.send_document(
+        chat_id=admin_chat_id,
+        document=io.BytesIO(summary.encode("utf-8")),
+        filename=f"muya-{mode}-{stamp}-summary.txt",
+    )
 
 
-def main():
-    
-    app = Application.builder().token(DEBO_TOKEN).build()
-    # --- Google Sheets Setup ---
-    # This block needs to be here to initialize gspread and open the sheet
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    GOOGLE_CREDENTIALS_JSON_PATH = os.environ.get("GOOGLE_CREDENTIALS_JSON")
+def build_application(request=None) -> Application:
+    """
+    Builds the Application with all handlers registered; main() decides how it
+    receives updates. `request` replaces the Bot API connection (e.g.
+    fake_services.FakeBotRequest in benchmark.py).
+    """
+    # Conversation states and user_data survive restarts (see conversation_persistence.py)
+    global bot_health, update_recorder
+    startup_timings.mark("imported")
+    builder = Application.builder().token(DEBO_TOKEN).persistence(SQLitePersistence())
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+    bot_health = BotHealth(app)
+    metrics.add_gauge("event_loop_lag_seconds", "Event loop lag at the last check.", lambda: bot_health.loop_lag)
+    metrics.add_gauge("update_queue_depth", "Updates waiting to be processed.", app.update_queue.qsize)
     if not GOOGLE_CREDENTIALS_JSON_PATH:
         raise ValueError("GOOGLE_CREDENTIALS_JSON environment variable not set.")
-    
-    # CORRECTED LINE: Directly use the path from the environment variable
-    creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_JSON_PATH, scope)
-    gc = gspread.authorize(creds)
-    
-    spreadsheet_id = os.environ.get("SPREADSHEET_ID_DEBO")
-    if not spreadsheet_id:
-        raise ValueError("SPREADSHEET_ID_DEBO environment variable not set.")
-    
-    try:
-        # Assuming your main Professionals sheet is named "Sheet1"
-        main_worksheet = gc.open_by_key(spreadsheet_id).worksheet("Sheet1")
-        app.bot_data["main_worksheet"] = main_worksheet # Store worksheet in bot_data for easy access
-        logger.info("Google Sheet 'Sheet1' opened successfully.") # Changed to Sheet1 based on code
-    except Exception as e:
-        logger.error(f"Failed to open Google Sheet 'Sheet1': {e}") # Changed to Sheet1 based on code
-    
-    # IMPORTANT: Also remove the os.remove(temp_creds_file.name) line (around line 1195)
-    # as the temporary file is no longer created.
-    # --- End Google Sheets Setup ---
-
-  
-    # --- End Google Sheets Setup ---
+    # Google Sheets are opened once, in startup_task (see google_connection)
 
     # Register the startup task to load names
     app.post_init = startup_task
@@ -1382,7 +1525,11 @@ def main():
     app.add_handler(ChatMemberHandler(greet_new_user, ChatMemberHandler.MY_CHAT_MEMBER))
     app.add_handler(CommandHandler("start", start))
 
-    app.add_handler(CommandHandler("request_feedback", request_feedback_command, filters=filters.User(os.environ.get("401674551"))))
+    # Bulk feedback: a CSV uploaded by the admin with the caption /broadcast_feedback
+    app.add_handler(MessageHandler(
+        filters.User(ADMIN_USER_ID) & filters.Document.FileExtension("csv") & filters.CaptionRegex(r'^/broadcast_feedback'),
+        broadcast_feedback_command,
+    ))
     app.add_handler(CallbackQueryHandler(handle_initial_feedback_callback, pattern='^feedback_|^followup_'))
     app.add_handler(CallbackQueryHandler(handle_rating_callback, pattern='^rate_'))
     app.add_error_handler(error_handler)
@@ -1400,6 +1547,8 @@ def main():
             EDUCATIONAL_DOCS: [MessageHandler(filters.ATTACHMENT | filters.PHOTO | filters.TEXT, handle_educational_docs)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="register_conv",
+        persistent=True,
     )
 
      # --- Edit Profile Conversation --- (NEW/MODIFIED)
@@ -1418,7 +1567,9 @@ def main():
         ],
          map_to_parent={ # End edit and return to base level
             ConversationHandler.END: ConversationHandler.END
-        }
+        },
+        name="edit_conv",
+        persistent=True,
     )
 
     delete_conv = ConversationHandler(
@@ -1427,6 +1578,8 @@ def main():
             CONFIRM_DELETE: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_delete)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="delete_conv",
+        persistent=True,
     )
 
     comment_conv = ConversationHandler(
@@ -1435,6 +1588,8 @@ def main():
             COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_comment)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="comment_conv",
+        persistent=True,
     )
 
     class FakeContext: # A minimalist context for startup tasks
@@ -1446,7 +1601,16 @@ def main():
     
 
     app.post_init = startup_task # This is the cleanest way in PTB v20+
-    app.add_handler(CommandHandler("reload_names", lambda update, context: load_professional_names_from_sheet(context)))
+    app.post_shutdown = shutdown_task
+    app.add_handler(TypeHandler(Update, bot_health.track_update), group=-1)
+    # Button texts are kept verbatim in recordings so replays follow the same branches
+    update_recorder = recorder_for("Debo_registration", keep_texts=[
+        text for keyboard in (main_menu_keyboard, skip_done_keyboard, yes_no_keyboard) for row in keyboard for text in row
+    ] + ["Skip / አሳልፍ", "skip", "done"])
+    if update_recorder is not None:
+        app.add_handler(TypeHandler(Update, update_recorder.record), group=-2)
+    app.add_handler(CommandHandler("reload_names", reload_names_command, filters=filters.User(ADMIN_USER_ID)))
+    app.add_handler(CommandHandler("profiling", profiling_command, filters=filters.User(ADMIN_USER_ID)))
     app.add_handler(register_conv)
     app.add_handler(edit_conv)
     app.add_handler(delete_conv)
@@ -1456,8 +1620,23 @@ def main():
     app.add_handler(CallbackQueryHandler(handle_rating_callback, pattern='^rate_'))
     app.add_handler(CallbackQueryHandler(handle_initial_feedback_callback, pattern='^feedback_|^followup_')) # <--- ADD THIS LINE
     app.add_error_handler(error_handler) # <--- This line adds the new feature
-    YOUR_ADMIN_TELEGRAM_ID =401674551 # <--- REPLACE WITH YOUR TELEGRAM USER ID
-    app.add_handler(CommandHandler("request_feedback", request_feedback_command, filters=filters.User(401674551))) # <--- ADD THIS LINE
-    app.run_polling()
+    app.add_handler(CommandHandler("request_feedback", request_feedback_command, filters=filters.User(ADMIN_USER_ID)))
+    instrument_application(app)
+    startup_timings.mark("built")
+    return app
+
+
+def main():
+    app = build_application()
+    # Webhook mode: this process serves Telegram updates and the health check
+    # on $PORT. Without WEBHOOK_URL the bot falls back to long polling.
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    if webhook_url:
+        secret_token = os.environ.get("TELEGRAM_WEBHOOK_SECRET") or default_secret_token(DEBO_TOKEN)
+        asyncio.run(run_webhook(app, webhook_url, int(os.environ.get("PORT", "8000")), secret_token,
+                                health=bot_health))
+    else:
+        app.run_polling()
+
 if __name__ == '__main__':
     main()
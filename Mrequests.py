@@ -3,11 +3,20 @@
 import logging
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (Application, CommandHandler, MessageHandler, filters,
-                          ConversationHandler, ContextTypes)
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+                          ConversationHandler, ContextTypes, TypeHandler)
 import re
 from datetime import datetime
+import os
+import time
+import sqlite3
+from registry_store import RegistryStore
+from google_connection import GoogleConnection
+from sheet_replicator import SheetReplicator
+from geo_index import GeoIndex, parse_location
+from profession_search import PROFESSION_SYNONYMS, ProfessionIndex
+from bot_metrics import instrument_application
+from update_recorder import recorder_for
+from webhook_server import start_status_server
 
 # Enable logging
 logging.basicConfig(
@@ -18,18 +27,52 @@ logger = logging.getLogger(__name__)
 # Google Sheets setup
 # Make sure you have your service account key file named 'service_account_key.json'
 # in the same directory as your script, or provide the correct path.
-# Replace 'YOUR_SERVICE_ACCOUNT_FILE.json' with the actual name of your JSON key file
-try:
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    # Replace 'YOUR_SERVICE_ACCOUNT_FILE.json' with the actual name of your JSON key file
-    creds = ServiceAccountCredentials.from_json_keyfile_name("debo-registration-ad20d23ce5bd.json", scope)
-    client = gspread.authorize(creds)
+# The connection is made in the background once the bot is running (see
+# google_connection.py), so conversations start even while Google is unreachable.
+GOOGLE_CREDENTIALS_PATH = os.environ.get("MREQUESTS_CREDENTIALS_JSON", "debo-registration-ad20d23ce5bd.json")
+google_connection = GoogleConnection("Mrequests", GOOGLE_CREDENTIALS_PATH)
+
+# Registered professionals (Debo_registration's sheet), mirrored read-only for "Near Me" matching
+PROFESSIONALS_SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID_DEBO", "16l_rYpXX1hrEUNS9DOCU2naCij-U635unpD12WDDggA")
+
+def open_requests_sheet(client):
     # Replace 'requests' with the exact name of your Google Sheet
-    sheet = client.open("Requests").sheet1
-    logger.info("Successfully connected to Google Sheet 'Requests'")
-except Exception as e:
-    logger.error(f"Error connecting to Google Sheet: {e}")
-    sheet = None # Handle the case where sheet connection fails
+    return client.open("Requests").sheet1
+
+def open_professionals_sheet(client):
+    return client.open_by_key(PROFESSIONALS_SPREADSHEET_ID).worksheet("Sheet1")
+
+async def on_requests_sheet_open(worksheet):
+    """Starts replicating the requests saved so far (and from now on) to the sheet."""
+    request_replicator.requests_worksheet = worksheet
+    request_replicator.notify()
+
+async def on_professionals_sheet_open(worksheet):
+    request_replicator.worksheet = worksheet
+    await request_replicator.pull()
+
+google_connection.add_worksheet("Requests", open_requests_sheet, on_requests_sheet_open)
+google_connection.add_worksheet("Professionals", open_professionals_sheet, on_professionals_sheet_open)
+
+# Local SQLite store; every submission is saved here first and replicated to
+# the 'Requests' sheet in the background by request_replicator, which also
+# pulls the professionals sheet into it.
+request_store = RegistryStore(os.environ.get("REQUESTS_DB_PATH", "muya_requests.db"))
+request_replicator = None
+
+# Local port serving /health and /metrics (handler and Sheets call metrics)
+MREQUESTS_STATUS_PORT = int(os.environ.get("MREQUESTS_STATUS_PORT", "8082"))
+status_server = None
+# Anonymized copy of every incoming update for replay.py (only when RECORD_UPDATES_DIR is set).
+update_recorder = None
+
+# Nearest located professionals per profession, and fuzzy Amharic/English
+# profession search; both kept current by every pull
+professional_geo_index = GeoIndex()
+request_store.add_listener(professional_geo_index.update_from_record)
+profession_index = ProfessionIndex()
+request_store.add_listener(profession_index.update_from_record)
+NEAR_ME_MAX_MATCHES = int(os.environ.get("NEAR_ME_MAX_MATCHES", "50"))
 
 # States for conversation
 (REQUEST_PROFESSIONAL_FULL_NAME, REQUEST_PROFESSIONAL_PHONE, REQUEST_PROFESSIONAL_TYPE,
@@ -76,19 +119,78 @@ def is_valid_phone_number(phone_number: str) -> bool:
         return True
     return False
 
-# Helper function to save data to Google Sheet
-def save_request_data(data):
-    if sheet is None:
-        logger.error("Google Sheet connection failed, cannot save data.")
-        return False
+# Helper function to save data (replicated to the Google Sheet in the background)
+async def save_request_data(data):
     try:
-        sheet.append_row(data)
-        logger.info("Data successfully appended to Google Sheet.")
+        request_id = request_store.add_request(data)
+        logger.info(f"Request {request_id} saved locally; queued for Google Sheet replication.")
+        if request_replicator is not None:
+            request_replicator.notify()
         return True
-    except Exception as e:
-        logger.error(f"Error appending data to Google Sheet: {e}")
+    except sqlite3.Error as e:
+        logger.error(f"Error saving request data: {e}")
         return False
 
+def find_nearby_professionals(professional_type, requester_location, count):
+    """
+    Returns [(user_id, distance_km)] of the `count` registered professionals
+    whose profession matches professional_type (fuzzy, Amharic or English)
+    closest to requester_location ("lat, lon"), closest first.
+    """
+    location = parse_location(requester_location)
+    if location is None:
+        return []
+    started = time.perf_counter()
+    professions = [profession for profession, _ in profession_index.search(professional_type)]
+    matches = professional_geo_index.nearest(location[0], location[1], count, professions=professions)
+    logger.info(f"Near Me: {len(matches)} '{professional_type}' match(es) in {professions} for {requester_location} "
+                f"in {(time.perf_counter() - started) * 1000:.2f} ms.")
+    return matches
+
+def find_matching_professionals(professional_type, count):
+    """Returns [(user_id, score)] of up to `count` professionals whose profession best matches professional_type."""
+    started = time.perf_counter()
+    matches = profession_index.professionals(professional_type, limit=count)
+    logger.info(f"Anywhere: {len(matches)} '{professional_type}' match(es) "
+                f"in {(time.perf_counter() - started) * 1000:.2f} ms.")
+    return matches
+
+def parse_professional_count(count_text) -> int:
+    """Maps the count keyboard ("3", "5", "10", "20", "More than 20") to a number of matches."""
+    count_text = str(count_text).strip()
+    if count_text.isdigit():
+        return min(int(count_text), NEAR_ME_MAX_MATCHES)
+    return NEAR_ME_MAX_MATCHES
+
+async def post_init(application: Application):
+    """
+    Loads the professionals mirror from the local store and starts connecting
+    to Google Sheets in the background; each sheet is handed to the replicator
+    as soon as it opens, and requests are kept locally until then.
+    """
+    global request_replicator, status_server
+    try:
+        status_server = await start_status_server(google_connection, MREQUESTS_STATUS_PORT)
+    except OSError as e:
+        logger.error(f"Could not start the status server on port {MREQUESTS_STATUS_PORT}: {e}")
+    records = request_store.all_records()
+    professional_geo_index.load(records)
+    profession_index.load(records)
+    request_replicator = SheetReplicator(request_store)
+    request_replicator.start()
+    google_connection.start()
+
+async def post_shutdown(application: Application):
+    """Pushes any requests that are still pending before exiting."""
+    if status_server is not None:
+        await status_server.cleanup()
+    await google_connection.stop()
+    if request_replicator is not None:
+        await request_replicator.stop()
+    if update_recorder is not None:
+        update_recorder.close()
+    request_store.close()
+
 # Handlers for REQUEST PROFESSIONAL flow
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -220,7 +322,20 @@ async def get_professional_count(update: Update, context: ContextTypes.DEFAULT_T
         request_timestamp # Add the timestamp here
     ]
 
-    if save_request_data(data_row):
+    # Matched professionals for staff follow-up: closest first for "Near Me",
+    # best profession match first otherwise
+    if context.user_data.get('professional_filter') == "Near Me":
+        matches = find_nearby_professionals(
+            context.user_data.get('professional_type', ''),
+            context.user_data.get('requester_location', ''),
+            parse_professional_count(count),
+        )
+        data_row.append(", ".join(f"{user_id} ({distance:.1f} km)" for user_id, distance in matches))
+    else:
+        matches = find_matching_professionals(context.user_data.get('professional_type', ''), parse_professional_count(count))
+        data_row.append(", ".join(str(user_id) for user_id, _ in matches))
+
+    if await save_request_data(data_row):
         await update.message.reply_text(
             "Thank you! Your request has been submitted. We will get back to you shortly.\nአመሰግናለሁ! ጥያቄዎ ገብቷል. በቅርቡ ምላሽ እንሰጥዎታለን።",
             reply_markup=main_menu_markup
@@ -263,7 +378,7 @@ async def save_complaint_comment(update: Update, context: ContextTypes.DEFAULT_T
         comment_timestamp # Add the timestamp here as well
     ]
 
-    if save_request_data(data_row):
+    if await save_request_data(data_row):
         await update.message.reply_text(
             "Thank you! Your complaint or comment has been submitted.\nአመሰግናለሁ! ቅሬታዎ ወይም አስተያየትዎ ገብቷል።",
             reply_markup=main_menu_markup
@@ -287,9 +402,27 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
     return ConversationHandler.END
 
-def main():
+def build_application(request=None) -> Application:
+    """
+    Builds the Application with all handlers registered. `request` replaces
+    the Bot API connection (e.g. fake_services.FakeBotRequest in benchmark.py).
+    """
+    global update_recorder
     # Replace with your new bot token
-    application = Application.builder().token("TELEGRAM_BOT_TOKEN").build()
+    builder = Application.builder().token("TELEGRAM_BOT_TOKEN")
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    application.post_init = post_init
+    application.post_shutdown = post_shutdown
+
+    # Button texts and profession names are kept verbatim in recordings so replays match the same way
+    update_recorder = recorder_for("Mrequests", keep_texts=[
+        text for keyboard in (main_menu_keyboard, professional_filter_keyboard, professional_count_keyboard)
+        for row in keyboard for text in row
+    ] + [term for group in PROFESSION_SYNONYMS for term in group])
+    if update_recorder is not None:
+        application.add_handler(TypeHandler(Update, update_recorder.record), group=-1)
 
     # Handler for the /start command
     application.add_handler(CommandHandler("start", start))
@@ -323,8 +456,12 @@ def main():
 
     # Add a handler for any other text that is not part of a conversation, to show the main menu
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, start))
+    instrument_application(application)
+    return application
 
 
+def main():
+    application = build_application()
     application.run_polling()
 
 if __name__ == '__main__':
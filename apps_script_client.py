@@ -0,0 +1,101 @@
+# apps_script_client.py
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+from bot_metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+APPS_SCRIPT_MAX_CONCURRENCY = int(os.environ.get("APPS_SCRIPT_MAX_CONCURRENCY", "8"))
+APPS_SCRIPT_TIMEOUT = float(os.environ.get("APPS_SCRIPT_TIMEOUT", "15"))
+APPS_SCRIPT_MAX_RETRIES = int(os.environ.get("APPS_SCRIPT_MAX_RETRIES", "3"))
+APPS_SCRIPT_BACKOFF_BASE = float(os.environ.get("APPS_SCRIPT_BACKOFF_BASE", "0.5"))
+APPS_SCRIPT_BACKOFF_MAX = float(os.environ.get("APPS_SCRIPT_BACKOFF_MAX", "8"))
+
+
+class AppsScriptError(Exception):
+    """Raised when the Apps Script web app cannot be reached or keeps failing."""
+
+
+def _is_retryable(status_code: int) -> bool:
+    return status_code == 429 or 500 <= status_code < 600
+
+
+# Transport errors raised before the request was sent, so retrying cannot
+# record a rating twice. A read timeout or dropped connection may come after
+# Apps Script already handled the POST, so those are not retried.
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class AppsScriptClient:
+    """
+    Async JSON client for an Apps Script web app.
+
+    One httpx.AsyncClient is kept for the life of the bot so connections to
+    script.google.com (and the googleusercontent.com redirect target) are reused.
+    At most `max_concurrency` requests are in flight; 429/5xx responses and
+    connection failures are retried with full-jitter exponential backoff,
+    honouring a Retry-After header when Apps Script sends one. Backoff sleeps
+    do not hold a concurrency slot.
+    """
+
+    def __init__(self, url, max_concurrency=APPS_SCRIPT_MAX_CONCURRENCY, timeout=APPS_SCRIPT_TIMEOUT,
+                 max_retries=APPS_SCRIPT_MAX_RETRIES):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,  # Apps Script answers with a 302 to googleusercontent.com
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def post_json(self, payload: dict) -> dict:
+        """POSTs payload as JSON and returns the decoded JSON response."""
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    with external_call("apps_script", "post") as call:
+                        response = await client.post(self.url, json=payload)
+                        call.status = response.status_code
+                if not _is_retryable(response.status_code):
+                    response.raise_for_status()
+                    return response.json()
+                error = AppsScriptError(f"Apps Script returned HTTP {response.status_code}")
+                retry_after = response.headers.get("Retry-After")
+            except _UNSENT_ERRORS as e:
+                error = AppsScriptError(f"Could not connect to Apps Script: {e}")
+            except httpx.TransportError as e:
+                raise AppsScriptError(f"Network error talking to Apps Script: {e}") from e
+            except httpx.HTTPStatusError as e:
+                raise AppsScriptError(f"Apps Script returned HTTP {e.response.status_code}") from e
+            except ValueError as e:
+                raise AppsScriptError(f"Apps Script returned invalid JSON: {e}") from e
+
+            if attempt == self.max_retries:
+                raise error
+            delay = random.uniform(0, min(APPS_SCRIPT_BACKOFF_MAX, APPS_SCRIPT_BACKOFF_BASE * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            logger.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,405 @@
+# benchmark.py
+#
+# Drives the real bots' conversation flows for N concurrent simulated users
+# through Application.process_update, with Google Sheets, Drive and the
+# Telegram Bot API replaced by the in-memory stand-ins in fake_services.py.
+# Reports updates/sec, per-step latency percentiles and external-call counts,
+# optionally saved as JSON (--json) and compared with an earlier run
+# (--compare).
+#
+#   python benchmark.py --users 50 --flows register,edit,request
+#   python benchmark.py --users 200 --sheets-latency 0.2 --json after.json --compare before.json
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+FLOWS = ("register", "edit", "request")
+BENCH_SPREADSHEET_ID = "16l_rYpXX1hrEUNS9DOCU2naCij-U635unpD12WDDggA"
+# Seeded professionals get IDs from here (see FakeBackend.seed_professionals);
+# simulated registrants and requesters use their own ranges.
+SEEDED_USER_ID = 9_000_000_000
+REGISTER_USER_ID = 1_000_000
+REQUEST_USER_ID = 2_000_000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bots' flows against local fakes.")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users per flow")
+    parser.add_argument("--flows", default=",".join(FLOWS), help=f"comma-separated subset of {', '.join(FLOWS)}")
+    parser.add_argument("--files", type=int, default=1, help="documents uploaded per registration")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a user waits between steps")
+    add_fake_arguments(parser)
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+    args.flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = set(args.flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flow(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def add_fake_arguments(parser):
+    """Options for the fake services; shared with replay.py."""
+    parser.add_argument("--seed-professionals", type=int, default=2000, help="professionals in the fake sheet")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="seconds per Sheets request")
+    parser.add_argument("--sheets-jitter", type=float, default=0.0, help="extra random Sheets latency (max)")
+    parser.add_argument("--drive-latency", type=float, default=0.2, help="seconds per Drive upload")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="seconds per Bot API call")
+    parser.add_argument("--reads-per-minute", type=int, default=None, help="Sheets read quota (429 beyond it)")
+    parser.add_argument("--writes-per-minute", type=int, default=None, help="Sheets write quota (429 beyond it)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for locations and latency jitter")
+    parser.add_argument("--log-level", default="WARNING", help="log level while the bots run")
+
+
+def install_fakes(args):
+    """Creates the fake backend from the add_fake_arguments options, patches it in and seeds the sheet."""
+    from fake_services import FakeBackend
+    from profession_search import PROFESSION_SYNONYMS
+
+    backend = FakeBackend(
+        sheets_latency=args.sheets_latency, sheets_jitter=args.sheets_jitter,
+        reads_per_minute=args.reads_per_minute, writes_per_minute=args.writes_per_minute,
+        drive_latency=args.drive_latency, seed=args.seed,
+    ).install()
+    professions = [group[0] for group in PROFESSION_SYNONYMS]
+    backend.seed_professionals(BENCH_SPREADSHEET_ID, args.seed_professionals, professions)
+    return backend
+
+
+@contextlib.contextmanager
+def isolated_environment():
+    """
+    Runs the block in a throwaway working directory with configure_environment
+    applied and the bots' import-time prints swallowed. Yields the directory.
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix="muya-bench-") as workdir:
+        configure_environment(workdir)
+        previous_cwd = os.getcwd()
+        os.chdir(workdir)  # keeps log.txt-style side files out of the repo
+        if repo_dir not in sys.path:
+            sys.path.insert(0, repo_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield workdir
+        finally:
+            os.chdir(previous_cwd)
+
+
+def configure_environment(workdir):
+    """Points both bots at throwaway local state. Must run before they are imported."""
+    defaults = {
+        "TELEGRAM_BOT_TOKEN_DEBO": "123456:benchmark",
+        "GOOGLE_CREDENTIALS_JSON": "benchmark-credentials.json",
+        "SPREADSHEET_ID_DEBO": BENCH_SPREADSHEET_ID,
+        "REGISTRY_DB_PATH": os.path.join(workdir, "registry.db"),
+        "CONVERSATION_DB_PATH": os.path.join(workdir, "conversations.db"),
+        "REQUESTS_DB_PATH": os.path.join(workdir, "requests.db"),
+        "SUPERVISOR_STATUS_FILE": os.path.join(workdir, "supervisor_status.json"),
+        "HEALTH_INTERNAL_PORT": "0",
+        "MREQUESTS_STATUS_PORT": "0",
+    }
+    for name, value in defaults.items():
+        os.environ[name] = value
+    os.environ.pop("WEBHOOK_URL", None)
+
+
+# --- Simulated updates ----------------------------------------------------------
+
+
+class UpdateFactory:
+    """Builds Update objects the way Telegram would send them for one bot."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id, **fields):
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id)}
+        message.update(fields)
+        return message
+
+    def _update(self, **fields):
+        from telegram import Update
+        return Update.de_json({"update_id": next(self._update_ids), **fields}, self.bot)
+
+    def text(self, user_id, text):
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._update(message=self._message(user_id, **fields))
+
+    def location(self, user_id, latitude, longitude):
+        return self._update(message=self._message(user_id, location={"latitude": latitude, "longitude": longitude}))
+
+    def document(self, user_id, file_name):
+        file_id = f"doc-{user_id}-{next(self._message_ids)}"
+        document = {"file_id": file_id, "file_unique_id": f"u{file_id}", "file_name": file_name,
+                    "mime_type": "application/pdf", "file_size": 100_000}
+        return self._update(message=self._message(user_id, document=document))
+
+    def callback(self, user_id, data):
+        query = {"id": str(next(self._update_ids)), "from": self._user(user_id), "chat_instance": str(user_id),
+                 "data": data, "message": self._message(user_id, text="menu")}
+        return self._update(callback_query=query)
+
+
+def register_steps(factory, user_id, files, location):
+    steps = [
+        ("/register", factory.text(user_id, "/register")),
+        ("full_name", factory.text(user_id, f"Benchmark User {user_id}")),
+        ("profession", factory.text(user_id, "plumber")),
+        ("phone", factory.text(user_id, "0912345678")),
+        ("location", factory.location(user_id, *location)),
+        ("region", factory.text(user_id, "Addis Ababa, Bole, 03")),
+    ]
+    for i in range(files):
+        steps.append(("testimonial_file", factory.document(user_id, f"testimonial{i}.pdf")))
+    steps.append(("testimonials_done", factory.text(user_id, "Done ጨርሻያለው✅ ")))
+    for i in range(files):
+        steps.append(("education_file", factory.document(user_id, f"education{i}.pdf")))
+    steps.append(("education_skip", factory.text(user_id, "Skip እለፍ⏭️")))
+    return steps
+
+
+def edit_steps(factory, user_id, new_phone):
+    return [
+        ("/editprofile", factory.text(user_id, "/editprofile")),
+        ("choose_phone", factory.callback(user_id, "edit_phone")),
+        ("new_phone", factory.text(user_id, new_phone)),
+    ]
+
+
+def request_steps(factory, user_id, profession, near_me, location):
+    steps = [
+        ("request", factory.text(user_id, "REQUEST PROFESSIONAL | ባለሙያ ይጠይቁ")),
+        ("full_name", factory.text(user_id, f"Requester {user_id}")),
+        ("phone", factory.text(user_id, "0911223344")),
+        ("profession", factory.text(user_id, profession)),
+    ]
+    if near_me:
+        steps.append(("near_me", factory.text(user_id, "Near Me | ባቅራብያዬ")))
+        steps.append(("location", factory.location(user_id, *location)))
+    else:
+        steps.append(("anywhere", factory.text(user_id, "Anywhere | የትም ቦታ")))
+    steps.append(("address", factory.text(user_id, "Addis Ababa, Bole, 03")))
+    steps.append(("count", factory.text(user_id, "5")))
+    return steps
+
+
+# --- Running --------------------------------------------------------------------
+
+
+@contextlib.asynccontextmanager
+async def running(application):
+    """The run_polling/run_webhook lifecycle, without a source of updates."""
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            yield application
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def run_user(application, steps, latencies, think_time):
+    for step, update in steps:
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies.setdefault(step, []).append(time.perf_counter() - started)
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_flow(name, application, users_steps, think_time, backend, telegram):
+    """Runs every user's steps concurrently; returns the flow's results."""
+    from bot_metrics import metrics
+
+    latencies = {}
+    calls_before = backend.calls.copy() + telegram.calls.copy()
+    handlers_before = metrics.handler_requests.values()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(application, steps, latencies, think_time) for steps in users_steps))
+    elapsed = time.perf_counter() - started
+
+    calls = (backend.calls.copy() + telegram.calls.copy()) - calls_before
+    handler_errors = sum(count - handlers_before.get(labels, 0)
+                         for labels, count in metrics.handler_requests.values().items() if labels[1] == "error")
+    updates = sum(len(steps) for steps in users_steps)
+    return {
+        "flow": name,
+        "users": len(users_steps),
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(updates / elapsed, 1) if elapsed else None,
+        "handler_errors": handler_errors,
+        "steps": {step: latency_summary(samples) for step, samples in latencies.items()},
+        "external_calls": dict(sorted(calls.items())),
+    }
+
+
+def latency_summary(samples):
+    from bot_health import percentile
+
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def benchmark_debo(args, backend, flows, locations):
+    import Debo_registration
+    from fake_services import FakeBotRequest
+
+    calls_before = backend.calls.copy()  # build_application and startup talk to Sheets too
+    telegram = FakeBotRequest(latency=args.telegram_latency)
+    application = Debo_registration.build_application(request=telegram)
+    results = []
+    async with running(application):
+        factory = UpdateFactory(application.bot)
+        if "register" in flows:
+            users = [REGISTER_USER_ID + i for i in range(args.users)]
+            steps = [register_steps(factory, uid, args.files, next(locations)) for uid in users]
+            result = await run_flow("register", application, steps, args.think_time, backend, telegram)
+            result["completed"] = sum(Debo_registration.registry_store.get(uid) is not None for uid in users)
+            results.append(result)
+        if "edit" in flows:
+            users = [SEEDED_USER_ID + i for i in range(min(args.users, args.seed_professionals))]
+            phones = {uid: f"0977{uid % 1_000_000:06d}" for uid in users}
+            steps = [edit_steps(factory, uid, phones[uid]) for uid in users]
+            result = await run_flow("edit", application, steps, args.think_time, backend, telegram)
+            result["completed"] = sum((Debo_registration.registry_store.get(uid) or {}).get("PHONE") == phones[uid]
+                                      for uid in users)
+            results.append(result)
+    # Everything the bot sent to Sheets and Drive, including the final flush on shutdown
+    sheet_rows = len(backend.spreadsheet(key=BENCH_SPREADSHEET_ID).worksheet("Sheet1").rows) - 1
+    return results, {"bot": "Debo_registration", "sheet_rows": sheet_rows,
+                     "external_calls": dict(sorted((backend.calls - calls_before + telegram.calls).items()))}
+
+
+async def benchmark_mrequests(args, backend, locations):
+    from fake_services import FakeBotRequest
+    from profession_search import PROFESSION_SYNONYMS
+
+    calls_before = backend.calls.copy()
+    import Mrequests
+    telegram = FakeBotRequest(latency=args.telegram_latency)
+    application = Mrequests.build_application(request=telegram)
+    async with running(application):
+        # The sheets open in the background; start once the professionals mirror is pulled
+        await Mrequests.google_connection.wait_connected()
+        factory = UpdateFactory(application.bot)
+        steps = [request_steps(factory, REQUEST_USER_ID + i, PROFESSION_SYNONYMS[i % len(PROFESSION_SYNONYMS)][0],
+                               near_me=i % 2 == 0, location=next(locations))
+                 for i in range(args.users)]
+        result = await run_flow("request", application, steps, args.think_time, backend, telegram)
+    requests_sheet = backend.spreadsheet(title="Requests").sheet1
+    result["completed"] = sum(1 for row in requests_sheet.rows
+                              if len(row) > 8 and row[8].isdigit() and int(row[8]) >= REQUEST_USER_ID)
+    return [result], {"bot": "Mrequests", "sheet_rows": len(requests_sheet.rows),
+                      "external_calls": dict(sorted((backend.calls - calls_before + telegram.calls).items()))}
+
+
+async def benchmark(args):
+    backend = install_fakes(args)
+    locations = ((9.0108 + backend.random.uniform(-0.1, 0.1), 38.7613 + backend.random.uniform(-0.1, 0.1))
+                 for _ in itertools.count())
+
+    flows, bots = [], []
+    debo_flows = [flow for flow in args.flows if flow in ("register", "edit")]
+    if debo_flows:
+        results, totals = await benchmark_debo(args, backend, debo_flows, locations)
+        flows.extend(results)
+        bots.append(totals)
+    if "request" in args.flows:
+        results, totals = await benchmark_mrequests(args, backend, locations)
+        flows.extend(results)
+        bots.append(totals)
+    return {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {name: value for name, value in vars(args).items() if name not in ("json_path", "compare")},
+        "flows": flows,
+        "bots": bots,
+    }
+
+
+# --- Reporting ------------------------------------------------------------------
+
+
+def _delta(now, before):
+    if now is None or before is None:
+        return ""
+    if before == 0:
+        return f" ({now - before:+g})"
+    return f" ({(now - before) / before * 100:+.0f}%)"
+
+
+def print_report(results, baseline=None, out=sys.stdout):
+    base_flows = {flow["flow"]: flow for flow in (baseline or {}).get("flows", [])}
+    for flow in results["flows"]:
+        base = base_flows.get(flow["flow"], {})
+        print(f"\n== {flow['flow']}: {flow['users']} users, {flow['updates']} updates in {flow['seconds']}s "
+              f"= {flow['updates_per_second']} updates/s{_delta(flow['updates_per_second'], base.get('updates_per_second'))}",
+              file=out)
+        print(f"   completed {flow.get('completed')}/{flow['users']}, handler errors {flow['handler_errors']}", file=out)
+        print(f"   {'step':<20}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+        for step, summary in flow["steps"].items():
+            base_p50 = base.get("steps", {}).get(step, {}).get("p50_ms")
+            print(f"   {step:<20}{summary['count']:>7}{summary['p50_ms']:>10}{summary['p90_ms']:>10}"
+                  f"{summary['p99_ms']:>10}{summary['max_ms']:>10}{_delta(summary['p50_ms'], base_p50)}", file=out)
+        calls = ", ".join(f"{name}={count}{_delta(count, base.get('external_calls', {}).get(name))}"
+                          for name, count in flow["external_calls"].items())
+        print(f"   calls during flow: {calls or 'none'}", file=out)
+    base_bots = {bot["bot"]: bot for bot in (baseline or {}).get("bots", [])}
+    for bot in results["bots"]:
+        base = base_bots.get(bot["bot"], {})
+        calls = ", ".join(f"{name}={count}{_delta(count, base.get('external_calls', {}).get(name))}"
+                          for name, count in bot["external_calls"].items())
+        print(f"\n== {bot['bot']} startup to shutdown: {bot['sheet_rows']} sheet rows; calls: {calls}", file=out)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    with isolated_environment():
+        import Debo_registration  # noqa: F401 (imported first so its logging setup wins)
+        logging.getLogger().setLevel(args.log_level.upper())
+        results = asyncio.run(benchmark(args))
+    print_report(results, baseline)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
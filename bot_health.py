@@ -0,0 +1,190 @@
+# bot_health.py
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Recent external-call durations kept per kind for the p50/p99 figures.
+HEALTH_LATENCY_WINDOW = int(os.environ.get("HEALTH_LATENCY_WINDOW", "500"))
+HEALTH_LOOP_LAG_INTERVAL = float(os.environ.get("HEALTH_LOOP_LAG_INTERVAL", "0.5"))
+# The bot reports itself degraded (HTTP 503) past either limit.
+HEALTH_MAX_LOOP_LAG = float(os.environ.get("HEALTH_MAX_LOOP_LAG", "2.0"))
+HEALTH_MAX_QUEUE_DEPTH = int(os.environ.get("HEALTH_MAX_QUEUE_DEPTH", "100"))
+# Written by the supervisor in entrypoint.py: restart counts and child uptimes.
+SUPERVISOR_STATUS_FILE = os.environ.get("SUPERVISOR_STATUS_FILE", "supervisor_status.json")
+
+
+def read_supervisor_status(path=SUPERVISOR_STATUS_FILE):
+    """The supervisor's restart counts and uptimes, or None when not running under entrypoint.py."""
+    try:
+        with open(path) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    now = time.time()
+    status["uptime_seconds"] = round(now - status.get("started_at", now), 1)
+    for child in status.get("children", {}).values():
+        if child.get("state") == "running" and child.get("started_at"):
+            child["uptime_seconds"] = round(now - child["started_at"], 1)
+    return status
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+class LatencyTracker:
+    """Sliding window of call durations per kind ("sheets", "drive", "apps_script", ...)."""
+
+    def __init__(self, window=HEALTH_LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}  # kind -> deque of seconds
+
+    def record(self, kind, seconds):
+        samples = self._samples.get(kind)
+        if samples is None:
+            samples = self._samples[kind] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def summary(self) -> dict:
+        result = {}
+        for kind, samples in self._samples.items():
+            ordered = sorted(samples)
+            result[kind] = {
+                "count": len(ordered),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return result
+
+
+# Fed by bot_metrics.external_call (Sheets, Drive and Apps Script calls).
+call_latency = LatencyTracker()
+
+
+def _process_started_at() -> float:
+    try:
+        return psutil.Process().create_time()
+    except psutil.Error:
+        return time.time()
+
+
+class StartupTimings:
+    """
+    Cold-start milestones in seconds since the process was created (so
+    interpreter start-up and imports are counted too). mark(name) records a
+    milestone once; BotHealth marks "first_update" and logs the whole report
+    when the first update has been handled.
+    """
+
+    def __init__(self):
+        self.process_started_at = _process_started_at()
+        self.marks = {}
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.time() - self.process_started_at
+
+    def report(self) -> dict:
+        return {name: round(seconds, 3) for name, seconds in self.marks.items()}
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.marks.items())
+
+
+# Marked by the bot's build and startup steps.
+startup_timings = StartupTimings()
+
+
+class BotHealth:
+    """
+    Liveness and performance signals of a running bot.
+
+    - event-loop lag: a background task sleeps HEALTH_LOOP_LAG_INTERVAL and
+      measures how late it wakes up (a blocking call on the loop shows here);
+    - time since the last update, via track_update registered as a TypeHandler;
+    - pending depth of the application's update queue;
+    - p50/p99 of recent Sheets, Drive and Apps Script calls (call_latency);
+    - cold-start milestones up to the first update (startup_timings);
+    - restart counts and uptimes from the entrypoint.py supervisor, if any.
+
+    snapshot() returns (healthy, report); healthy is False when the loop lag or
+    the queue depth is past HEALTH_MAX_LOOP_LAG / HEALTH_MAX_QUEUE_DEPTH.
+    """
+
+    def __init__(self, application=None, latency=call_latency, interval=HEALTH_LOOP_LAG_INTERVAL,
+                 startup=startup_timings):
+        self.application = application
+        self.latency = latency
+        self.startup = startup
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.last_update_at = None
+        self.updates_seen = 0
+        self.loop_lag = 0.0
+        self._recent_lags = deque(maxlen=max(1, int(60 / interval)))  # about the last minute
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._measure_loop_lag(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def track_update(self, update, context):
+        self.last_update_at = time.monotonic()
+        self.updates_seen += 1
+        if self.updates_seen == 1:
+            self.startup.mark("first_update")
+            logger.info(f"Startup timings: {self.startup.summary()}.")
+
+    async def _measure_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.loop_lag = max(0.0, loop.time() - expected)
+            self._recent_lags.append(self.loop_lag)
+
+    def snapshot(self):
+        now = time.monotonic()
+        queue_depth = self.application.update_queue.qsize() if self.application is not None else 0
+        max_recent_lag = max(self._recent_lags, default=0.0)
+        problems = []
+        if self._task is None or self._task.done():
+            problems.append("loop lag monitor not running")
+        if self.loop_lag > HEALTH_MAX_LOOP_LAG:
+            problems.append(f"event loop lag {self.loop_lag:.2f}s")
+        if queue_depth > HEALTH_MAX_QUEUE_DEPTH:
+            problems.append(f"{queue_depth} updates pending")
+        report = {
+            "status": "degraded" if problems else "ok",
+            "problems": problems,
+            "uptime_seconds": round(now - self.started_at, 1),
+            "event_loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "event_loop_lag_max_1m_ms": round(max_recent_lag * 1000, 1),
+            "seconds_since_last_update": round(now - self.last_update_at, 1) if self.last_update_at else None,
+            "updates_seen": self.updates_seen,
+            "update_queue_depth": queue_depth,
+            "external_calls": self.latency.summary(),
+            "startup_seconds": self.startup.report(),
+        }
+        supervisor = read_supervisor_status()
+        if supervisor is not None:
+            report["supervisor"] = supervisor
+        return not problems, report
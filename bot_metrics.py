@@ -0,0 +1,259 @@
+# bot_metrics.py
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from bot_health import call_latency
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "muya")
+# Histogram upper bounds in seconds (+Inf is implicit).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}  # label values tuple -> count
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self) -> dict:
+        """{label values tuple: count}, a copy."""
+        return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values tuple -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {count}")
+        return lines
+
+
+class Gauge:
+    """A value read from a callable at scrape time."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Could not read gauge {self.name}: {e}")
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {_number(value)}"]
+
+
+class BotMetrics:
+    """
+    Handler and external-call metrics in the Prometheus text exposition format.
+
+    Everything is updated from the event loop thread (handler wrappers and the
+    awaiting side of executor calls), so recording is a couple of dict updates
+    with no locking; the text is only built when /metrics is scraped.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.handler_requests = Counter(
+            f"{prefix}_handler_requests_total", "Handler callback invocations.", ("handler", "outcome"))
+        self.handler_duration = Histogram(
+            f"{prefix}_handler_duration_seconds", "Handler callback duration.", ("handler",))
+        self.external_calls = Counter(
+            f"{prefix}_external_calls_total",
+            "Calls to Google Sheets, Drive and Apps Script by outcome (ok, error, rate_limited).",
+            ("target", "method", "outcome"))
+        self.external_duration = Histogram(
+            f"{prefix}_external_call_duration_seconds", "External call duration.", ("target", "method"))
+        self._gauges = []
+        self._span_listeners = []
+
+    def add_span_listener(self, listener):
+        """Calls listener(kind, name, seconds, outcome) per handler run (kind "handler") and external call (kind = target)."""
+        self._span_listeners.append(listener)
+
+    def remove_span_listener(self, listener):
+        if listener in self._span_listeners:
+            self._span_listeners.remove(listener)
+
+    def add_gauge(self, name, help_text, read):
+        """Exposes read() as the gauge {prefix}_{name}."""
+        self._gauges.append(Gauge(f"{self.prefix}_{name}", help_text, read))
+
+    def observe_handler(self, handler, seconds, outcome):
+        self.handler_requests.inc(handler, outcome)
+        self.handler_duration.observe(seconds, handler)
+        for listener in self._span_listeners:
+            listener("handler", handler, seconds, outcome)
+
+    def observe_call(self, target, method, seconds, outcome):
+        self.external_calls.inc(target, method, outcome)
+        self.external_duration.observe(seconds, target, method)
+        for listener in self._span_listeners:
+            listener(target, method, seconds, outcome)
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.handler_requests, self.handler_duration,
+                       self.external_calls, self.external_duration, *self._gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Shared by both bots' handlers, sheet_gateway, drive_uploader and apps_script_client.
+metrics = BotMetrics()
+
+
+def status_of(error):
+    """HTTP status carried by a gspread/httpx/googleapiclient error, if any."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "resp", None), "status", None)  # googleapiclient HttpError
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _outcome(status):
+    if status == 429:
+        return "rate_limited"
+    if status is not None and status >= 400:
+        return "error"
+    return "ok"
+
+
+class _CallStatus:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def external_call(target, method):
+    """
+    Times the with-block as one call to target. Exceptions count as errors
+    (rate_limited when they carry HTTP 429); a caller that gets a response
+    instead of an exception sets `.status` on the yielded object.
+    """
+    call = _CallStatus()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield call
+        outcome = _outcome(call.status)
+    except Exception as e:
+        outcome = "rate_limited" if status_of(e) == 429 else "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe_call(target, method, elapsed, outcome)
+        call_latency.record(target, elapsed)
+
+
+def _timed_callback(callback, name):
+    @functools.wraps(callback)
+    async def timed(update, context):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await callback(update, context)
+            outcome = "ok"
+            return result
+        finally:
+            metrics.observe_handler(name, time.perf_counter() - started, outcome)
+
+    timed._metrics_wrapped = True
+    return timed
+
+
+def _leaf_handlers(handler):
+    nested = []
+    for attr in ("entry_points", "fallbacks"):
+        nested.extend(getattr(handler, attr, None) or ())
+    for state_handlers in (getattr(handler, "states", None) or {}).values():
+        nested.extend(state_handlers)
+    if not nested:
+        yield handler
+    for inner in nested:  # ConversationHandler: the handlers of every state instead
+        yield from _leaf_handlers(inner)
+
+
+def leaf_handlers(application):
+    """(group, handler) for every registered handler with a callback, looking inside ConversationHandlers."""
+    for group, handlers in application.handlers.items():
+        for handler in handlers:
+            for leaf in _leaf_handlers(handler):
+                if getattr(leaf, "callback", None) is not None:
+                    yield group, leaf
+
+
+def instrument_application(application):
+    """Wraps the callback of every registered handler, including those inside ConversationHandlers."""
+    count = 0
+    for _, handler in leaf_handlers(application):
+        callback = handler.callback
+        if getattr(callback, "_metrics_wrapped", False):
+            continue
+        handler.callback = _timed_callback(callback, getattr(callback, "__name__", type(handler).__name__))
+        count += 1
+    logger.info(f"Metrics enabled for {count} handler callback(s).")
+    return count
@@ -0,0 +1,125 @@
+# broadcast_queue.py
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages/second overall and 1 message/second per chat.
+BROADCAST_GLOBAL_RATE = float(os.environ.get("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.environ.get("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "8"))
+BROADCAST_MAX_RETRIES = int(os.environ.get("BROADCAST_MAX_RETRIES", "3"))
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    # int seconds in PTB 20.x, a timedelta in later releases
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class BroadcastQueue:
+    """
+    Fans out sends to many chats within Telegram's flood limits.
+
+    run(jobs) takes (chat_id, send) pairs, where send is an async callable that
+    sends that chat's message(s), and drives them through BROADCAST_WORKERS
+    workers. Every send waits for a global slot (BROADCAST_GLOBAL_RATE per
+    second) and for the chat's own spacing (BROADCAST_PER_CHAT_INTERVAL). A
+    RetryAfter pauses all sending for the time Telegram asks and the send is
+    retried; network errors are retried with backoff; Forbidden/BadRequest
+    (bot blocked, chat not found) fail the job immediately. A TimedOut is not
+    retried: the request may have reached Telegram and been delivered, so
+    sending again could give the chat the same message twice. Those jobs are
+    reported as unknown instead of failed.
+    """
+
+    def __init__(self, global_rate=BROADCAST_GLOBAL_RATE, per_chat_interval=BROADCAST_PER_CHAT_INTERVAL,
+                 workers=BROADCAST_WORKERS, max_retries=BROADCAST_MAX_RETRIES):
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_next = {}  # chat_id -> earliest loop time for the next send
+
+    async def run(self, jobs) -> dict:
+        """
+        Sends every job and returns a report: total, sent, failed [(chat_id, reason)],
+        unknown [(chat_id, reason)] for sends that timed out and may or may not
+        have been delivered, retries, elapsed seconds and throughput (messages/second).
+        """
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        report = {"total": queue.qsize(), "sent": 0, "failed": [], "unknown": [], "retries": 0}
+        started = time.monotonic()
+        workers = [asyncio.create_task(self._worker(queue, report), name=f"broadcast-worker-{i}")
+                   for i in range(min(self.workers, report["total"]))]
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._chat_next.clear()
+
+        report["elapsed"] = time.monotonic() - started
+        report["throughput"] = report["sent"] / report["elapsed"] if report["elapsed"] > 0 else 0.0
+        logger.info(f"Broadcast finished: {report['sent']}/{report['total']} sent, {len(report['failed'])} failed, "
+                    f"{len(report['unknown'])} unknown, {report['retries']} retries in {report['elapsed']:.1f}s ({report['throughput']:.1f} msg/s).")
+        return report
+
+    async def _worker(self, queue, report):
+        while True:
+            chat_id, send = await queue.get()
+            try:
+                await self._deliver(chat_id, send, report)
+            finally:
+                queue.task_done()
+
+    async def _wait_for_slot(self, chat_id):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next_slot, self._paused_until, self._chat_next.get(chat_id, 0.0))
+            self._next_slot = start + 1 / self.global_rate
+            self._chat_next[chat_id] = start + self.per_chat_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _deliver(self, chat_id, send, report):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                await send()
+                report["sent"] += 1
+                return
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + delay)
+                logger.warning(f"Flood limit hit sending to {chat_id}; pausing broadcast for {delay:.1f}s.")
+                error = e
+            except (Forbidden, BadRequest) as e:
+                error = e
+                break
+            except TimedOut as e:
+                # TimedOut subclasses NetworkError, but the message may already be delivered
+                logger.warning(f"Timed out sending to {chat_id}; not resending, delivery unknown: {e}")
+                report["unknown"].append((chat_id, f"{type(e).__name__}: {e}"))
+                return
+            except NetworkError as e:
+                logger.warning(f"Network error sending to {chat_id} (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+                error = e
+            except Exception as e:
+                logger.error(f"Unexpected error sending to {chat_id}: {e}", exc_info=True)
+                error = e
+                break
+            if attempt < self.max_retries:
+                report["retries"] += 1
+        report["failed"].append((chat_id, f"{type(error).__name__}: {error}"))
@@ -0,0 +1,174 @@
+# conversation_persistence.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from registry_store import warn_if_ephemeral
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DB_PATH = os.environ.get("CONVERSATION_DB_PATH", "muya_conversations.db")
+# How often PTB hands changed user_data/conversations to the persistence (seconds).
+PERSISTENCE_UPDATE_INTERVAL = float(os.environ.get("PERSISTENCE_UPDATE_INTERVAL", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,  -- JSON
+    PRIMARY KEY (user_id, key)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,    -- JSON list, e.g. [chat_id, user_id]
+    state TEXT NOT NULL,  -- JSON
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    PTB persistence that keeps ConversationHandler states and context.user_data
+    in a local SQLite (WAL) database, so a restart does not drop users out of a
+    half-finished registration, edit, delete or comment flow.
+
+    Writes are incremental: PTB only passes the users and conversation keys
+    touched since the last update, and for each user only the user_data keys
+    whose JSON value changed (or that were removed) are written. The cost of a
+    save depends on what changed, not on how many users are stored.
+
+    States survive a restart only when CONVERSATION_DB_PATH is on storage that
+    outlives the host; on a Heroku dyno that is only a supervisor child restart
+    (see registry_store.LOCAL_STATE_DURABLE).
+
+    bot_data, chat_data and callback_data are not persisted (bot_data holds the
+    worksheet and credentials, which are rebuilt in startup_task).
+    """
+
+    def __init__(self, path=CONVERSATION_DB_PATH, update_interval=PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # user_id -> {key: JSON text} as last written, used to find changed keys.
+        self._user_snapshots = {}
+        logger.info(f"Conversation persistence opened at '{path}' (WAL mode).")
+        warn_if_ephemeral(path, "conversation states and user_data (including queued uploads)", "CONVERSATION_DB_PATH")
+
+    # --- Loading (once, at startup) -----------------------------------------
+
+    async def get_user_data(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, key, value FROM user_data").fetchall()
+        data = {}
+        for user_id, key, value in rows:
+            data.setdefault(user_id, {})[key] = json.loads(value)
+            self._user_snapshots.setdefault(user_id, {})[key] = value
+        logger.info(f"Restored user_data for {len(data)} user(s).")
+        return data
+
+    async def get_conversations(self, name):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        conversations = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+        logger.info(f"Restored {len(conversations)} '{name}' conversation(s).")
+        return conversations
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # --- Incremental updates ------------------------------------------------
+
+    async def update_user_data(self, user_id, data):
+        previous = self._user_snapshots.get(user_id, {})
+        current = {}
+        for key, value in data.items():
+            try:
+                current[str(key)] = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            except (TypeError, ValueError):
+                logger.warning(f"user_data['{key}'] of user {user_id} is not JSON serializable; not persisted.")
+                if str(key) in previous:
+                    current[str(key)] = previous[str(key)]
+
+        changed = [(user_id, key, value) for key, value in current.items() if previous.get(key) != value]
+        removed = [(user_id, key) for key in previous if key not in current]
+        if not changed and not removed:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO user_data (user_id, key, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value",
+                    changed,
+                )
+                self._conn.executemany("DELETE FROM user_data WHERE user_id = ? AND key = ?", removed)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if current:
+            self._user_snapshots[user_id] = current
+        else:
+            self._user_snapshots.pop(user_id, None)
+
+    async def update_conversation(self, name, key, new_state):
+        key_json = json.dumps(list(key))
+        with self._lock:
+            if new_state is None:
+                self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key_json))
+            else:
+                self._conn.execute(
+                    "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, key) DO UPDATE SET state = excluded.state",
+                    (name, key_json, json.dumps(new_state)),
+                )
+
+    async def drop_user_data(self, user_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+        self._user_snapshots.pop(user_id, None)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        # Every update is committed as it arrives; just release the database.
+        with self._lock:
+            self._conn.close()
+        logger.info("Conversation persistence closed.")
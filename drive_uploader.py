@@ -0,0 +1,136 @@
+# drive_uploader.py
+import asyncio
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bot_metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+DRIVE_UPLOAD_WORKERS = int(os.environ.get("DRIVE_UPLOAD_WORKERS", "4"))
+# Files up to this size are streamed through memory; larger ones spill to an
+# anonymous temp file that is removed as soon as the upload finishes.
+DRIVE_STREAM_MAX_MEMORY = int(os.environ.get("DRIVE_STREAM_MAX_MEMORY", str(25 * 1024 * 1024)))
+DRIVE_UPLOAD_CHUNK_SIZE = int(os.environ.get("DRIVE_UPLOAD_CHUNK_SIZE", str(5 * 1024 * 1024)))
+
+# googleapiclient service objects (and their httplib2 transport) are not
+# thread-safe, so each upload thread builds its Drive service once and reuses it.
+_thread_local = threading.local()
+
+
+def get_drive_service(creds):
+    """Returns this thread's long-lived Drive v3 service for creds."""
+    service = getattr(_thread_local, "drive_service", None)
+    if service is None or getattr(_thread_local, "drive_creds", None) is not creds:
+        from googleapiclient.discovery import build  # ~0.2s to import: deferred until the first Drive call
+        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        _thread_local.drive_service = service
+        _thread_local.drive_creds = creds
+    return service
+
+
+def upload_to_drive(stream, folder_id, filename, creds):
+    """Uploads a readable, seekable binary stream to Drive and returns its share link."""
+    from googleapiclient.http import MediaIoBaseUpload
+
+    drive_service = get_drive_service(creds)
+    file_metadata = {
+        'name': filename,
+        'parents': [folder_id]
+    }
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=DRIVE_UPLOAD_CHUNK_SIZE, resumable=True)
+    file = drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+    file_id = file.get('id')
+    return f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
+
+
+class DriveUploader:
+    """
+    Bounded pool that downloads Telegram files and uploads them to Drive in the
+    background, so handlers can acknowledge each file immediately.
+
+    Jobs are grouped by an owner key, e.g. (user_id, 'testimonial_links').
+    collect(owner) waits for that owner's jobs and returns their links in
+    submission order, which is what finish_registration writes to the sheet.
+    """
+
+    def __init__(self, creds, workers=DRIVE_UPLOAD_WORKERS):
+        self.creds = creds
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive")
+        self._slots = asyncio.Semaphore(workers)
+        self._jobs = {}  # owner -> [asyncio.Task]
+
+    def submit(self, owner, bot, file_id, folder_id, filename, position=None):
+        """
+        Schedules a Telegram file -> Drive upload for owner and returns immediately.
+        position inserts the job at that index of owner's jobs instead of last.
+        """
+        task = asyncio.create_task(self._run_job(bot, file_id, folder_id, filename),
+                                   name=f"drive-upload-{filename}")
+        jobs = self._jobs.setdefault(owner, [])
+        jobs.insert(len(jobs) if position is None else position, task)
+        return task
+
+    def resubmit_lost(self, owner, bot, queued):
+        """
+        queued is every [file_id, folder_id, filename] recorded for owner, oldest
+        first. Files queued before a restart come first and have no job in this
+        process (those queued since then are the last submitted(owner) entries),
+        so they are submitted again, ahead of this process's jobs, to keep the
+        links in upload order. Returns the number resubmitted.
+        """
+        lost = queued[:max(0, len(queued) - self.submitted(owner))]
+        for position, (file_id, folder_id, filename) in enumerate(lost):
+            logger.info(f"Restarting upload of {filename} for {owner} after a restart.")
+            self.submit(owner, bot, file_id, folder_id, filename, position=position)
+        return len(lost)
+
+    def submitted(self, owner) -> int:
+        """Number of owner's jobs not collected or discarded yet (running or done)."""
+        return len(self._jobs.get(owner, []))
+
+    def pending(self, owner) -> int:
+        return sum(1 for task in self._jobs.get(owner, []) if not task.done())
+
+    async def collect(self, owner):
+        """Waits for owner's uploads. Returns (links, errors), links in submission order."""
+        tasks = self._jobs.pop(owner, [])
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        links = [r for r in results if not isinstance(r, BaseException)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        return links, errors
+
+    def discard(self, owner):
+        """Forgets owner's jobs (e.g. the flow restarted). Running uploads still finish."""
+        self._jobs.pop(owner, None)
+
+    async def close(self):
+        tasks = [task for tasks in self._jobs.values() for task in tasks]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    async def _run_job(self, bot, file_id, folder_id, filename):
+        async with self._slots:
+            file_obj = await bot.get_file(file_id)
+            # In memory for ordinary documents; rolls over to an unlinked temp
+            # file past DRIVE_STREAM_MAX_MEMORY. Closing it always frees both.
+            with tempfile.SpooledTemporaryFile(max_size=DRIVE_STREAM_MAX_MEMORY) as buffer:
+                try:
+                    await file_obj.download_to_memory(out=buffer)
+                    buffer.seek(0)
+                    loop = asyncio.get_running_loop()
+                    with external_call("drive", "upload"):
+                        link = await loop.run_in_executor(
+                            self._executor, upload_to_drive, buffer, folder_id, filename, self.creds)
+                    logger.info(f"Uploaded {filename} to Drive folder {folder_id}: {link}")
+                    return link
+                except Exception as e:
+                    logger.error(f"Error uploading {filename} to Drive folder {folder_id}: {e}", exc_info=True)
+                    raise
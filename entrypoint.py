@@ -2,9 +2,14 @@ import subprocess
 import threading
 import os
 import logging
+import signal
+import json
 import time
-import psutil
 import traceback
+import urllib.error
+import urllib.request
+
+from process_monitor import ProcessMonitor
 
 # Setup logging to file
 logging.basicConfig(
@@ -16,50 +21,188 @@ logging.basicConfig(
     ]
 )
 
-def monitor_system():
-    """Log memory and CPU usage every 10s"""
+# Restart backoff: doubles after every crash up to the maximum, and resets once
+# a child has stayed up for SUPERVISOR_STABLE_AFTER seconds.
+SUPERVISOR_BACKOFF_INITIAL = float(os.environ.get("SUPERVISOR_BACKOFF_INITIAL", "1"))
+SUPERVISOR_BACKOFF_MAX = float(os.environ.get("SUPERVISOR_BACKOFF_MAX", "300"))
+SUPERVISOR_STABLE_AFTER = float(os.environ.get("SUPERVISOR_STABLE_AFTER", "60"))
+# Liveness: a child whose HTTP endpoint does not answer at all (any status code
+# counts as an answer) SUPERVISOR_LIVENESS_FAILURES times in a row is restarted.
+SUPERVISOR_LIVENESS_INTERVAL = float(os.environ.get("SUPERVISOR_LIVENESS_INTERVAL", "15"))
+SUPERVISOR_LIVENESS_TIMEOUT = float(os.environ.get("SUPERVISOR_LIVENESS_TIMEOUT", "5"))
+SUPERVISOR_LIVENESS_FAILURES = int(os.environ.get("SUPERVISOR_LIVENESS_FAILURES", "3"))
+SUPERVISOR_STARTUP_GRACE = float(os.environ.get("SUPERVISOR_STARTUP_GRACE", "120"))
+# Time a child gets to exit after SIGTERM before it is killed.
+SUPERVISOR_STOP_TIMEOUT = float(os.environ.get("SUPERVISOR_STOP_TIMEOUT", "20"))
+# Restart counts and uptimes, read by bot_health for the /health report.
+SUPERVISOR_STATUS_FILE = os.environ.get("SUPERVISOR_STATUS_FILE", "supervisor_status.json")
+
+PORT = os.environ.get("PORT", "8000")
+HEALTH_INTERNAL_PORT = os.environ.get("HEALTH_INTERNAL_PORT", "8081")
+
+# Running child processes by name ("bot", "web"), sampled by the process monitor
+children = {}
+# Per-child supervisor state: pid, started_at, restarts, last exit
+child_status = {}
+status_lock = threading.Lock()
+supervisor_started_at = time.time()
+shutting_down = threading.Event()
+
+def child_pids():
+    return {name: proc.pid for name, proc in list(children.items()) if proc.poll() is None}
+
+def supervisor_status():
+    now = time.time()
+    with status_lock:
+        status = {name: dict(state) for name, state in child_status.items()}
+    for state in status.values():
+        if state.get("started_at") and state.get("state") == "running":
+            state["uptime_seconds"] = round(now - state["started_at"], 1)
+    return {"started_at": supervisor_started_at,
+            "uptime_seconds": round(now - supervisor_started_at, 1),
+            "shutting_down": shutting_down.is_set(),
+            "children": status}
+
+def update_status(name, **changes):
+    with status_lock:
+        child_status.setdefault(name, {"restarts": 0}).update(changes)
     try:
-        while True:
-            mem = psutil.virtual_memory()
-            cpu = psutil.cpu_percent()
-            logging.info(f"[MONITOR] RAM used: {mem.percent}%, CPU: {cpu}%")
-            time.sleep(10)
-    except Exception as e:
-        logging.error("[MONITOR ERROR] " + str(e))
-        traceback.print_exc()
+        tmp_path = f"{SUPERVISOR_STATUS_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(supervisor_status(), f)
+        os.replace(tmp_path, SUPERVISOR_STATUS_FILE)
+    except OSError as e:
+        logging.warning(f"[SUPERVISOR] Could not write {SUPERVISOR_STATUS_FILE}: {e}")
 
-def run_bot():
+def is_responding(url):
     try:
-        logging.info("[BOT] Starting Debo_registration.py")
-        subprocess.run(["python3", "Debo_registration.py"], check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error(f"[BOT ERROR] Process failed: {e}")
-    except Exception as e:
-        logging.error("[BOT EXCEPTION] " + str(e))
-        traceback.print_exc()
+        with urllib.request.urlopen(url, timeout=SUPERVISOR_LIVENESS_TIMEOUT):
+            return True
+    except urllib.error.HTTPError:
+        return True  # it answered, even if with 503 (degraded is not dead)
+    except Exception:
+        return False
 
-def run_web():
+def stop_child(tag, proc):
+    if proc.poll() is not None:
+        return
+    proc.terminate()
     try:
-        port = os.environ.get("PORT", "8000")
-        logging.info(f"[WEB] Starting Flask health check on port {port}")
-        subprocess.run(["gunicorn", "health_check_server:app", "--bind", f"0.0.0.0:{port}"], check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error(f"[WEB ERROR] Process failed: {e}")
-    except Exception as e:
-        logging.error("[WEB EXCEPTION] " + str(e))
-        traceback.print_exc()
+        proc.wait(timeout=SUPERVISOR_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        logging.error(f"[{tag}] Did not exit {SUPERVISOR_STOP_TIMEOUT}s after SIGTERM; killing pid {proc.pid}")
+        proc.kill()
+        proc.wait()
+
+def wait_child(tag, proc, liveness_url):
+    """Waits for proc to exit, restarting it (via SIGTERM) when liveness_url stops answering."""
+    started = time.monotonic()
+    failures = 0
+    while True:
+        try:
+            return proc.wait(timeout=SUPERVISOR_LIVENESS_INTERVAL)
+        except subprocess.TimeoutExpired:
+            pass
+        if shutting_down.is_set():
+            # SIGTERM was forwarded already; kill the child if it does not exit in time
+            stop_child(tag, proc)
+            return proc.wait()
+        if not liveness_url or time.monotonic() - started < SUPERVISOR_STARTUP_GRACE:
+            continue
+        if is_responding(liveness_url):
+            failures = 0
+            continue
+        failures += 1
+        logging.warning(f"[{tag}] Liveness check {failures}/{SUPERVISOR_LIVENESS_FAILURES} failed ({liveness_url})")
+        if failures >= SUPERVISOR_LIVENESS_FAILURES:
+            logging.error(f"[{tag}] Not responding; restarting pid {proc.pid}")
+            stop_child(tag, proc)
+            return proc.wait()
+
+def supervise(name, tag, args, liveness_url=None):
+    """Runs args until shutdown, restarting it with exponential backoff whenever it exits or hangs."""
+    delay = SUPERVISOR_BACKOFF_INITIAL
+    while not shutting_down.is_set():
+        started = time.monotonic()
+        try:
+            proc = subprocess.Popen(args)
+        except Exception as e:
+            logging.error(f"[{tag} EXCEPTION] Could not start {args[0]}: {e}")
+            traceback.print_exc()
+            returncode = None
+        else:
+            children[name] = proc
+            update_status(name, state="running", pid=proc.pid, started_at=time.time())
+            try:
+                returncode = wait_child(tag, proc, liveness_url)
+            finally:
+                children.pop(name, None)
+        if shutting_down.is_set():
+            update_status(name, state="stopped", pid=None, last_exit_code=returncode, last_exit_at=time.time())
+            logging.info(f"[{tag}] Stopped (exit code {returncode})")
+            return
+
+        uptime = time.monotonic() - started
+        if uptime >= SUPERVISOR_STABLE_AFTER:
+            delay = SUPERVISOR_BACKOFF_INITIAL
+        with status_lock:
+            restarts = child_status.get(name, {}).get("restarts", 0) + 1
+        update_status(name, state="backoff", pid=None, restarts=restarts,
+                      last_exit_code=returncode, last_exit_at=time.time())
+        logging.error(f"[{tag} ERROR] Process exited with code {returncode} after {uptime:.0f}s; "
+                      f"restart #{restarts} in {delay:.1f}s")
+        if shutting_down.wait(delay):
+            update_status(name, state="stopped")
+            return
+        delay = min(delay * 2, SUPERVISOR_BACKOFF_MAX)
+
+def run_bot():
+    logging.info("[BOT] Starting Debo_registration.py")
+    # In webhook mode the bot serves /health on $PORT, otherwise on its local status port
+    health_port = PORT if os.environ.get("WEBHOOK_URL") else HEALTH_INTERNAL_PORT
+    supervise("bot", "BOT", ["python3", "Debo_registration.py"], f"http://127.0.0.1:{health_port}/health")
+
+def run_web():
+    logging.info(f"[WEB] Starting Flask health check on port {PORT}")
+    supervise("web", "WEB", ["gunicorn", "health_check_server:app", "--bind", f"0.0.0.0:{PORT}"],
+              f"http://127.0.0.1:{PORT}/health")
+
+def handle_signal(signum, frame):
+    """Stops restarting and forwards SIGTERM to every child for a graceful shutdown."""
+    if shutting_down.is_set():
+        return
+    logging.info(f"[MAIN] Received {signal.Signals(signum).name}; stopping children")
+    shutting_down.set()
+    for name, proc in list(children.items()):
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
 
 if __name__ == "__main__":
     logging.info("[MAIN] Starting entrypoint")
-    threading.Thread(target=monitor_system, daemon=True).start()
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
 
-    t1 = threading.Thread(target=run_bot)
-    t2 = threading.Thread(target=run_web)
+    monitor = ProcessMonitor(child_pids, status=supervisor_status)
+    try:
+        monitor.serve()
+    except OSError as e:
+        logging.error(f"[MONITOR ERROR] Could not serve process samples: {e}")
+    threading.Thread(target=monitor.run, name="process-monitor", daemon=True).start()
 
-    t1.start()
-    t2.start()
+    threads = [threading.Thread(target=run_bot, name="supervise-bot")]
+    if os.environ.get("WEBHOOK_URL"):
+        # Webhook mode: the bot process itself serves Telegram updates and the
+        # health check on $PORT, so no separate web server is started.
+        logging.info("[MAIN] WEBHOOK_URL set; bot serves webhook and health check on $PORT")
+    else:
+        threads.append(threading.Thread(target=run_web, name="supervise-web"))
 
-    t1.join()
-    t2.join()
+    for t in threads:
+        t.start()
+    for t in threads:
+        # join in slices so the signal handler keeps running in the main thread
+        while t.is_alive():
+            t.join(timeout=1)
 
-    logging.info("[MAIN] Both threads finished — this usually means crash or shutdown.")
+    monitor.stop()
+    logging.info("[MAIN] All children stopped; exiting.")
@@ -0,0 +1,389 @@
+# fake_services.py
+#
+# In-memory stand-ins for Google Sheets (gspread), Google Drive and the
+# Telegram Bot API, so benchmark.py can drive the real bots without touching
+# production sheets or a real bot token. FakeBackend.install() patches
+# gspread.authorize, the oauth2client credential loader and the Drive service
+# factories, so it must run before Debo_registration / Mrequests are imported;
+# FakeBotRequest is passed to their build_application(request=...).
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from telegram.request import BaseRequest
+
+from registry_store import DEFAULT_HEADER
+from user_index import column_letter_to_index
+
+
+_A1_RE = re.compile(r"^([A-Z]+)?(\d+)?(?::([A-Z]+)?(\d+)?)?$")
+
+
+class FakeAPIError(Exception):
+    """Quota error shaped like gspread's APIError (carries response.status_code)."""
+
+    class _Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    def __init__(self, status_code, message):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.response = self._Response(status_code)
+
+
+class QuotaWindow:
+    """Sliding one-minute request quota; None means unlimited."""
+
+    def __init__(self, per_minute=None):
+        self.per_minute = per_minute
+        self._calls = deque()
+
+    def allow(self, now) -> bool:
+        if self.per_minute is None:
+            return True
+        while self._calls and now - self._calls[0] >= 60:
+            self._calls.popleft()
+        if len(self._calls) >= self.per_minute:
+            return False
+        self._calls.append(now)
+        return True
+
+
+class FakeCredentials:
+    service_account_email = "benchmark@fake.iam.gserviceaccount.com"
+
+
+class FakeBackend:
+    """
+    Shared state of the fake Google services: spreadsheets by key and title,
+    per-call latency, Sheets read/write quotas (exceeding one raises a 429
+    FakeAPIError, like the real API) and a Counter of every external call.
+    """
+
+    def __init__(self, sheets_latency=0.05, sheets_jitter=0.0, reads_per_minute=None, writes_per_minute=None,
+                 drive_latency=0.2, seed=0):
+        self.sheets_latency = sheets_latency
+        self.sheets_jitter = sheets_jitter
+        self.drive_latency = drive_latency
+        self.read_quota = QuotaWindow(reads_per_minute)
+        self.write_quota = QuotaWindow(writes_per_minute)
+        self.calls = Counter()
+        self.lock = threading.RLock()
+        self.random = random.Random(seed)
+        self._spreadsheets = {}
+        self._ids = itertools.count(1)
+
+    # --- Google Sheets ------------------------------------------------------
+
+    def spreadsheet(self, key=None, title=None):
+        with self.lock:
+            for spreadsheet in self._spreadsheets.values():
+                if (key and spreadsheet.id == key) or (title and spreadsheet.title == title):
+                    return spreadsheet
+            spreadsheet = FakeSpreadsheet(self, key or f"fake-spreadsheet-{next(self._ids)}", title or key)
+            self._spreadsheets[spreadsheet.id] = spreadsheet
+            return spreadsheet
+
+    def sheets_call(self, method, write=False):
+        """Counts, rate-limits and delays one Sheets API request. Runs on the caller's (gateway) thread."""
+        with self.lock:
+            quota = self.write_quota if write else self.read_quota
+            if not quota.allow(time.monotonic()):
+                self.calls[f"sheets.{method}.429"] += 1
+                raise FakeAPIError(429, f"Quota exceeded for {'write' if write else 'read'} requests")
+            self.calls[f"sheets.{method}"] += 1
+            delay = self.sheets_latency + self.random.uniform(0, self.sheets_jitter)
+        time.sleep(delay)
+
+    def authorize(self, creds):
+        return FakeClient(self)
+
+    # --- Google Drive -------------------------------------------------------
+
+    def drive_service(self, creds=None):
+        return FakeDriveService(self)
+
+    # --- Patching -----------------------------------------------------------
+
+    def install(self):
+        """Routes gspread, oauth2client and the Drive helpers to this backend."""
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        import drive_uploader
+        import names_refresher
+
+        gspread.authorize = self.authorize
+        ServiceAccountCredentials.from_json_keyfile_name = classmethod(lambda cls, *args, **kwargs: FakeCredentials())
+        drive_uploader.get_drive_service = self.drive_service
+        names_refresher.get_drive_service = self.drive_service
+        return self
+
+    def seed_professionals(self, spreadsheet_key, count, professions, center=(9.0108, 38.7613), spread=0.15):
+        """Fills Sheet1 of spreadsheet_key with a header row and `count` registered professionals."""
+        worksheet = self.spreadsheet(key=spreadsheet_key).worksheet("Sheet1")
+        rows = [list(DEFAULT_HEADER)]
+        for i in range(count):
+            lat = center[0] + self.random.uniform(-spread, spread)
+            lon = center[1] + self.random.uniform(-spread, spread)
+            rows.append([
+                str(9_000_000_000 + i), f"pro{i}", f"Professional {i}", self.random.choice(professions),
+                f"09{i:08d}"[:10], f"{lat:.5f}, {lon:.5f}", "Addis Ababa, Bole, 03", "", "", "", "",
+            ])
+        with self.lock:
+            worksheet.rows = rows
+        return worksheet
+
+
+class FakeClient:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_by_key(self, key):
+        self.backend.sheets_call("open_by_key")
+        return self.backend.spreadsheet(key=key)
+
+    def open(self, title):
+        self.backend.sheets_call("open")
+        return self.backend.spreadsheet(title=title)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend, key, title):
+        self.backend = backend
+        self.id = key
+        self.title = title
+        self._worksheets = {}
+        self._modified = 0
+
+    def touch(self):
+        self._modified += 1
+
+    @property
+    def modified_time(self):
+        return datetime.fromtimestamp(1_700_000_000 + self._modified, timezone.utc).isoformat()
+
+    def worksheet(self, title):
+        with self.backend.lock:
+            if title not in self._worksheets:
+                self._worksheets[title] = FakeWorksheet(self, title, len(self._worksheets))
+            return self._worksheets[title]
+
+    @property
+    def sheet1(self):
+        with self.backend.lock:
+            if self._worksheets:
+                return next(iter(self._worksheets.values()))
+        return self.worksheet("Sheet1")
+
+    def batch_update(self, body):
+        self.backend.sheets_call("spreadsheet.batch_update", write=True)
+        with self.backend.lock:
+            # Applied in order, like the API: each deleteDimension sees the rows left by the previous one
+            for request in body.get("requests", []):
+                delete = request.get("deleteDimension")
+                if not delete or delete["range"].get("dimension") != "ROWS":
+                    continue
+                worksheet = next(ws for ws in self._worksheets.values() if ws.id == delete["range"]["sheetId"])
+                del worksheet.rows[delete["range"]["startIndex"]:delete["range"]["endIndex"]]
+            self.touch()
+        return {"replies": []}
+
+
+class FakeWorksheet:
+    """gspread.Worksheet look-alike holding its cells as a list of row lists."""
+
+    def __init__(self, spreadsheet, title, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = []
+
+    @property
+    def _backend(self):
+        return self.spreadsheet.backend
+
+    def _range(self, a1):
+        match = _A1_RE.match(a1.split("!")[-1].upper())
+        if not match:
+            raise ValueError(f"Unsupported range {a1!r}")
+        start_col, start_row, end_col, end_row = match.groups()
+        col0 = column_letter_to_index(start_col) if start_col else 0
+        row0 = int(start_row) - 1 if start_row else 0
+        if ":" in a1:
+            col1 = column_letter_to_index(end_col) if end_col else None
+            row1 = int(end_row) - 1 if end_row else None
+        else:
+            col1, row1 = col0, row0
+        return row0, col0, row1, col1
+
+    def _set(self, row_idx, col_idx, value):
+        while len(self.rows) <= row_idx:
+            self.rows.append([])
+        row = self.rows[row_idx]
+        while len(row) <= col_idx:
+            row.append("")
+        row[col_idx] = "" if value is None else str(value)
+
+    def _padded(self):
+        width = max((len(row) for row in self.rows), default=0)
+        return [list(row) + [""] * (width - len(row)) for row in self.rows]
+
+    # --- Reads ----------------------------------------------------------------
+
+    def get_all_values(self, **kwargs):
+        self._backend.sheets_call("get_all_values")
+        with self._backend.lock:
+            return self._padded()
+
+    def get_all_records(self, **kwargs):
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, row)) for row in values[1:]]
+
+    def batch_get(self, ranges, major_dimension="ROWS", **kwargs):
+        self._backend.sheets_call("batch_get")
+        with self._backend.lock:
+            results = []
+            for a1 in ranges:
+                row0, col0, row1, col1 = self._range(a1)
+                rows = self.rows[row0:None if row1 is None else row1 + 1]
+                cells = [row[col0:None if col1 is None else col1 + 1] for row in rows]
+                if major_dimension == "COLUMNS":
+                    width = max((len(row) for row in cells), default=0)
+                    cells = [[row[c] if c < len(row) else "" for row in cells] for c in range(width)]
+                results.append(cells)
+            return results
+
+    # --- Writes ---------------------------------------------------------------
+
+    def batch_update(self, data, **kwargs):
+        self._backend.sheets_call("batch_update", write=True)
+        with self._backend.lock:
+            for item in data:
+                row0, col0, _, _ = self._range(item["range"])
+                for r, values in enumerate(item["values"]):
+                    for c, value in enumerate(values):
+                        self._set(row0 + r, col0 + c, value)
+            self.spreadsheet.touch()
+        return {"totalUpdatedCells": sum(len(v) for item in data for v in item["values"])}
+
+    def append_rows(self, values, **kwargs):
+        self._backend.sheets_call("append_rows", write=True)
+        with self._backend.lock:
+            # Like the API, appends after the last non-empty row
+            while self.rows and not any(self.rows[-1]):
+                self.rows.pop()
+            self.rows.extend([("" if v is None else str(v)) for v in row] for row in values)
+            self.spreadsheet.touch()
+        return {"updates": {"updatedRows": len(values)}}
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def delete_rows(self, start_index, end_index=None):
+        self._backend.sheets_call("delete_rows", write=True)
+        with self._backend.lock:
+            del self.rows[start_index - 1:(end_index or start_index)]
+            self.spreadsheet.touch()
+
+
+class _FakeDriveRequest:
+    def __init__(self, backend, method, result):
+        self.backend = backend
+        self.method = method
+        self.result = result
+
+    def execute(self, **kwargs):
+        with self.backend.lock:
+            self.backend.calls[f"drive.{self.method}"] += 1
+        time.sleep(self.backend.drive_latency if self.method == "files.create" else self.backend.sheets_latency)
+        return self.result()
+
+
+class FakeDriveService:
+    """The subset of the Drive v3 service the bots use: files().create() and files().get()."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def files(self):
+        return self
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        with self.backend.lock:
+            file_id = f"fake-file-{next(self.backend._ids)}"
+        return _FakeDriveRequest(self.backend, "files.create", lambda: {"id": file_id})
+
+    def get(self, fileId=None, fields=None, **kwargs):
+        spreadsheet = self.backend.spreadsheet(key=fileId)
+        return _FakeDriveRequest(self.backend, "files.get", lambda: {"modifiedTime": spreadsheet.modified_time})
+
+
+class FakeBotRequest(BaseRequest):
+    """
+    Local Bot API: answers every method the bots call with a well-formed
+    result after `latency` seconds, serves file downloads of `file_size`
+    bytes, and counts calls by method in `calls`. Sent messages are kept per
+    chat in `sent` (text only) when keep_messages is set.
+    """
+
+    def __init__(self, latency=0.03, file_size=100_000, keep_messages=False):
+        self.latency = latency
+        self.file_size = file_size
+        self.keep_messages = keep_messages
+        self.calls = Counter()
+        self.sent = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "/file/bot" in url:
+            self.calls["download"] += 1
+            return 200, b"\0" * self.file_size
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data is not None else {}
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode("utf-8")
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id", 0) or 0)
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        if self.keep_messages:
+            self.sent.setdefault(chat_id, []).append(params.get("text", ""))
+        return message
+
+    def _result(self, api_method, params):
+        if api_method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if api_method == "getFile":
+            file_id = params.get("file_id", "file")
+            return {"file_id": file_id, "file_unique_id": f"u{file_id}", "file_size": self.file_size,
+                    "file_path": f"documents/{file_id}.pdf"}
+        if api_method == "getUpdates":
+            return []
+        if api_method.startswith("send") or api_method.startswith("edit"):
+            return self._message(params)
+        return True
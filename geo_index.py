@@ -0,0 +1,208 @@
+# geo_index.py
+import logging
+import math
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+# Grid cell size in degrees (0.05 deg is ~5.5 km around Ethiopia's latitudes).
+GEO_CELL_DEGREES = float(os.environ.get("GEO_CELL_DEGREES", "0.05"))
+# Professions with at most this many located professionals are ranked exhaustively.
+GEO_BRUTE_FORCE_MAX = int(os.environ.get("GEO_BRUTE_FORCE_MAX", "256"))
+
+_LOCATION_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def parse_location(text):
+    """Parses the "lat, lon" string get_location stores in column F. Returns (lat, lon) or None."""
+    match = _LOCATION_RE.match(str(text or ""))
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def normalize_profession(text) -> str:
+    return " ".join(str(text or "").casefold().split())
+
+
+def _point(lat, lon):
+    phi = math.radians(lat)
+    return (lat, lon, phi, math.radians(lon), math.cos(phi))
+
+
+def haversine_many(lat, lon, points):
+    """
+    Great-circle distances (km) from (lat, lon) to every point in one pass.
+    Points carry their precomputed radians and cos(lat), so each distance needs
+    only two sines, a square root and an arcsine.
+    """
+    phi1 = math.radians(lat)
+    lam1 = math.radians(lon)
+    cos1 = math.cos(phi1)
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+    distances = []
+    for _, _, phi2, lam2, cos2 in points:
+        a = sin((phi2 - phi1) / 2) ** 2 + cos1 * cos2 * sin((lam2 - lam1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return distances
+
+
+class GeoIndex:
+    """
+    In-memory uniform-grid index of professionals' GPS locations, one grid per
+    (normalized) profession.
+
+    nearest() scans grid rings outwards from the query cell and stops as soon
+    as the k-th best haversine distance found is closer than anything an
+    unscanned ring could hold; small professions are simply ranked in full.
+    upsert/remove are O(1), and update_from_record can be registered as a
+    registry_store.RegistryStore listener to keep the index current.
+    """
+
+    def __init__(self, cell_degrees=GEO_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}    # profession -> {(i, j): {user_id: point}}
+        self._members = {}  # profession -> {user_id: point}
+        self._bounds = {}   # profession -> [min_i, max_i, min_j, max_j] (grown, never shrunk)
+        self._located = {}  # user_id -> (profession, cell)
+
+    def __len__(self):
+        return len(self._located)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    # --- Maintenance --------------------------------------------------------
+
+    def upsert(self, user_id, profession, lat, lon):
+        user_id = str(user_id)
+        self.remove(user_id)
+        profession = normalize_profession(profession)
+        cell = self._cell(lat, lon)
+        point = _point(lat, lon)
+        self._cells.setdefault(profession, {}).setdefault(cell, {})[user_id] = point
+        self._members.setdefault(profession, {})[user_id] = point
+        bounds = self._bounds.setdefault(profession, [cell[0], cell[0], cell[1], cell[1]])
+        bounds[0], bounds[1] = min(bounds[0], cell[0]), max(bounds[1], cell[0])
+        bounds[2], bounds[3] = min(bounds[2], cell[1]), max(bounds[3], cell[1])
+        self._located[user_id] = (profession, cell)
+
+    def remove(self, user_id):
+        entry = self._located.pop(str(user_id), None)
+        if entry is None:
+            return
+        profession, cell = entry
+        cells = self._cells[profession]
+        cells[cell].pop(str(user_id), None)
+        if not cells[cell]:
+            del cells[cell]
+        self._members[profession].pop(str(user_id), None)
+        if not self._members[profession]:
+            del self._members[profession], self._cells[profession], self._bounds[profession]
+
+    def update_from_record(self, user_id, record):
+        """RegistryStore listener: (re)indexes a professional, or drops them (record None / no GPS)."""
+        location = parse_location(record.get("LOCATION")) if record else None
+        if location is None:
+            self.remove(user_id)
+        else:
+            self.upsert(user_id, record.get("PROFESSION", ""), *location)
+
+    def load(self, records):
+        """Indexes [(user_id, record)], e.g. RegistryStore.all_records()."""
+        for user_id, record in records:
+            self.update_from_record(user_id, record)
+        logger.info(f"Geo index loaded {len(self)} located professional(s) in {len(self._members)} profession(s).")
+
+    def professions(self):
+        return list(self._members)
+
+    # --- Queries ------------------------------------------------------------
+
+    def nearest(self, lat, lon, k, professions=None, max_km=None):
+        """
+        Returns up to k [(user_id, distance_km)] nearest to (lat, lon), closest
+        first, among the given professions (all professions when None).
+        """
+        if k <= 0:
+            return []
+        if professions is None:
+            professions = self.professions()
+        results = []
+        for profession in {normalize_profession(p) for p in professions}:
+            results.extend(self._nearest_in(profession, lat, lon, k, max_km))
+        results.sort(key=lambda item: item[1])
+        return results[:k]
+
+    def _ring_bound_km(self, lat, ring):
+        # Anything outside the scanned (2*ring+1)^2 block is at least `ring` cells
+        # away along one axis; longitude degrees are shortest at the block's
+        # poleward edge. The 0.99 absorbs the arc-vs-chord difference.
+        edge_lat = min(89.9, abs(lat) + (ring + 1) * self.cell_degrees)
+        return 0.99 * ring * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+
+    def _nearest_in(self, profession, lat, lon, k, max_km):
+        members = self._members.get(profession)
+        if not members:
+            return []
+        if len(members) <= GEO_BRUTE_FORCE_MAX:
+            found = self._rank(lat, lon, members.items())
+        else:
+            found = self._ring_search(profession, lat, lon, k, max_km)
+        if max_km is not None:
+            found = [item for item in found if item[1] <= max_km]
+        found.sort(key=lambda item: item[1])
+        return found[:k]
+
+    def _ring_search(self, profession, lat, lon, k, max_km):
+        cells = self._cells[profession]
+        min_i, max_i, min_j, max_j = self._bounds[profession]
+        ci, cj = self._cell(lat, lon)
+        max_ring = max(abs(ci - min_i), abs(ci - max_i), abs(cj - min_j), abs(cj - max_j))
+        found = []
+        ring = 0
+        while ring <= max_ring:
+            if 8 * ring > len(cells):
+                # The ring perimeter is larger than the number of occupied cells:
+                # ranking every member is now cheaper than walking empty cells.
+                return self._rank(lat, lon, self._members[profession].items())
+            batch = []
+            for cell in self._ring_cells(ci, cj, ring):
+                members = cells.get(cell)
+                if members:
+                    batch.extend(members.items())
+            found.extend(self._rank(lat, lon, batch))
+            bound = self._ring_bound_km(lat, ring)
+            if len(found) >= k:
+                found.sort(key=lambda item: item[1])
+                del found[k:]
+                if found[-1][1] <= bound:
+                    break
+            if max_km is not None and bound > max_km:
+                break
+            ring += 1
+        return found
+
+    @staticmethod
+    def _ring_cells(ci, cj, ring):
+        if ring == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - ring, cj + ring + 1):
+            yield (ci - ring, j)
+            yield (ci + ring, j)
+        for i in range(ci - ring + 1, ci + ring):
+            yield (i, cj - ring)
+            yield (i, cj + ring)
+
+    @staticmethod
+    def _rank(lat, lon, items):
+        items = list(items)
+        distances = haversine_many(lat, lon, [point for _, point in items])
+        return [(user_id, distance) for (user_id, _), distance in zip(items, distances)]
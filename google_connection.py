@@ -0,0 +1,170 @@
+# google_connection.py
+import asyncio
+import logging
+import os
+import random
+import time
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+from sheet_gateway import sheet_gateway
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+# Failed connection attempts are retried after 1, 2, 4, ... seconds (plus jitter), up to this many.
+GOOGLE_CONNECT_RETRY_MAX = float(os.environ.get("GOOGLE_CONNECT_RETRY_MAX", "60"))
+
+
+class GoogleConnection:
+    """
+    Authorizes gspread and opens the worksheets a bot needs from a background
+    task, so the bot takes updates while Google is slow or unreachable.
+
+    Worksheets are declared with add_worksheet(name, open_fn, on_open):
+    open_fn(client) runs on the sheet_gateway pool and returns the worksheet,
+    then on_open(worksheet) is awaited (e.g. to hand it to a replicator).
+    The client is authorized once and the worksheets are opened concurrently.
+    start() keeps retrying in the background with exponential backoff until
+    everything is open; one worksheet failing does not hold back the others.
+    A bot that cannot run without its sheets awaits connect() instead, a
+    single attempt that raises when something could not be opened.
+
+    state is "connecting" before the first failure, "retrying" after one and
+    "connected" once every worksheet is open. snapshot() has the same shape as
+    bot_health.BotHealth.snapshot(), so it can back a status server's /health.
+    """
+
+    def __init__(self, name, credentials_path, scope=GOOGLE_SCOPE, retry_max=GOOGLE_CONNECT_RETRY_MAX):
+        self.name = name
+        self.credentials_path = credentials_path
+        self.scope = scope
+        self.retry_max = retry_max
+        self.creds = None
+        self.client = None
+        self.worksheets = {}
+        self.attempts = 0
+        self.last_error = None
+        self.started_at = None
+        self.connected_at = None
+        self._openers = {}  # name -> (open_fn, on_open)
+        self._connected = asyncio.Event()
+        self._task = None
+
+    def add_worksheet(self, name, open_fn, on_open=None):
+        self._openers[name] = (open_fn, on_open)
+
+    def worksheet(self, name):
+        """The worksheet once it is open, else None."""
+        return self.worksheets.get(name)
+
+    @property
+    def state(self) -> str:
+        if self._connected.is_set():
+            return "connected"
+        return "retrying" if self.last_error is not None else "connecting"
+
+    def start(self):
+        if self._task is None:
+            self.started_at = time.monotonic()
+            self._task = asyncio.create_task(self._run(), name=f"{self.name}-google-connect")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def connect(self):
+        """One connection attempt; raises ConnectionError unless every worksheet is open afterwards."""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        await self._attempt()
+        if not self._complete():
+            raise ConnectionError(f"{self.name}: Google Sheets connection failed ({self.last_error})")
+        self._set_connected()
+
+    async def wait_connected(self, timeout=None) -> bool:
+        """Waits until every worksheet is open; False if timeout passes first."""
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def snapshot(self):
+        problems = []
+        if not self._connected.is_set():
+            missing = [name for name in self._openers if name not in self.worksheets]
+            problems.append(f"Google Sheets not connected ({', '.join(missing) or 'authorization'})"
+                            + (f": {self.last_error}" if self.last_error else ""))
+        report = {
+            "status": "degraded" if problems else "ok",
+            "problems": problems,
+            "google": {
+                "state": self.state,
+                "attempts": self.attempts,
+                "worksheets": sorted(self.worksheets),
+                "last_error": self.last_error,
+                "connected_after_seconds": (round(self.connected_at - self.started_at, 2)
+                                            if self.connected_at is not None else None),
+            },
+        }
+        return not problems, report
+
+    # --- Internals ----------------------------------------------------------
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            await self._attempt()
+            if self._complete():
+                self._set_connected()
+                return
+            wait = delay + random.uniform(0, 1)
+            logger.warning(f"{self.name}: Google Sheets not reachable yet; retrying in {wait:.1f}s.")
+            await asyncio.sleep(wait)
+            delay = min(self.retry_max, delay * 2)
+
+    def _complete(self) -> bool:
+        return self.client is not None and len(self.worksheets) == len(self._openers)
+
+    def _set_connected(self):
+        self.connected_at = time.monotonic()
+        self._connected.set()
+        logger.info(f"{self.name}: connected to Google Sheets after {self.attempts} attempt(s) "
+                    f"in {self.connected_at - self.started_at:.2f}s.")
+
+    async def _attempt(self):
+        self.attempts += 1
+        if self.client is None:
+            try:
+                if self.creds is None:
+                    self.creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_path, self.scope)
+                self.client = await sheet_gateway.call(gspread.authorize, self.creds, quota=None)
+                logger.info(f"{self.name}: gspread client authorized.")
+            except Exception as e:
+                self._failed("authorization", e)
+                return
+        missing = [name for name in self._openers if name not in self.worksheets]
+        await asyncio.gather(*(self._open(name) for name in missing))
+
+    async def _open(self, name):
+        open_fn, on_open = self._openers[name]
+        try:
+            worksheet = await sheet_gateway.call(open_fn, self.client)
+        except Exception as e:
+            self._failed(name, e)
+            return
+        self.worksheets[name] = worksheet
+        logger.info(f"{self.name}: opened worksheet '{name}'.")
+        if on_open is not None:
+            try:
+                await on_open(worksheet)
+            except Exception as e:
+                logger.error(f"{self.name}: setting up worksheet '{name}' failed: {e}", exc_info=True)
+
+    def _failed(self, step, error):
+        self.last_error = f"{step}: {error}"
+        logger.error(f"{self.name}: Google Sheets {step} failed (attempt {self.attempts}): {error}")
@@ -1,12 +1,42 @@
 # health_check_server.py
-from flask import Flask
+from flask import Flask, Response, jsonify
+import json
 import os
+import urllib.error
+import urllib.request
 
 app = Flask(__name__)
 
+# The bot process serves its own health snapshot on this local URL (see
+# bot_health.BotHealth); this app only relays it on $PORT.
+BOT_STATUS_URL = os.environ.get(
+    'BOT_STATUS_URL', f"http://127.0.0.1:{os.environ.get('HEALTH_INTERNAL_PORT', '8081')}/health")
+BOT_METRICS_URL = os.environ.get('BOT_METRICS_URL', BOT_STATUS_URL.rsplit('/', 1)[0] + '/metrics')
+BOT_STATUS_TIMEOUT = float(os.environ.get('BOT_STATUS_TIMEOUT', '3'))
+
 @app.route('/')
+@app.route('/health')
 def hello_world():
-    return 'Bot is running (health check)!'
+    try:
+        with urllib.request.urlopen(BOT_STATUS_URL, timeout=BOT_STATUS_TIMEOUT) as response:
+            return jsonify(json.load(response)), response.status
+    except urllib.error.HTTPError as e:
+        # 503 from the bot: it is running but degraded
+        try:
+            return jsonify(json.load(e)), e.code
+        except ValueError:
+            return jsonify({"status": "degraded", "problems": [f"bot status server: HTTP {e.code}"]}), e.code
+    except Exception as e:
+        return jsonify({"status": "unreachable", "problems": [f"bot status server: {e}"]}), 503
+
+@app.route('/metrics')
+def metrics():
+    try:
+        with urllib.request.urlopen(BOT_METRICS_URL, timeout=BOT_STATUS_TIMEOUT) as response:
+            return Response(response.read(), status=response.status,
+                            content_type=response.headers.get('Content-Type', 'text/plain'))
+    except Exception as e:
+        return Response(f"# bot metrics unavailable: {e}\n", status=503, content_type='text/plain')
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
@@ -0,0 +1,136 @@
+# names_refresher.py
+import asyncio
+import logging
+import os
+import zlib
+
+from sheet_gateway import sheet_gateway
+from drive_uploader import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+NAMES_REFRESH_INTERVAL = float(os.environ.get("NAMES_REFRESH_INTERVAL", "300"))
+# Rows per checksummed block; only blocks whose checksum changed are re-parsed.
+NAMES_BLOCK_ROWS = int(os.environ.get("NAMES_BLOCK_ROWS", "500"))
+
+
+def get_spreadsheet_modified_time(creds, spreadsheet_id):
+    """Drive modifiedTime of the spreadsheet (RFC 3339 string). Blocking; run it on the gateway."""
+    service = get_drive_service(creds)
+    return service.files().get(fileId=spreadsheet_id, fields="modifiedTime").execute().get("modifiedTime")
+
+
+class NamesRefresher:
+    """
+    Keeps a {professional_id: full_name} dict in sync with the sheet, in place.
+
+    A refresh first asks Drive for the spreadsheet's modifiedTime and stops
+    there if it has not changed. Otherwise it fetches only the ID and name
+    columns with one batch_get, checksums them in blocks of NAMES_BLOCK_ROWS
+    rows, and re-parses only the blocks whose checksum changed, writing just
+    the entries that were added, renamed or removed into the lookup dict.
+    start() runs a refresh every NAMES_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, lookup: dict, worksheet, creds=None, id_col="A", name_col="C",
+                 block_rows=NAMES_BLOCK_ROWS, interval=NAMES_REFRESH_INTERVAL):
+        self.lookup = lookup
+        self.worksheet = worksheet
+        self.creds = creds
+        self.id_col = id_col
+        self.name_col = name_col
+        self.block_rows = block_rows
+        self.interval = interval
+        self._modified_time = None
+        self._blocks = []  # [(checksum, {professional_id: full_name})]
+        self._lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run(), name="names-refresher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    async def refresh(self, force=False) -> int:
+        """Brings the lookup up to date. Returns the number of entries that changed."""
+        async with self._lock:
+            modified_time = None
+            if self.creds is not None:
+                try:
+                    modified_time = await sheet_gateway.call(
+                        get_spreadsheet_modified_time, self.creds, self.worksheet.spreadsheet.id, quota=None)
+                except Exception as e:
+                    logger.warning(f"Could not read spreadsheet modifiedTime, comparing checksums instead: {e}")
+                if not force and modified_time is not None and modified_time == self._modified_time:
+                    return 0
+
+            ids, names = await self._fetch_columns()
+            changed = self._apply(ids, names)
+            self._modified_time = modified_time
+            if changed:
+                logger.info(f"Professional names refreshed: {changed} entr(y/ies) changed, {len(self.lookup)} total.")
+            return changed
+
+    async def _fetch_columns(self):
+        ranges = [f"{self.id_col}2:{self.id_col}", f"{self.name_col}2:{self.name_col}"]
+        id_range, name_range = await sheet_gateway.call(self.worksheet.batch_get, ranges, major_dimension="COLUMNS")
+        ids = id_range[0] if id_range else []
+        names = name_range[0] if name_range else []
+        return ids, names
+
+    def _apply(self, ids, names):
+        rows = len(ids)
+        names = list(names[:rows]) + [""] * (rows - len(names))
+        blocks = []
+        replaced = {}  # entries of blocks that changed or disappeared
+        parsed = {}    # entries of blocks that changed
+        for block_idx, start in enumerate(range(0, rows, self.block_rows)):
+            block_ids = [str(v) for v in ids[start:start + self.block_rows]]
+            block_names = [str(v) for v in names[start:start + self.block_rows]]
+            checksum = zlib.crc32("\x1f".join(block_ids + ["\x1e"] + block_names).encode("utf-8"))
+            previous = self._blocks[block_idx] if block_idx < len(self._blocks) else None
+            if previous is not None and previous[0] == checksum:
+                blocks.append(previous)
+                continue
+            entries = {}
+            for pro_id, pro_name in zip(block_ids, block_names):
+                pro_id = pro_id.strip()
+                if pro_id:  # Only add if professional ID is not empty
+                    entries[pro_id] = pro_name.strip()
+            blocks.append((checksum, entries))
+            parsed.update(entries)
+            if previous is not None:
+                replaced.update(previous[1])
+        for _, entries in self._blocks[len(blocks):]:
+            replaced.update(entries)
+        self._blocks = blocks
+
+        changed = 0
+        for pro_id in replaced.keys() - parsed.keys():
+            if self.lookup.pop(pro_id, None) is not None:
+                changed += 1
+        for pro_id, pro_name in parsed.items():
+            if self.lookup.get(pro_id) != pro_name:
+                self.lookup[pro_id] = pro_name
+                changed += 1
+        return changed
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set():
+                return
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing professional names: {e}", exc_info=True)
@@ -0,0 +1,197 @@
+# process_monitor.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psutil
+
+MONITOR_INTERVAL = float(os.environ.get("MONITOR_INTERVAL", "10"))
+# Samples kept per child (360 x 10 s = the last hour).
+MONITOR_HISTORY = int(os.environ.get("MONITOR_HISTORY", "360"))
+MONITOR_HOST = os.environ.get("MONITOR_HOST", "127.0.0.1")
+MONITOR_PORT = int(os.environ.get("MONITOR_PORT", "8083"))
+# RSS growth that raises an alert, fitted over the last MONITOR_SLOPE_WINDOW samples.
+MEMORY_SLOPE_ALERT_MB_PER_HOUR = float(os.environ.get("MEMORY_SLOPE_ALERT_MB_PER_HOUR", "50"))
+MONITOR_SLOPE_WINDOW = int(os.environ.get("MONITOR_SLOPE_WINDOW", "30"))
+# A one-line summary per child this often, instead of a line every sample.
+MONITOR_LOG_INTERVAL = float(os.environ.get("MONITOR_LOG_INTERVAL", "600"))
+
+
+def memory_slope(samples):
+    """Least-squares RSS growth in MB/hour over [{"t", "rss_mb"}], or None with fewer than 2 samples."""
+    if len(samples) < 2:
+        return None
+    n = len(samples)
+    mean_t = sum(s["t"] for s in samples) / n
+    mean_rss = sum(s["rss_mb"] for s in samples) / n
+    var_t = sum((s["t"] - mean_t) ** 2 for s in samples)
+    if var_t == 0:
+        return None
+    cov = sum((s["t"] - mean_t) * (s["rss_mb"] - mean_rss) for s in samples)
+    return cov / var_t * 3600
+
+
+class ProcessMonitor:
+    """
+    Samples each supervised child process (with its own children, e.g. the
+    gunicorn workers) every MONITOR_INTERVAL seconds: RSS, CPU %, open file
+    descriptors and threads. Samples go into a per-child ring buffer of
+    MONITOR_HISTORY entries, served as JSON on MONITOR_HOST:MONITOR_PORT
+    (GET /processes?limit=N). An RSS slope above
+    MEMORY_SLOPE_ALERT_MB_PER_HOUR logs a "[MONITOR ALERT]" line.
+
+    `children` is a callable returning {name: pid} for the running children;
+    the optional `status` callable adds its dict to the JSON as "supervisor".
+    """
+
+    def __init__(self, children, interval=MONITOR_INTERVAL, history=MONITOR_HISTORY, status=None):
+        self.children = children
+        self.status = status
+        self.interval = interval
+        self.history = history
+        self._samples = {}    # name -> deque of samples
+        self._processes = {}  # pid -> psutil.Process, kept so cpu_percent() measures between samples
+        self._alerting = set()
+        self._last_log = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+
+    # --- Sampling -----------------------------------------------------------
+
+    def _process(self, pid):
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+            process.cpu_percent(None)  # first call only primes the counter
+        return process
+
+    def sample_child(self, name, pid):
+        try:
+            root = self._process(pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        sample = {"t": round(time.time(), 3), "pid": pid, "processes": 0,
+                  "rss_mb": 0.0, "cpu_percent": 0.0, "fds": 0, "threads": 0}
+        for proc in tree:
+            try:
+                proc = self._process(proc.pid)
+                with proc.oneshot():
+                    sample["rss_mb"] += proc.memory_info().rss / (1024 * 1024)
+                    sample["cpu_percent"] += proc.cpu_percent(None)
+                    sample["fds"] += proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+                    sample["threads"] += proc.num_threads()
+                sample["processes"] += 1
+            except psutil.Error:
+                continue  # exited between listing and sampling
+        sample["rss_mb"] = round(sample["rss_mb"], 1)
+        sample["cpu_percent"] = round(sample["cpu_percent"], 1)
+        return sample
+
+    def sample(self):
+        children = self.children()
+        for name, pid in children.items():
+            sample = self.sample_child(name, pid)
+            if sample is None:
+                continue
+            with self._lock:
+                samples = self._samples.setdefault(name, deque(maxlen=self.history))
+                samples.append(sample)
+                recent = list(samples)[-MONITOR_SLOPE_WINDOW:]
+            self._check_memory(name, recent)
+        live = set()
+        for pid in children.values():
+            try:
+                live.update([pid] + [p.pid for p in self._process(pid).children(recursive=True)])
+            except psutil.Error:
+                pass
+        for pid in set(self._processes) - live:
+            del self._processes[pid]
+
+    def _check_memory(self, name, recent):
+        slope = memory_slope(recent) if len(recent) >= MONITOR_SLOPE_WINDOW else None
+        if slope is not None and slope > MEMORY_SLOPE_ALERT_MB_PER_HOUR:
+            if name not in self._alerting:
+                self._alerting.add(name)
+                logging.warning(f"[MONITOR ALERT] {name} RSS growing {slope:.1f} MB/h over the last "
+                                f"{len(recent)} samples (now {recent[-1]['rss_mb']} MB, "
+                                f"threshold {MEMORY_SLOPE_ALERT_MB_PER_HOUR} MB/h)")
+        elif name in self._alerting:
+            self._alerting.discard(name)
+            logging.info(f"[MONITOR] {name} memory growth back under {MEMORY_SLOPE_ALERT_MB_PER_HOUR} MB/h")
+
+    def _log_summary(self):
+        with self._lock:
+            latest = {name: samples[-1] for name, samples in self._samples.items() if samples}
+        for name, s in latest.items():
+            logging.info(f"[MONITOR] {name} pid={s['pid']} RSS={s['rss_mb']}MB CPU={s['cpu_percent']}% "
+                         f"fds={s['fds']} threads={s['threads']} processes={s['processes']}")
+
+    def run(self):
+        """Samples until stop(); meant for a daemon thread."""
+        while not self._stop.is_set():
+            try:
+                self.sample()
+                if time.monotonic() - self._last_log >= MONITOR_LOG_INTERVAL:
+                    self._last_log = time.monotonic()
+                    self._log_summary()
+            except Exception as e:
+                logging.error(f"[MONITOR ERROR] {e}", exc_info=True)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # --- HTTP ---------------------------------------------------------------
+
+    def snapshot(self, limit=None) -> dict:
+        with self._lock:
+            history = {name: list(samples) for name, samples in self._samples.items()}
+        children = {}
+        for name, samples in history.items():
+            children[name] = {
+                "latest": samples[-1] if samples else None,
+                "rss_slope_mb_per_hour": memory_slope(samples[-MONITOR_SLOPE_WINDOW:]),
+                "alert": name in self._alerting,
+                "samples": samples[-limit:] if limit else samples,
+            }
+        snapshot = {"interval": self.interval, "history": self.history, "children": children}
+        if self.status is not None:
+            snapshot["supervisor"] = self.status()
+        return snapshot
+
+    def serve(self, host=MONITOR_HOST, port=MONITOR_PORT):
+        """Starts the JSON endpoint on a daemon thread."""
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path not in ("/", "/processes"):
+                    self.send_error(404)
+                    return
+                limit = parse_qs(url.query).get("limit", [""])[0]
+                body = json.dumps(monitor.snapshot(int(limit) if limit.isdigit() else None)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of log.txt
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="monitor-http", daemon=True).start()
+        logging.info(f"[MONITOR] Process samples served on http://{host}:{port}/processes")
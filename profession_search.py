@@ -0,0 +1,209 @@
+# profession_search.py
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+
+from geo_index import normalize_profession
+
+logger = logging.getLogger(__name__)
+
+# Minimum trigram similarity (Dice coefficient, 0..1) for a profession to match,
+# and for a query to pull in a synonym group.
+PROFESSION_MATCH_THRESHOLD = float(os.environ.get("PROFESSION_MATCH_THRESHOLD", "0.45"))
+PROFESSION_SYNONYM_THRESHOLD = float(os.environ.get("PROFESSION_SYNONYM_THRESHOLD", "0.6"))
+
+# Ethiopic letters that are pronounced the same in Amharic and used
+# interchangeably: each series is folded onto the first one (ሐ/ኀ -> ሀ, ሠ -> ሰ,
+# ዐ -> አ, ፀ -> ጸ). Only the seven basic orders are folded.
+_ETHIOPIC_SERIES_FOLD = {0x1210: 0x1200, 0x1280: 0x1200, 0x1220: 0x1230, 0x12D0: 0x12A0, 0x1340: 0x1338}
+_ETHIOPIC_FOLD = {
+    series + order: canonical + order
+    for series, canonical in _ETHIOPIC_SERIES_FOLD.items()
+    for order in range(7)
+}
+# Ethiopic word space and punctuation (፡ ። ፣ ፤ ፥ ፦ ፧ ፨) separate words.
+_ETHIOPIC_FOLD.update({cp: ord(" ") for cp in range(0x1361, 0x1369)})
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+# Generic words ("professional", "worker", ...) that would make unrelated
+# professions look alike. Dropped unless they are all a profession consists of.
+_GENERIC_WORDS = {"ባለሙያ", "ሙያተኛ", "ሰራተኛ", "professional", "worker", "expert", "specialist"}
+_AMHARIC_GENITIVE = "የ"  # "የቧምቧ ባለሙያ" -> "ቧምቧ"
+
+# Amharic <-> English profession terms. A query matching any term of a group
+# is also matched against the other terms of that group.
+PROFESSION_SYNONYMS = [
+    ["plumber", "plumbing", "የቧምቧ ባለሙያ", "ቧምቧ ሰራተኛ", "የቧንቧ ባለሙያ", "ቧንቧ ሰራተኛ"],
+    ["electrician", "electrical technician", "ኤሌክትሪሺያን", "የኤሌክትሪክ ባለሙያ", "የኤሌክትሪክ ሰራተኛ"],
+    ["civil engineer", "ሲቪል ኢንጂነር", "ሲቪል መሀንዲስ"],
+    ["engineer", "ኢንጂነር", "መሀንዲስ"],
+    ["architect", "አርክቴክት"],
+    ["carpenter", "woodworker", "አናጺ", "የእንጨት ሰራተኛ"],
+    ["mason", "builder", "construction worker", "ግንበኛ", "የግንባታ ሰራተኛ"],
+    ["painter", "ቀለም ቀቢ", "ቀለም ቀቢያ"],
+    ["welder", "metal worker", "በያጅ", "ብየዳ", "የብረት ሰራተኛ"],
+    ["tiler", "ceramic", "ሴራሚክ", "ሴራሚክ ነጣፊ"],
+    ["mechanic", "መካኒክ", "የመኪና ጥገና"],
+    ["driver", "ሹፌር", "አሽከርካሪ"],
+    ["tailor", "ልብስ ሰፊ", "ስፌት"],
+    ["barber", "hairdresser", "ጸጉር አስተካካይ", "ፀጉር ቤት"],
+    ["teacher", "tutor", "መምህር", "አስተማሪ"],
+    ["doctor", "physician", "ሀኪም", "ዶክተር"],
+    ["nurse", "ነርስ"],
+    ["cook", "chef", "ምግብ አብሳይ", "ሼፍ"],
+    ["cleaner", "janitor", "ጽዳት ሰራተኛ"],
+    ["guard", "security guard", "ጥበቃ", "ዘበኛ"],
+    ["gardener", "አትክልተኛ"],
+    ["accountant", "አካውንታንት", "ሂሳብ ሰራተኛ"],
+    ["lawyer", "ጠበቃ"],
+    ["photographer", "ፎቶ አንሺ", "ፎቶግራፈር"],
+    ["programmer", "developer", "software engineer", "ፕሮግራመር"],
+    ["satellite dish installer", "dish", "ዲሽ ገጣሚ"],
+]
+
+
+def normalize_text(text) -> str:
+    """Casefolds, NFC-normalizes and folds Ethiopic homophone letters and punctuation."""
+    text = unicodedata.normalize("NFC", str(text or "")).casefold().translate(_ETHIOPIC_FOLD)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def _key_words(text):
+    words = [word[1:] if word.startswith(_AMHARIC_GENITIVE) and len(word) > 2 else word
+             for word in normalize_text(text).split()]
+    return [word for word in words if word not in _GENERIC_WORDS] or words
+
+
+def trigrams(text) -> set:
+    """pg_trgm-style trigrams of the key words, each padded with two leading and one trailing space."""
+    grams = set()
+    for word in _key_words(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class ProfessionIndex:
+    """
+    Trigram inverted index over the PROFESSION column.
+
+    Distinct professions are indexed once (many professionals share one), so a
+    search touches only the posting lists of the query's trigrams. Queries are
+    expanded through PROFESSION_SYNONYMS, so "plumber" also finds "የቧምቧ
+    ባለሙያ". update_from_record can be registered as a
+    registry_store.RegistryStore listener to keep the index current.
+    """
+
+    def __init__(self, synonyms=PROFESSION_SYNONYMS, threshold=PROFESSION_MATCH_THRESHOLD,
+                 synonym_threshold=PROFESSION_SYNONYM_THRESHOLD):
+        self.threshold = threshold
+        self.synonym_threshold = synonym_threshold
+        self._postings = {}     # trigram -> {profession}
+        self._grams = {}        # profession -> trigram set
+        self._members = {}      # profession -> {user_id}
+        self._profession_of = {}  # user_id -> profession
+        self._synonym_terms = []     # [(group index, trigram set)]
+        self._synonym_groups = []    # group index -> [trigram set]
+        self._synonym_postings = {}  # trigram -> [synonym term index]
+        for group_idx, group in enumerate(synonyms):
+            self._synonym_groups.append([trigrams(term) for term in group])
+            for grams in self._synonym_groups[-1]:
+                for gram in grams:
+                    self._synonym_postings.setdefault(gram, []).append(len(self._synonym_terms))
+                self._synonym_terms.append((group_idx, grams))
+
+    def __len__(self):
+        return len(self._profession_of)
+
+    # --- Maintenance --------------------------------------------------------
+
+    def upsert(self, user_id, profession):
+        user_id = str(user_id)
+        profession = normalize_profession(profession)
+        if self._profession_of.get(user_id) == profession:
+            return
+        self.remove(user_id)
+        if not profession:
+            return
+        if profession not in self._members:
+            grams = trigrams(profession)
+            self._grams[profession] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(profession)
+            self._members[profession] = set()
+        self._members[profession].add(user_id)
+        self._profession_of[user_id] = profession
+
+    def remove(self, user_id):
+        profession = self._profession_of.pop(str(user_id), None)
+        if profession is None:
+            return
+        members = self._members[profession]
+        members.discard(str(user_id))
+        if members:
+            return
+        del self._members[profession]
+        for gram in self._grams.pop(profession):
+            postings = self._postings[gram]
+            postings.discard(profession)
+            if not postings:
+                del self._postings[gram]
+
+    def update_from_record(self, user_id, record):
+        """RegistryStore listener: (re)indexes a professional's profession, or drops them."""
+        if record:
+            self.upsert(user_id, record.get("PROFESSION", ""))
+        else:
+            self.remove(user_id)
+
+    def load(self, records):
+        """Indexes [(user_id, record)], e.g. RegistryStore.all_records()."""
+        for user_id, record in records:
+            self.update_from_record(user_id, record)
+        logger.info(f"Profession index loaded {len(self)} professional(s), {len(self._members)} distinct profession(s).")
+
+    # --- Queries ------------------------------------------------------------
+
+    def _expand(self, query_grams):
+        """The query plus every term of each synonym group one of whose terms it matches."""
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self._synonym_postings.get(gram, ()))
+        groups = set()
+        for term_idx, shared in overlap.items():
+            group_idx, grams = self._synonym_terms[term_idx]
+            if 2 * shared / (len(query_grams) + len(grams)) >= self.synonym_threshold:
+                groups.add(group_idx)
+        expanded = [query_grams]
+        for group_idx in sorted(groups):
+            expanded.extend(self._synonym_groups[group_idx])
+        return expanded
+
+    def search(self, query, limit=10):
+        """Returns [(profession, score)] best first, score being the best trigram similarity over the expanded query."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        scores = {}
+        for grams in self._expand(query_grams):
+            overlap = Counter()
+            for gram in grams:
+                for profession in self._postings.get(gram, ()):
+                    overlap[profession] += 1
+            for profession, shared in overlap.items():
+                score = 2 * shared / (len(grams) + len(self._grams[profession]))
+                if score >= self.threshold and score > scores.get(profession, 0.0):
+                    scores[profession] = score
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def professionals(self, query, limit=20):
+        """Returns [(user_id, score)] of professionals whose profession matches query, best first."""
+        results = []
+        for profession, score in self.search(query, limit=limit):
+            results.extend((user_id, score) for user_id in sorted(self._members[profession]))
+            if len(results) >= limit:
+                break
+        return results[:limit]
@@ -0,0 +1,184 @@
+# profiler.py
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from bot_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DEFAULT_SECONDS = float(os.environ.get("PROFILE_DEFAULT_SECONDS", "30"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+# Wall-clock stack sampler period (5 ms = 200 samples/s per thread)
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Spans and functions listed in the text summary
+PROFILE_SUMMARY_ROWS = int(os.environ.get("PROFILE_SUMMARY_ROWS", "15"))
+
+MODES = ("stack", "cprofile")
+
+
+def window_seconds(seconds) -> float:
+    """The length a profiling window of `seconds` actually runs for (1s..PROFILE_MAX_SECONDS)."""
+    return max(1.0, min(float(seconds), PROFILE_MAX_SECONDS))
+
+
+def _label(filename, lineno, name) -> str:
+    # ';' separates frames in the collapsed format (the count follows the last space)
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ":")
+
+
+def collapse_frame(frame) -> str:
+    """'root;...;leaf' for a frame and its callers."""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def collapse_cprofile(profile) -> Counter:
+    """
+    cProfile keeps caller -> callee edges rather than whole stacks, so each
+    function's own time is emitted under each of its callers ("caller;callee",
+    in microseconds). Good enough to spot hot functions and who calls them.
+    """
+    folded = Counter()
+    for (filename, lineno, name), (_, _, own_time, _, callers) in pstats.Stats(profile).stats.items():
+        callee = _label(filename, lineno, name)
+        if not callers:
+            folded[callee] += int(own_time * 1_000_000)
+        for (c_filename, c_lineno, c_name), (_, _, caller_own_time, _) in callers.items():
+            folded[f"{_label(c_filename, c_lineno, c_name)};{callee}"] += int(caller_own_time * 1_000_000)
+    return folded
+
+
+class SpanStats:
+    """Per (kind, name) count, total, max and errors of the handler/external-call spans seen while profiling."""
+
+    def __init__(self):
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, name, seconds, outcome):
+        with self._lock:
+            span = self._spans.setdefault((kind, name), [0, 0.0, 0.0, 0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+            span[3] += outcome != "ok"
+
+    def lines(self, limit=PROFILE_SUMMARY_ROWS):
+        with self._lock:
+            spans = sorted(self._spans.items(), key=lambda item: item[1][1], reverse=True)
+        return [f"{kind}:{name} n={count} total={total:.2f}s max={peak * 1000:.0f}ms"
+                + (f" errors={errors}" if errors else "")
+                for (kind, name), (count, total, peak, errors) in spans[:limit]]
+
+
+class StackSampler:
+    """
+    Samples the stack of every thread (except its own) every `interval`
+    seconds from a daemon thread. Wall-clock: time spent waiting (Sheets calls
+    in executor threads, the event loop idling in select) shows up too.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[f"{names.get(thread_id, thread_id)};{collapse_frame(frame)}"] += 1
+            self.samples += 1
+
+
+class Profiler:
+    """
+    One profiling window at a time, started from the event loop (the admin
+    /profiling command): "stack" runs the wall-clock StackSampler over all
+    threads, "cprofile" runs cProfile on the event loop thread (handlers and
+    everything else on the loop; executor threads are not included). Either
+    way the handler and external-call spans recorded by bot_metrics during the
+    window are summarised as well.
+    """
+
+    def __init__(self):
+        self._running = False
+
+    @property
+    def busy(self) -> bool:
+        return self._running
+
+    async def run(self, mode="stack", seconds=PROFILE_DEFAULT_SECONDS, interval=PROFILE_SAMPLE_INTERVAL):
+        """Profiles for `seconds`; returns (collapsed stacks text, summary text)."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}' (use {' or '.join(MODES)})")
+        if self._running:
+            raise RuntimeError("A profiling window is already running")
+        seconds = window_seconds(seconds)
+        self._running = True
+        spans = SpanStats()
+        metrics.add_span_listener(spans)
+        sampler, profile = None, None
+        started = time.monotonic()
+        logger.info(f"Profiling ({mode}) for {seconds:.0f}s.")
+        try:
+            if mode == "stack":
+                sampler = StackSampler(interval)
+                sampler.start()
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                if sampler is not None:
+                    folded = sampler.stop()
+                else:
+                    profile.disable()
+                    folded = collapse_cprofile(profile)
+        finally:
+            metrics.remove_span_listener(spans)
+            self._running = False
+        elapsed = time.monotonic() - started
+
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in folded.most_common() if count > 0)
+        if sampler is not None:
+            header = f"Stack samples: {sampler.samples} every {interval * 1000:.0f} ms over {elapsed:.1f}s"
+        else:
+            header = f"cProfile of the event loop thread over {elapsed:.1f}s (counts are microseconds)"
+        summary = [header, "", "Slowest spans (by total time):"] + (spans.lines() or ["none"])
+        if profile is not None:
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_SUMMARY_ROWS)
+            summary += ["", stream.getvalue().strip()]
+        logger.info(f"Profiling ({mode}) finished: {len(folded)} distinct stacks.")
+        return collapsed, "\n".join(summary)
+
+
+# Shared by the admin command; there is one event loop per bot process.
+profiler = Profiler()
@@ -0,0 +1,291 @@
+# registry_store.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DB_PATH = os.environ.get("REGISTRY_DB_PATH", "muya_registry.db")
+# The local databases only outlive a restart if their paths point at storage
+# that outlives the host. A Heroku dyno's filesystem does not: it is wiped on
+# every dyno restart, deploy and daily cycle, so there they only survive the
+# child restarts done by the entrypoint.py supervisor. Set this to 1 once the
+# paths point at durable storage to silence the startup warning.
+LOCAL_STATE_DURABLE = os.environ.get("LOCAL_STATE_DURABLE", "").lower() in ("1", "true", "yes")
+
+# Column headers of the registration sheet (A..K). Replaced by the real header
+# row as soon as the sheet has been pulled once.
+DEFAULT_HEADER = [
+    "User ID", "Username", "Full_Name", "PROFESSION", "PHONE", "LOCATION",
+    "Region/City/Woreda", "CONFIRM_DELETE", "COMMENT", "Testimonials", "Educational Docs",
+]
+USER_ID_HEADER = "User ID"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS professionals (
+    user_id TEXT PRIMARY KEY,
+    cells TEXT NOT NULL,                 -- JSON list of the row's cells, column A first
+    version INTEGER NOT NULL DEFAULT 1,  -- bumped on every local change
+    dirty INTEGER NOT NULL DEFAULT 0,    -- 1: local change not yet pushed to the sheet
+    deleted INTEGER NOT NULL DEFAULT 0,  -- 1: deleted locally, sheet row not yet removed
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cells TEXT NOT NULL,
+    replicated INTEGER NOT NULL DEFAULT 0,  -- 0: pending, 1: in the sheet, 2: append outcome unknown
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requests_pending ON requests (replicated, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def warn_if_ephemeral(path, what, env_name) -> bool:
+    """Logs a warning when path is on a Heroku dyno's filesystem (see LOCAL_STATE_DURABLE)."""
+    if not os.environ.get("DYNO") or LOCAL_STATE_DURABLE:
+        return False
+    logger.warning(f"'{path}' is on the dyno's ephemeral filesystem: {what} will be lost when the dyno "
+                   f"restarts, redeploys or cycles. Point {env_name} at durable storage and set LOCAL_STATE_DURABLE=1.")
+    return True
+
+
+class RegistryStore:
+    """
+    Local SQLite (WAL) store that serves every registry and request read/write.
+
+    Google Sheets is kept as a replica by sheet_replicator.SheetReplicator:
+    local changes are flagged dirty and pushed in the background, and edits
+    staff make directly in the sheet are pulled back in for rows that have no
+    pending local change.
+
+    Changes not pushed yet exist only in the database file, so they survive a
+    restart only when `path` is on durable storage (see LOCAL_STATE_DURABLE).
+
+    Listeners registered with add_listener(fn) are called as fn(user_id, record)
+    after every change to a professional (record is None when it was deleted),
+    whether it came from a handler or from a pull.
+    """
+
+    def __init__(self, path=REGISTRY_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+        self.header = json.loads(row[0]) if row else list(DEFAULT_HEADER)
+        self._listeners = []
+        logger.info(f"Registry store opened at '{path}' (WAL mode).")
+        warn_if_ephemeral(path, "changes not yet pushed to the sheet", "REGISTRY_DB_PATH / REQUESTS_DB_PATH")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def _notify(self, user_id, record):
+        for fn in self._listeners:
+            try:
+                fn(user_id, record)
+            except Exception as e:
+                logger.error(f"Registry store listener {fn} failed for user {user_id}: {e}", exc_info=True)
+
+    def to_record(self, cells):
+        """Turns a list of cells into a dict keyed by the sheet header."""
+        return {name: (cells[i] if i < len(cells) else "") for i, name in enumerate(self.header) if name}
+
+    # --- Professionals ------------------------------------------------------
+
+    def get(self, user_id):
+        """Returns the professional's record (dict keyed by header) or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cells FROM professionals WHERE user_id = ? AND deleted = 0", (str(user_id),)
+            ).fetchone()
+        return self.to_record(json.loads(row[0])) if row else None
+
+    def all_records(self):
+        """Returns [(user_id, record)] for every registered professional."""
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, cells FROM professionals WHERE deleted = 0").fetchall()
+        return [(user_id, self.to_record(json.loads(cells))) for user_id, cells in rows]
+
+    def upsert(self, user_id, cells):
+        """Creates or replaces a professional's full row (column A first)."""
+        user_id = str(user_id)
+        cells = [str(c) if c is not None else "" for c in cells]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO professionals (user_id, cells, dirty, deleted, updated_at) VALUES (?, ?, 1, 0, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET cells = excluded.cells, version = version + 1, "
+                "dirty = 1, deleted = 0, updated_at = excluded.updated_at",
+                (user_id, json.dumps(cells, ensure_ascii=False), time.time()),
+            )
+        self._notify(user_id, self.to_record(cells))
+
+    def update_cell(self, user_id, col_idx: int, value):
+        """Updates one cell (0-based column index). Returns False if the user is unknown."""
+        user_id = str(user_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cells FROM professionals WHERE user_id = ? AND deleted = 0", (user_id,)
+            ).fetchone()
+            if not row:
+                return False
+            cells = json.loads(row[0])
+            cells.extend([""] * (col_idx + 1 - len(cells)))
+            cells[col_idx] = "" if value is None else str(value)
+            self._conn.execute(
+                "UPDATE professionals SET cells = ?, version = version + 1, dirty = 1, updated_at = ? WHERE user_id = ?",
+                (json.dumps(cells, ensure_ascii=False), time.time(), user_id),
+            )
+        self._notify(user_id, self.to_record(cells))
+        return True
+
+    def delete(self, user_id):
+        """Deletes a professional. Returns False if the user is unknown."""
+        user_id = str(user_id)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE professionals SET deleted = 1, version = version + 1, dirty = 1, updated_at = ? "
+                "WHERE user_id = ? AND deleted = 0",
+                (time.time(), user_id),
+            )
+        if cursor.rowcount:
+            self._notify(user_id, None)
+        return bool(cursor.rowcount)
+
+    def dirty_rows(self):
+        """Returns [(user_id, cells, deleted, version)] for changes not yet in the sheet."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, cells, deleted, version FROM professionals WHERE dirty = 1 ORDER BY updated_at"
+            ).fetchall()
+        return [(user_id, json.loads(cells), bool(deleted), version) for user_id, cells, deleted, version in rows]
+
+    def mark_pushed(self, user_id, version):
+        """Clears the dirty flag unless the row changed again since `version` was read."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM professionals WHERE user_id = ? AND version = ? AND deleted = 1", (user_id, version))
+            self._conn.execute(
+                "UPDATE professionals SET dirty = 0 WHERE user_id = ? AND version = ?", (user_id, version))
+
+    def apply_remote(self, all_values):
+        """
+        Merges a get_all_values() snapshot of the sheet into the store.
+        Rows with a pending local change are left alone (they will be pushed);
+        every other row is made to match the sheet, including rows staff
+        deleted there. Returns the number of professionals that changed.
+        """
+        if not all_values:
+            return 0
+        header = list(all_values[0])
+        if header and header != self.header:
+            self.header = header
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('header', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (json.dumps(header, ensure_ascii=False),),
+                )
+        try:
+            id_col = header.index(USER_ID_HEADER)
+        except ValueError:
+            logger.error(f"Sheet header has no '{USER_ID_HEADER}' column; skipping pull.")
+            return 0
+
+        remote = {}
+        for values in all_values[1:]:
+            user_id = str(values[id_col]).strip() if id_col < len(values) else ""
+            if user_id:
+                remote[user_id] = [str(v) for v in values]
+
+        changed = []
+        with self._lock:
+            local = {
+                user_id: (json.loads(cells), dirty)
+                for user_id, cells, dirty in self._conn.execute(
+                    "SELECT user_id, cells, dirty FROM professionals WHERE deleted = 0")
+            }
+            pending_deletes = {
+                user_id for (user_id,) in self._conn.execute(
+                    "SELECT user_id FROM professionals WHERE deleted = 1")
+            }
+            self._conn.execute("BEGIN")
+            try:
+                for user_id, cells in remote.items():
+                    if user_id in pending_deletes:
+                        continue
+                    current = local.get(user_id)
+                    if current is not None and (current[1] or current[0] == cells):
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO professionals (user_id, cells, dirty, deleted, updated_at) VALUES (?, ?, 0, 0, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET cells = excluded.cells, version = version + 1, "
+                        "updated_at = excluded.updated_at",
+                        (user_id, json.dumps(cells, ensure_ascii=False), time.time()),
+                    )
+                    changed.append((user_id, cells))
+                for user_id, (cells, dirty) in local.items():
+                    if not dirty and user_id not in remote:
+                        self._conn.execute("DELETE FROM professionals WHERE user_id = ?", (user_id,))
+                        changed.append((user_id, None))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for user_id, cells in changed:
+            self._notify(user_id, self.to_record(cells) if cells is not None else None)
+        return len(changed)
+
+    # --- Requests (Mrequests.py) ------------------------------------------
+
+    def add_request(self, cells):
+        """Stores a professional request / complaint row. Returns its local id."""
+        cells = [str(c) if c is not None else "" for c in cells]
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO requests (cells, created_at) VALUES (?, ?)",
+                (json.dumps(cells, ensure_ascii=False), time.time()),
+            )
+        return cursor.lastrowid
+
+    def pending_requests(self, limit=100):
+        """Returns [(id, cells)] of requests not yet in the sheet, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, cells FROM requests WHERE replicated = 0 ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(request_id, json.loads(cells)) for request_id, cells in rows]
+
+    def mark_requests_replicated(self, request_ids):
+        self._set_requests_state(request_ids, 1)
+
+    def requests_in_doubt(self):
+        """Returns [(id, cells)] of requests whose append failed ambiguously (may or may not be in the sheet)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, cells FROM requests WHERE replicated = 2 ORDER BY id").fetchall()
+        return [(request_id, json.loads(cells)) for request_id, cells in rows]
+
+    def mark_requests_in_doubt(self, request_ids):
+        self._set_requests_state(request_ids, 2)
+
+    def mark_requests_pending(self, request_ids):
+        self._set_requests_state(request_ids, 0)
+
+    def _set_requests_state(self, request_ids, state):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE requests SET replicated = ? WHERE id = ?", [(state, i) for i in request_ids])
@@ -0,0 +1,318 @@
+# replay.py
+#
+# Replays a recording made by update_recorder.py (RECORD_UPDATES_DIR) through
+# one or two builds of Debo_registration.py / Mrequests.py, each in its own
+# process against the fake services of benchmark.py, and reports how their
+# handler outcomes and replies diverge and how per-handler latency changed.
+#
+#   python replay.py recordings/Debo_registration.jsonl.gz --speed 10
+#   git show HEAD~3:Debo_registration.py > /tmp/Debo_registration.py
+#   python replay.py recordings/Debo_registration.jsonl.gz --speed max \
+#       --build before=/tmp/Debo_registration.py --build after=Debo_registration.py
+#
+# A build is a path to the bot's module file. Modules next to it (e.g. in a
+# `git worktree`) take precedence over this tree's, so whole-tree versions can
+# be compared as well as single-file changes.
+import argparse
+import asyncio
+import contextvars
+import functools
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import add_fake_arguments, install_fakes, isolated_environment, latency_summary, running
+
+BOTS = ("Debo_registration", "Mrequests")
+# Bot API methods whose calls (and texts) are part of an update's outcome
+_REPLY_PREFIXES = ("send", "edit", "answer", "delete")
+# Divergent updates listed in the report
+REPLAY_MAX_EXAMPLES = 10
+
+# What the update being replayed has done so far; handlers and Bot API calls append to it
+_current_trace = contextvars.ContextVar("replay_trace", default=None)
+
+
+def parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded updates against one or two bot builds.")
+    parser.add_argument("recording", help="a recording written by update_recorder.py")
+    parser.add_argument("--bot", choices=BOTS, help="bot the recording belongs to (default: from the recording)")
+    parser.add_argument("--build", action="append", default=[], metavar="[NAME=]PATH",
+                        help="bot module file to replay against; give two to compare (default: this tree's)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 10 (x recorded pace) or max")
+    parser.add_argument("--max-gap", type=float, default=60.0,
+                        help="longest recorded pause (seconds) kept, e.g. across restarts")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N updates")
+    add_fake_arguments(parser)
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)  # internal: run one build, write its results here
+    return parser.parse_args(argv)
+
+
+# --- Replaying one build (child process) ------------------------------------------
+
+
+def load_build(bot_name, path):
+    """Imports the bot module from path under its usual name."""
+    spec = importlib.util.spec_from_file_location(bot_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[bot_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def trace_handlers(application):
+    """Wraps every handler in group >= 0 to note its name and outcome in the current trace."""
+    from bot_metrics import leaf_handlers
+
+    def traced(callback, name):
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            trace = _current_trace.get()
+            try:
+                result = await callback(update, context)
+            except Exception as e:
+                if trace is not None:
+                    trace["handlers"].append([name, f"error: {type(e).__name__}"])
+                raise
+            if trace is not None:
+                trace["handlers"].append([name, "ok"])
+            return result
+        return wrapper
+
+    for group, handler in leaf_handlers(application):
+        if group >= 0:  # skip health tracking and the recorder itself
+            handler.callback = traced(handler.callback, getattr(handler.callback, "__name__", type(handler).__name__))
+
+
+def tracing_request(latency):
+    from fake_services import FakeBotRequest
+
+    class TracingBotRequest(FakeBotRequest):
+        """FakeBotRequest that also notes replies in the trace of the update being replayed."""
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            result = await super().do_request(url, method, request_data, **kwargs)
+            api_method = url.rsplit("/", 1)[-1]
+            trace = _current_trace.get()
+            if trace is not None and api_method.startswith(_REPLY_PREFIXES):
+                params = request_data.parameters if request_data is not None else {}
+                trace["replies"].append([api_method, params.get("text")])
+            return result
+
+    return TracingBotRequest(latency=latency)
+
+
+def summarize_update(data):
+    """Short description of a recorded update for the report."""
+    for kind in ("message", "edited_message", "callback_query", "my_chat_member"):
+        if kind in data:
+            payload = data[kind]
+            if kind == "callback_query":
+                return f"callback {payload.get('data')!r}"
+            for field in ("text", "caption"):
+                if payload.get(field):
+                    return f"{kind} {payload[field][:40]!r}"
+            for field in ("location", "document", "photo", "contact"):
+                if field in payload:
+                    return f"{kind} [{field}]"
+            return kind
+    return next((key for key in data if key != "update_id"), "update")
+
+
+async def replay(args, bot_name, build_path, entries):
+    from telegram import Update
+
+    backend = install_fakes(args)
+    module = load_build(bot_name, build_path)
+    logging.getLogger().setLevel(args.log_level.upper())
+    telegram = tracing_request(args.telegram_latency)
+    application = module.build_application(request=telegram)
+    trace_handlers(application)
+
+    traces = []
+    latencies = {}
+    behind = 0.0
+    async with running(application):
+        started = time.monotonic()
+        first_ts = entries[0][0] if entries else 0.0
+        offset, previous_ts = 0.0, first_ts
+        for ts, data in entries:
+            offset += min(ts - previous_ts, args.max_gap)
+            previous_ts = ts
+            if args.speed is not None:
+                delay = started + offset / args.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    behind = max(behind, -delay)
+            trace = {"update": summarize_update(data), "handlers": [], "replies": []}
+            token = _current_trace.set(trace)
+            update_started = time.perf_counter()
+            try:
+                # Both bots process updates one at a time, so the replay does too
+                await application.process_update(Update.de_json(data, application.bot))
+            except Exception as e:
+                trace["exception"] = repr(e)
+            finally:
+                _current_trace.reset(token)
+            elapsed = time.perf_counter() - update_started
+            trace["ms"] = round(elapsed * 1000, 2)
+            step = trace["handlers"][0][0] if trace["handlers"] else "(unhandled)"
+            latencies.setdefault(step, []).append(elapsed)
+            traces.append(trace)
+        elapsed = time.monotonic() - started
+    return {
+        "build": build_path,
+        "bot": bot_name,
+        "updates": len(traces),
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(traces) / elapsed, 1) if elapsed else None,
+        "max_behind_schedule_s": round(behind, 3),
+        "handlers": {step: latency_summary(samples) for step, samples in sorted(latencies.items())},
+        "external_calls": dict(sorted((backend.calls + telegram.calls).items())),
+        "traces": traces,
+    }
+
+
+def run_child(args):
+    from update_recorder import read_recording
+
+    bot_name, build_path = args.bot, os.path.abspath(args.build[0])
+    entries = list(read_recording(os.path.abspath(args.recording)))[:args.limit]
+    # Modules next to the build win over this tree's (see the header comment)
+    sys.path.insert(0, os.path.dirname(build_path))
+    with isolated_environment():
+        results = asyncio.run(replay(args, bot_name, build_path, entries))
+    with open(args.child_out, "w") as f:
+        json.dump(results, f, ensure_ascii=False)
+
+
+# --- Comparing builds ---------------------------------------------------------------
+
+
+def run_build(argv, name, path, workdir):
+    """Replays in a fresh process so the builds share no module state."""
+    out = os.path.join(workdir, f"{name}.json")
+    command = [sys.executable, os.path.abspath(__file__), *argv, "--build", path, "--child-out", out]
+    print(f"Replaying against {name} ({path})...", flush=True)
+    subprocess.run(command, check=True)
+    with open(out) as f:
+        return json.load(f)
+
+
+def strip_build_args(argv):
+    """argv without --build/--json and their values."""
+    result, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in ("--build", "--json", "--child-out"):
+            skip = True
+            continue
+        if arg.startswith(("--build=", "--json=", "--child-out=")):
+            continue
+        result.append(arg)
+    return result
+
+
+def divergences(base, other):
+    """Indexes (with both traces) of updates whose handlers or replies differ."""
+    found = []
+    for i, (a, b) in enumerate(zip(base["traces"], other["traces"])):
+        if a["handlers"] != b["handlers"] or a["replies"] != b["replies"] or a.get("exception") != b.get("exception"):
+            found.append((i, a, b))
+    return found
+
+
+def _pct(now, before):
+    return f"{(now - before) / before * 100:+.0f}%" if before else ""
+
+
+def print_report(runs, out=sys.stdout):
+    for name, result in runs:
+        print(f"\n== {name}: {result['updates']} updates in {result['seconds']}s = "
+              f"{result['updates_per_second']} updates/s (at most {result['max_behind_schedule_s']}s behind schedule)",
+              file=out)
+    if len(runs) == 1:
+        name, result = runs[0]
+        print(f"   {'handler':<32}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+        for step, summary in result["handlers"].items():
+            print(f"   {step:<32}{summary['count']:>7}{summary['p50_ms']:>10}{summary['p99_ms']:>10}"
+                  f"{summary['max_ms']:>10}", file=out)
+        return
+    (base_name, base), (other_name, other) = runs[:2]
+    print(f"\n== Latency by first handler: {base_name} -> {other_name}", file=out)
+    print(f"   {'handler':<32}{'count':>7}{'p50 ms':>18}{'p99 ms':>18}{'delta p50':>11}", file=out)
+    for step in sorted(set(base["handlers"]) | set(other["handlers"])):
+        a, b = base["handlers"].get(step), other["handlers"].get(step)
+        if a and b:
+            print(f"   {step:<32}{b['count']:>7}{a['p50_ms']:>8} -> {b['p50_ms']:<6}{a['p99_ms']:>8} -> {b['p99_ms']:<6}"
+                  f"{_pct(b['p50_ms'], a['p50_ms']):>11}", file=out)
+        else:
+            print(f"   {step:<32}{(b or a)['count']:>7}   only in {other_name if b else base_name}", file=out)
+    found = divergences(base, other)
+    print(f"\n== Divergence: {len(found)} of {min(base['updates'], other['updates'])} updates differ", file=out)
+    for i, a, b in found[:REPLAY_MAX_EXAMPLES]:
+        print(f"   #{i} {a['update']}", file=out)
+        print(f"      {base_name}: {a['handlers']} {a.get('exception', '')}", file=out)
+        print(f"      {other_name}: {b['handlers']} {b.get('exception', '')}", file=out)
+        if a["replies"] != b["replies"]:
+            print(f"      replies: {a['replies']} -> {b['replies']}", file=out)
+    if len(found) > REPLAY_MAX_EXAMPLES:
+        print(f"   ... and {len(found) - REPLAY_MAX_EXAMPLES} more (see --json)", file=out)
+    calls = sorted(set(base["external_calls"]) | set(other["external_calls"]))
+    changed = [f"{c}: {base['external_calls'].get(c, 0)} -> {other['external_calls'].get(c, 0)}" for c in calls
+               if base["external_calls"].get(c, 0) != other["external_calls"].get(c, 0)]
+    print(f"\n== External calls that changed: {', '.join(changed) or 'none'}", file=out)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.bot is None:
+        from update_recorder import read_sessions
+        bots = {session["bot"] for session in read_sessions(args.recording)}
+        if len(bots) != 1:
+            sys.exit(f"Cannot tell which bot {args.recording} belongs to ({bots or 'no sessions'}); pass --bot")
+        args.bot = bots.pop()
+    if args.child_out:
+        run_child(args)
+        return
+
+    builds = []
+    for i, spec in enumerate(args.build or [os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{args.bot}.py")]):
+        name, _, path = spec.rpartition("=")
+        builds.append((name or ("base" if i == 0 else f"build{i}"), path))
+    if len(builds) > 2:
+        sys.exit("Give at most two --build options")
+    child_argv = strip_build_args(argv) + ["--bot", args.bot]
+    with tempfile.TemporaryDirectory(prefix="muya-replay-") as workdir:
+        runs = [(name, run_build(child_argv, name, path, workdir)) for name, path in builds]
+    print_report(runs)
+    if args.json_path:
+        report = {"builds": dict(runs)}
+        if len(runs) == 2:
+            report["divergent_updates"] = [i for i, _, _ in divergences(runs[0][1], runs[1][1])]
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
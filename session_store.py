@@ -0,0 +1,102 @@
+# session_store.py
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_SESSION_TTL = float(os.environ.get("FEEDBACK_SESSION_TTL", str(3 * 24 * 3600)))
+FEEDBACK_SESSION_MAX_ENTRIES = int(os.environ.get("FEEDBACK_SESSION_MAX_ENTRIES", "10000"))
+
+_MISSING = object()
+
+
+class SessionStore:
+    """
+    Bounded, dict-like session store with a per-entry TTL and LRU eviction.
+
+    Every read or write of a key refreshes its TTL and moves it to the back, so
+    entries are always ordered by expiry: expired sessions are dropped from the
+    front (lazily, on access and on insert) and, once `max_entries` is reached,
+    the least recently used session is evicted to make room.
+
+    Counters for size, hits, misses, expirations and LRU evictions are exposed
+    through stats().
+    """
+
+    def __init__(self, ttl=FEEDBACK_SESSION_TTL, max_entries=FEEDBACK_SESSION_MAX_ENTRIES, name="sessions"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge_expired(self, now):
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+            self.expired += 1
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        self._purge_expired(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        self._entries[key] = (now + self.ttl, entry[1])
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        self._purge_expired(now)
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self.evicted += 1
+            logger.info(f"{self.name}: evicted least recently used session {evicted_key} (store full).")
+        self._entries[key] = (now + self.ttl, value)
+
+    def __contains__(self, key):
+        self._purge_expired(time.monotonic())
+        return key in self._entries
+
+    def __delitem__(self, key):
+        del self._entries[key]
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def __len__(self):
+        self._purge_expired(time.monotonic())
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,180 @@
+# sheet_gateway.py
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot_metrics import external_call, metrics, status_of
+
+logger = logging.getLogger(__name__)
+
+SHEETS_MAX_WORKERS = int(os.environ.get("SHEETS_MAX_WORKERS", "4"))
+SHEETS_CALL_TIMEOUT = float(os.environ.get("SHEETS_CALL_TIMEOUT", "30"))
+# Sheets API quota is 60 read and 60 write requests per minute per user, and
+# both bots share one service account: each process gets half by default.
+SHEETS_READS_PER_MINUTE = float(os.environ.get("SHEETS_READS_PER_MINUTE", "30"))
+SHEETS_WRITES_PER_MINUTE = float(os.environ.get("SHEETS_WRITES_PER_MINUTE", "30"))
+SHEETS_BUCKET_BURST = float(os.environ.get("SHEETS_BUCKET_BURST", "10"))
+# 429/503 responses are retried with exponential backoff (with jitter).
+SHEETS_MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+SHEETS_BACKOFF_BASE = float(os.environ.get("SHEETS_BACKOFF_BASE", "1"))
+SHEETS_BACKOFF_MAX = float(os.environ.get("SHEETS_BACKOFF_MAX", "64"))
+RETRYABLE_STATUSES = {429, 503}
+
+# gspread methods that count against the write quota; every other call is a read.
+WRITE_METHODS = {
+    "update", "batch_update", "update_cell", "update_cells", "update_acell", "append_row", "append_rows",
+    "insert_row", "insert_rows", "delete_rows", "delete_columns", "clear", "batch_clear", "format",
+    "values_update", "values_append", "values_clear", "values_batch_update",
+}
+
+
+class SheetCallTimeout(Exception):
+    """
+    Raised when a gspread call does not finish within its timeout. `future` is
+    the call's concurrent.futures.Future: cancelled if the call never started,
+    otherwise it settles when the call eventually returns.
+    """
+
+    def __init__(self, message, future=None):
+        super().__init__(message)
+        self.future = future
+
+
+class TokenBucket:
+    """
+    Request budget refilled at per_minute/60 tokens per second, holding up to
+    burst tokens. acquire() waits for a token; callers are served in FIFO
+    order because they queue on an asyncio.Lock.
+    """
+
+    def __init__(self, per_minute, burst=SHEETS_BUCKET_BURST):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+        self.waiting = 0
+
+    def level(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._tokens
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                tokens = self.level()
+                if tokens < 1:
+                    await asyncio.sleep((1 - tokens) / self.rate)
+                    self.level()
+                self._tokens -= 1
+        finally:
+            self.waiting -= 1
+
+
+class SheetGateway:
+    """
+    Runs blocking gspread calls on a bounded thread pool so they never stall the
+    asyncio event loop that serves every user's conversation.
+
+    Every call has a timeout (SHEETS_CALL_TIMEOUT seconds by default). When the
+    awaiting coroutine times out or is cancelled, a call that has not started yet
+    is dropped from the pool queue. A call that is already running cannot be
+    interrupted, so its result is discarded when it eventually returns.
+
+    Calls draw from a read or a write TokenBucket sized to the Sheets quota,
+    so a burst waits its turn instead of failing with 429. A 429 or 503 that
+    still comes back is retried with exponential backoff up to
+    SHEETS_MAX_RETRIES times.
+    """
+
+    def __init__(self, max_workers=SHEETS_MAX_WORKERS, timeout=SHEETS_CALL_TIMEOUT,
+                 reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.buckets = {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sheets")
+        return self._executor
+
+    async def call(self, fn, *args, timeout=None, quota="auto", retry_on=RETRYABLE_STATUSES, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the pool and awaits its result.
+
+        quota is "read" or "write" (the bucket the call draws from), "auto" to
+        pick it from fn's name, or None for calls that are not Sheets API
+        requests (authorization, Drive). retry_on is the set of HTTP statuses
+        retried with backoff; non-idempotent callers (appends) pass {429} only,
+        since a 503 may come back after the write was applied.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        method = getattr(fn, "__name__", type(fn).__name__)
+        if quota == "auto":
+            quota = "write" if method in WRITE_METHODS else "read"
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            if quota is not None:
+                await self.buckets[quota].acquire()
+            future = self._get_executor().submit(functools.partial(fn, *args, **kwargs))
+            try:
+                with external_call("sheets", method):
+                    return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                name = getattr(fn, "__qualname__", repr(fn))
+                logger.error(f"Sheets call {name} timed out after {timeout}s.")
+                raise SheetCallTimeout(f"Sheets call {name} timed out after {timeout}s", future) from None
+            except Exception as e:
+                status = status_of(e)
+                if status not in retry_on or attempt == SHEETS_MAX_RETRIES:
+                    raise
+                delay = min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f"Sheets call {method} got HTTP {status}; retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1}/{SHEETS_MAX_RETRIES}).")
+                await asyncio.sleep(delay)
+
+    def shutdown(self):
+        """Stops the worker threads. Calls still queued are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # --- gspread Worksheet shortcuts -----------------------------------------
+
+    async def get_all_values(self, worksheet, **kwargs):
+        return await self.call(worksheet.get_all_values, **kwargs)
+
+    async def get_all_records(self, worksheet, **kwargs):
+        return await self.call(worksheet.get_all_records, **kwargs)
+
+    async def update(self, worksheet, *args, **kwargs):
+        return await self.call(worksheet.update, *args, **kwargs)
+
+    async def batch_update(self, worksheet, data, **kwargs):
+        return await self.call(worksheet.batch_update, data, **kwargs)
+
+    async def append_row(self, worksheet, values, **kwargs):
+        return await self.call(worksheet.append_row, values, **kwargs)
+
+    async def append_rows(self, worksheet, values, **kwargs):
+        return await self.call(worksheet.append_rows, values, **kwargs)
+
+    async def delete_rows(self, worksheet, start_index, end_index=None):
+        return await self.call(worksheet.delete_rows, start_index, end_index)
+
+
+# Shared gateway used by both bots.
+sheet_gateway = SheetGateway()
+for _quota, _bucket in sheet_gateway.buckets.items():
+    metrics.add_gauge(f"sheets_{_quota}_tokens", f"Sheets {_quota} requests available right now.", _bucket.level)
+    metrics.add_gauge(f"sheets_{_quota}_waiting", f"Callers queued for a Sheets {_quota} token.",
+                      lambda bucket=_bucket: bucket.waiting)
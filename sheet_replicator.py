@@ -0,0 +1,224 @@
+# sheet_replicator.py
+import asyncio
+import logging
+import os
+import time
+
+from bot_metrics import status_of
+from sheet_gateway import sheet_gateway
+from user_index import column_index_to_letter
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PUSH_INTERVAL = float(os.environ.get("REGISTRY_PUSH_INTERVAL", "1"))
+REGISTRY_PULL_INTERVAL = float(os.environ.get("REGISTRY_PULL_INTERVAL", "60"))
+REQUESTS_PUSH_BATCH = int(os.environ.get("REQUESTS_PUSH_BATCH", "100"))
+# After a new request, wait this long so requests from concurrent users share one append_rows call.
+REQUESTS_PUSH_DELAY = float(os.environ.get("REQUESTS_PUSH_DELAY", "0.5"))
+# A failed requests push is retried after 1, 2, 4, ... seconds, up to this many.
+REQUESTS_RETRY_MAX = float(os.environ.get("REQUESTS_RETRY_MAX", "60"))
+# Request rows' User ID, Username and timestamp columns: read back to tell
+# whether an append whose outcome is unknown reached the sheet.
+REQUESTS_KEY_RANGE = "I:K"
+REQUESTS_KEY_COLUMNS = slice(8, 11)
+
+
+class SheetReplicator:
+    """
+    Keeps Google Sheets as an asynchronous replica of a registry_store.RegistryStore.
+
+    - push: dirty professionals are written to `worksheet` through the
+      write-behind queue (update_row / append_row / delete_row, rows resolved
+      through the user index), and pending requests are appended to
+      `requests_worksheet` with append_rows, oldest first and one batch at a
+      time. An append that fails ambiguously (timeout, 5xx, dropped
+      connection) may still have been applied, so its requests are flagged in
+      doubt and nothing else is appended until the sheet's last rows show
+      whether they landed; only those that did not are sent again. Each
+      request thus ends up in the sheet once, in submission order.
+    - pull: every REGISTRY_PULL_INTERVAL seconds one get_all_values() of
+      `worksheet` refreshes the user index and merges staff edits into the
+      store. Rows with a local change that has not been pushed yet win over the
+      sheet until they are pushed.
+
+    Either worksheet may be None; each bot replicates only the data it owns.
+    """
+
+    def __init__(self, store, worksheet=None, writer=None, index=None, requests_worksheet=None,
+                 push_interval=REGISTRY_PUSH_INTERVAL, pull_interval=REGISTRY_PULL_INTERVAL):
+        self.store = store
+        self.worksheet = worksheet
+        self.writer = writer
+        self.index = index
+        self.requests_worksheet = requests_worksheet
+        self.push_interval = push_interval
+        self.pull_interval = pull_interval
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._in_flight = None  # concurrent Future of a timed-out append that may still be running
+        self._requests_retry_at = 0.0
+        self._requests_backoff = 0.0
+        store.add_listener(lambda user_id, record: self.notify())
+
+    def notify(self):
+        """Asks the background task to push soon (called on every store change)."""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="sheet-replicator")
+
+    async def stop(self):
+        """Stops the background task after a final push."""
+        if self._task is not None:
+            # Stop via a flag rather than cancel(): wait_for() in _run can swallow
+            # a cancellation that races with the wakeup event.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._requests_retry_at = 0.0
+        try:
+            await self.push()
+        except Exception as e:
+            logger.error(f"Final replication push failed: {e}", exc_info=True)
+
+    async def pull(self):
+        """Refreshes the user index and the store from the sheet. Returns the raw values."""
+        if self.worksheet is None:
+            return None
+        async with self._lock:
+            return await self._pull_locked()
+
+    async def push(self):
+        async with self._lock:
+            if self.worksheet is not None and self.writer is not None:
+                await self._push_professionals()
+            if self.requests_worksheet is not None and time.monotonic() >= self._requests_retry_at:
+                try:
+                    await self._push_requests()
+                except Exception:
+                    self._requests_backoff = min(REQUESTS_RETRY_MAX, max(1.0, self._requests_backoff * 2))
+                    self._requests_retry_at = time.monotonic() + self._requests_backoff
+                    raise
+                self._requests_backoff = 0.0
+
+    # --- Internals ----------------------------------------------------------
+
+    async def _pull_locked(self):
+        if self.writer is not None:
+            await self.writer.flush()
+        all_values = await sheet_gateway.get_all_values(self.worksheet)
+        if self.index is not None:
+            self.index.load_values(all_values)
+        changed = self.store.apply_remote(all_values)
+        if changed:
+            logger.info(f"Pulled {changed} changed professional(s) from sheet '{self.worksheet.title}'.")
+        return all_values
+
+    async def _push_professionals(self):
+        rows = self.store.dirty_rows()
+        if not rows:
+            return
+        if self.index is not None and not self.index.is_loaded:
+            await self._pull_locked()
+        results = await asyncio.gather(*(self._push_one(*row) for row in rows), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, BaseException)]
+        if failed:
+            logger.error(f"{len(failed)} of {len(rows)} professional change(s) failed to replicate: {failed[0]}")
+        else:
+            logger.info(f"Replicated {len(rows)} professional change(s) to the sheet.")
+
+    async def _push_one(self, user_id, cells, deleted, version):
+        # Resolve the row and enqueue without awaiting in between, so row numbers
+        # stay consistent with the deletes/appends queued by the other rows.
+        row_idx, _ = self.index.get(user_id)
+        if deleted:
+            if row_idx:
+                await self.writer.delete_row(row_idx)
+        elif row_idx:
+            await self.writer.update_row(row_idx, cells, last_col=column_index_to_letter(len(cells) - 1))
+        else:
+            await self.writer.append_row(cells)
+        self.store.mark_pushed(user_id, version)
+
+    async def _push_requests(self):
+        if not await self._settle_requests():
+            return
+        while True:
+            pending = self.store.pending_requests(limit=REQUESTS_PUSH_BATCH)
+            if not pending:
+                return
+            request_ids = [request_id for request_id, _ in pending]
+            try:
+                # 429 means nothing was written; any other failure may come after the append was applied
+                await sheet_gateway.append_rows(self.requests_worksheet, [cells for _, cells in pending], retry_on={429})
+            except Exception as e:
+                status = status_of(e)
+                if status is None or status >= 500:
+                    self.store.mark_requests_in_doubt(request_ids)
+                    self._in_flight = getattr(e, "future", None)
+                    logger.warning(f"Append of {len(pending)} request(s) failed with an unknown outcome; "
+                                   f"checking the sheet before sending them again: {e}")
+                raise
+            self.store.mark_requests_replicated(request_ids)
+            logger.info(f"Replicated {len(pending)} request(s) to sheet '{self.requests_worksheet.title}'.")
+
+    async def _settle_requests(self):
+        """
+        Decides whether the requests of an ambiguously failed append are in the
+        sheet. Returns False while that cannot be told yet (the timed-out call
+        is still running), so no later request is appended before them.
+        """
+        in_doubt = self.store.requests_in_doubt()
+        if not in_doubt:
+            return True
+        request_ids = [request_id for request_id, _ in in_doubt]
+        in_flight, self._in_flight = self._in_flight, None
+        if in_flight is not None:
+            if not in_flight.done():
+                self._in_flight = in_flight
+                return False
+            if in_flight.cancelled():
+                # Dropped from the pool queue before it started: nothing was sent
+                self.store.mark_requests_pending(request_ids)
+                return True
+            if in_flight.exception() is None:
+                self.store.mark_requests_replicated(request_ids)
+                logger.info(f"Timed-out append of {len(in_doubt)} request(s) completed after all.")
+                return True
+        sheet_rows = (await sheet_gateway.call(self.requests_worksheet.batch_get, [REQUESTS_KEY_RANGE]))[0]
+        tail = [list(row) + [""] * (3 - len(row)) for row in sheet_rows[-len(in_doubt):]]
+        if tail == [cells[REQUESTS_KEY_COLUMNS] for _, cells in in_doubt]:
+            self.store.mark_requests_replicated(request_ids)
+            logger.warning(f"{len(in_doubt)} request(s) from a failed append are in the sheet; not sending them again.")
+        else:
+            self.store.mark_requests_pending(request_ids)
+            logger.info(f"{len(in_doubt)} request(s) from a failed append are not in the sheet; sending them again.")
+        return True
+
+    async def _run(self):
+        last_pull = time.monotonic()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.push_interval)
+                if self.requests_worksheet is not None and not self._stopping:
+                    await asyncio.sleep(REQUESTS_PUSH_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                await self.push()
+            except Exception as e:
+                logger.error(f"Replication push failed: {e}", exc_info=True)
+            if self.worksheet is not None and time.monotonic() - last_pull >= self.pull_interval:
+                last_pull = time.monotonic()
+                try:
+                    await self.pull()
+                except Exception as e:
+                    logger.error(f"Replication pull failed: {e}", exc_info=True)
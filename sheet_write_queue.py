@@ -0,0 +1,216 @@
+# sheet_write_queue.py
+import asyncio
+import logging
+import os
+import time
+
+from sheet_gateway import RETRYABLE_STATUSES, SheetCallTimeout, sheet_gateway
+
+logger = logging.getLogger(__name__)
+
+SHEET_WRITE_BATCH_SIZE = int(os.environ.get("SHEET_WRITE_BATCH_SIZE", "50"))
+SHEET_WRITE_MAX_DELAY = float(os.environ.get("SHEET_WRITE_MAX_DELAY", "0.5"))
+
+# Mutation kinds. Consecutive mutations of the same kind are merged into one request.
+_UPDATE = "update"
+_APPEND = "append"
+_DELETE = "delete"
+
+
+class SheetWriteQueue:
+    """
+    Write-behind queue for Google Sheets mutations.
+
+    Handlers enqueue cell/row updates, appends and row deletes and await the
+    returned result. Pending mutations are flushed when SHEET_WRITE_BATCH_SIZE
+    are waiting or the oldest one is SHEET_WRITE_MAX_DELAY seconds old. A flush
+    keeps submission order and merges each run of consecutive same-kind
+    mutations into one request:
+      - updates -> worksheet.batch_update
+      - appends -> worksheet.append_rows
+      - deletes -> one spreadsheet batch_update of deleteDimension requests
+
+    If an index is given (see user_index.UserIndex) it is updated when a mutation
+    is enqueued, so row numbers computed by later handlers already account for
+    pending appends/deletes. Any failed flush invalidates the index.
+
+    An append or delete run that times out keeps running on the gateway
+    thread, so the queue waits for its real outcome before writing anything
+    else: reporting it failed while it can still land would have the caller
+    append the rows again, or a later delete hit a shifted row.
+    """
+
+    def __init__(self, worksheet, index=None, batch_size=SHEET_WRITE_BATCH_SIZE, max_delay=SHEET_WRITE_MAX_DELAY):
+        self.worksheet = worksheet
+        self.index = index
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending = []  # [(kind, payload, future, enqueued_at)]
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    # --- Public API -------------------------------------------------------
+
+    async def update_cell(self, row_idx: int, col_letter: str, value):
+        """Queues a single-cell update and waits until it has been written."""
+        if self.index is not None:
+            self.index.set_cell(row_idx, col_letter, value)
+        return await self._submit(_UPDATE, {"range": f"{col_letter}{row_idx}", "values": [[value]]})
+
+    async def update_row(self, row_idx: int, values: list, last_col: str = "K"):
+        """Queues a full-row update (A..last_col) and waits until it has been written."""
+        if self.index is not None:
+            self.index.set_row(row_idx, values)
+        return await self._submit(_UPDATE, {"range": f"A{row_idx}:{last_col}{row_idx}", "values": [values]})
+
+    async def append_row(self, values: list):
+        """Queues a row append and waits until it has been written."""
+        if self.index is not None:
+            self.index.append(values)
+        return await self._submit(_APPEND, values)
+
+    async def delete_row(self, row_idx: int):
+        """Queues a row delete and waits until it has been applied."""
+        if self.index is not None:
+            self.index.delete_row(row_idx)
+        return await self._submit(_DELETE, row_idx)
+
+    def start(self):
+        """Starts the background flusher. Must be called from the running event loop."""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="sheet-write-queue")
+
+    async def stop(self):
+        """Stops the background flusher after writing everything still pending."""
+        if self._task is not None:
+            # Stop via a flag rather than cancel(): wait_for() in _run can swallow
+            # a cancellation that races with the wakeup event.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Writes all pending mutations now."""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if batch:
+                await self._write(batch)
+
+    def __len__(self):
+        return len(self._pending)
+
+    # --- Internals --------------------------------------------------------
+
+    async def _submit(self, kind, payload):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((kind, payload, future, time.monotonic()))
+        self._wakeup.set()
+        if self._task is None:
+            # No background flusher (e.g. before start()): write through immediately.
+            await self.flush()
+        return await future
+
+    async def _run(self):
+        while not self._stopping:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending and not self._stopping:
+                age = time.monotonic() - self._pending[0][3]
+                if len(self._pending) >= self.batch_size or age >= self.max_delay:
+                    try:
+                        await self.flush()
+                    except Exception as e:  # _write already reported to waiters
+                        logger.error(f"Sheet write queue flush failed: {e}", exc_info=True)
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay - age)
+                    self._wakeup.clear()
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _write(self, batch):
+        # Split into runs of consecutive same-kind mutations to preserve ordering.
+        runs = []
+        for item in batch:
+            if runs and runs[-1][0][0] == item[0]:
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+
+        failed_with = None
+        for run in runs:
+            futures = [item[2] for item in run]
+            if failed_with is not None:
+                # An earlier append/delete failed, so row numbers computed after it
+                # are no longer trustworthy. Fail the rest of the batch as well.
+                self._resolve(futures, error=failed_with)
+                continue
+            kind = run[0][0]
+            payloads = [item[1] for item in run]
+            try:
+                await self._apply(kind, payloads)
+                self._resolve(futures)
+                logger.info(f"Sheet write queue flushed {len(payloads)} {kind} mutation(s).")
+            except Exception as e:
+                logger.error(f"Sheet write queue failed to apply {len(payloads)} {kind} mutation(s): {e}", exc_info=True)
+                if self.index is not None:
+                    self.index.invalidate()
+                self._resolve(futures, error=e)
+                if kind != _UPDATE:
+                    failed_with = e
+
+    async def _apply(self, kind, payloads):
+        try:
+            # Updates are idempotent. A 503 on an append or delete may come after it
+            # was applied, and retrying would duplicate the rows or delete a shifted row.
+            await sheet_gateway.call(self._execute, kind, payloads, quota="write",
+                                     retry_on=RETRYABLE_STATUSES if kind == _UPDATE else {429})
+        except SheetCallTimeout as e:
+            if kind == _UPDATE or e.future is None:
+                raise
+            await self._settle(kind, len(payloads), e)
+
+    async def _settle(self, kind, count, timeout_error):
+        """Waits for a timed-out append/delete run; returns if it was applied, raises otherwise."""
+        outcome = asyncio.wrap_future(timeout_error.future)
+        while True:
+            done, _ = await asyncio.wait([outcome], timeout=sheet_gateway.timeout)
+            if done:
+                break
+            logger.warning(f"Still waiting for a timed-out {kind} of {count} row(s); holding back later writes.")
+        if outcome.cancelled():
+            raise timeout_error  # dropped before it started: nothing was written
+        if outcome.exception() is not None:
+            raise outcome.exception()
+        logger.warning(f"Timed-out {kind} of {count} row(s) completed after all.")
+
+    def _execute(self, kind, payloads):
+        if kind == _UPDATE:
+            self.worksheet.batch_update(payloads)
+        elif kind == _APPEND:
+            self.worksheet.append_rows(payloads)
+        elif kind == _DELETE:
+            self.worksheet.spreadsheet.batch_update({"requests": [
+                {"deleteDimension": {"range": {
+                    "sheetId": self.worksheet.id,
+                    "dimension": "ROWS",
+                    "startIndex": row_idx - 1,
+                    "endIndex": row_idx,
+                }}}
+                for row_idx in payloads
+            ]})
+
+    @staticmethod
+    def _resolve(futures, error=None):
+        for future in futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
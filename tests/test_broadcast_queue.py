@@ -0,0 +1,39 @@
+# tests/test_broadcast_queue.py
+import asyncio
+
+from telegram.error import NetworkError, TimedOut
+
+from broadcast_queue import BroadcastQueue
+
+
+def flaky_send(calls, chat_id, *failures):
+    """An async send that raises the next of failures on each call, then succeeds."""
+    failures = list(failures)
+
+    async def send():
+        calls.append(chat_id)
+        if failures:
+            raise failures.pop(0)
+
+    return send
+
+
+def run(jobs):
+    queue = BroadcastQueue(global_rate=1000, per_chat_interval=0.0, workers=2, max_retries=3)
+    return asyncio.run(queue.run(jobs))
+
+
+def test_timed_out_send_is_not_resent():
+    calls = []
+    report = run([(1, flaky_send(calls, 1, TimedOut())), (2, flaky_send(calls, 2))])
+    assert calls.count(1) == 1
+    assert report["sent"] == 1 and report["failed"] == [] and report["retries"] == 0
+    assert [chat_id for chat_id, _ in report["unknown"]] == [1]
+
+
+def test_network_error_is_retried():
+    calls = []
+    report = run([(1, flaky_send(calls, 1, NetworkError("connection reset")))])
+    assert calls == [1, 1]
+    assert report["sent"] == 1 and report["retries"] == 1
+    assert report["failed"] == [] and report["unknown"] == []
@@ -0,0 +1,68 @@
+# tests/test_drive_uploader.py
+import asyncio
+
+import drive_uploader
+from drive_uploader import DriveUploader
+
+
+class FakeFile:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+    async def download_to_memory(self, out):
+        out.write(self.file_id.encode())
+
+
+class FakeBot:
+    async def get_file(self, file_id):
+        await asyncio.sleep(0)
+        return FakeFile(file_id)
+
+
+def test_uploads_queued_before_a_restart_are_resubmitted_first(monkeypatch):
+    uploaded = []
+
+    def upload_to_drive(stream, folder_id, filename, creds):
+        uploaded.append(filename)
+        return f"link:{filename}"
+
+    monkeypatch.setattr(drive_uploader, "upload_to_drive", upload_to_drive)
+    owner = (1, "testimonial_links")
+    bot = FakeBot()
+    # f1-f3 were recorded in the persisted user_data before the restart; their jobs died with the process
+    queued = [[f"f{i}", "folder", f"f{i}"] for i in range(1, 4)]
+
+    async def after_restart():
+        uploader = DriveUploader(creds=None)
+        for name in ("f4", "f5"):
+            queued.append([name, "folder", name])
+            uploader.submit(owner, bot, name, "folder", name)
+        assert uploader.resubmit_lost(owner, bot, queued) == 3
+        assert uploader.resubmit_lost(owner, bot, queued) == 0  # nothing left to recover
+        links, errors = await uploader.collect(owner)
+        await uploader.close()
+        return links, errors
+
+    links, errors = asyncio.run(after_restart())
+    assert errors == []
+    assert links == [f"link:f{i}" for i in range(1, 6)]
+    assert sorted(uploaded) == [f"f{i}" for i in range(1, 6)]  # each file uploaded exactly once
+
+
+def test_nothing_is_resubmitted_without_a_restart(monkeypatch):
+    monkeypatch.setattr(drive_uploader, "upload_to_drive", lambda stream, folder_id, filename, creds: filename)
+    owner = (1, "educational_links")
+    bot = FakeBot()
+
+    async def scenario():
+        uploader = DriveUploader(creds=None)
+        queued = []
+        for name in ("a", "b"):
+            queued.append([name, "folder", name])
+            uploader.submit(owner, bot, name, "folder", name)
+        assert uploader.resubmit_lost(owner, bot, queued) == 0
+        links, _ = await uploader.collect(owner)
+        await uploader.close()
+        return links
+
+    assert asyncio.run(scenario()) == ["a", "b"]
@@ -0,0 +1,215 @@
+# tests/test_sheet_replicator.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+import sheet_replicator
+from fake_services import FakeAPIError, FakeBackend
+from registry_store import RegistryStore
+from sheet_gateway import SheetGateway
+from sheet_replicator import SheetReplicator
+
+
+def request_row(i):
+    # Complaint-shaped row: User ID (I), Username (J) and timestamp (K) identify it
+    return ["", "", "", "", "", "", "", f"comment {i}", str(1000 + i), f"user{i}", f"2026-01-01 00:00:{i:02d}"]
+
+
+def user_ids(worksheet):
+    return [row[8] for row in worksheet.rows]
+
+
+@pytest.fixture(autouse=True)
+def gateway(monkeypatch):
+    gateway = SheetGateway(max_workers=1, timeout=0.2)
+    monkeypatch.setattr(sheet_replicator, "sheet_gateway", gateway)
+    yield gateway
+    gateway.shutdown()
+
+
+@pytest.fixture
+def worksheet():
+    return FakeBackend(sheets_latency=0.0).spreadsheet(title="Requests").sheet1
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RegistryStore(str(tmp_path / "requests.db"))
+    yield store
+    store.close()
+
+
+def flaky_append(worksheet, *failures):
+    """Replaces worksheet.append_rows; each call takes the next of failures (None: behave normally)."""
+    append_rows = worksheet.append_rows
+    failures = list(failures)
+
+    def flaky(values, **kwargs):
+        failure = failures.pop(0) if failures else None
+        if failure == "503-after-write":
+            append_rows(values, **kwargs)
+            raise FakeAPIError(503, "Service unavailable")
+        if failure == "503":
+            raise FakeAPIError(503, "Service unavailable")
+        if failure == "slow":
+            time.sleep(0.5)
+        return append_rows(values, **kwargs)
+
+    flaky.__name__ = "append_rows"
+    worksheet.append_rows = flaky
+
+
+async def push(replicator):
+    """One push as the background task would run it, ignoring the retry backoff."""
+    replicator._requests_retry_at = 0.0
+    try:
+        await replicator.push()
+        return None
+    except Exception as e:
+        return e
+
+
+def add_requests(store, start, count):
+    for i in range(start, start + count):
+        store.add_request(request_row(i))
+
+
+def test_pending_requests_are_appended_in_one_batch(store, worksheet):
+    async def scenario():
+        add_requests(store, 0, 5)
+        assert await push(SheetReplicator(store, requests_worksheet=worksheet)) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == [str(1000 + i) for i in range(5)]
+    assert store.pending_requests() == [] and store.requests_in_doubt() == []
+
+
+def test_503_after_the_write_is_not_resent(store, worksheet):
+    flaky_append(worksheet, "503-after-write")
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        add_requests(store, 0, 3)
+        error = await push(replicator)
+        assert error is not None and len(store.requests_in_doubt()) == 3
+        add_requests(store, 3, 2)
+        assert await push(replicator) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == [str(1000 + i) for i in range(5)]
+
+
+def test_503_before_the_write_is_resent_before_newer_requests(store, worksheet):
+    flaky_append(worksheet, "503")
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        add_requests(store, 0, 3)
+        assert await push(replicator) is not None
+        assert worksheet.rows == []
+        add_requests(store, 3, 2)
+        assert await push(replicator) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == [str(1000 + i) for i in range(5)]
+
+
+def test_read_back_ignores_a_matching_row_that_is_not_at_the_end(store, worksheet):
+    flaky_append(worksheet, "503")
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        add_requests(store, 0, 1)
+        assert await push(replicator) is not None
+        worksheet.rows.extend([request_row(0), request_row(99)])  # same row, but not the sheet's tail
+        assert await push(replicator) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == ["1000", "1099", "1000"]
+
+
+def test_timed_out_append_that_completes_later_is_not_resent(store, worksheet):
+    flaky_append(worksheet, "slow")
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        add_requests(store, 0, 2)
+        assert type(await push(replicator)).__name__ == "SheetCallTimeout"
+        add_requests(store, 2, 1)
+        # Still running: nothing else may be appended before it settles
+        assert await push(replicator) is None
+        assert worksheet.rows == []
+        await asyncio.sleep(0.5)
+        assert await push(replicator) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == ["1000", "1001", "1002"]
+    # Settled from the call's own outcome, without reading the sheet back
+    assert worksheet._backend.calls["sheets.batch_get"] == 0
+
+
+def test_timed_out_append_that_never_started_is_resent(store, worksheet, gateway):
+    release = threading.Event()
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        # Occupy the gateway's only worker so the append times out while still queued
+        blocker = asyncio.ensure_future(gateway.call(release.wait, 2, quota=None, timeout=5))
+        await asyncio.sleep(0.05)
+        add_requests(store, 0, 2)
+        error = await push(replicator)
+        assert type(error).__name__ == "SheetCallTimeout" and error.future.cancelled()
+        release.set()
+        await blocker
+        assert await push(replicator) is None
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == ["1000", "1001"]
+
+
+@pytest.mark.parametrize("landed", [True, False])
+def test_requests_in_doubt_are_settled_after_a_restart(tmp_path, worksheet, landed):
+    path = str(tmp_path / "requests.db")
+    flaky_append(worksheet, "503-after-write" if landed else "503")
+
+    async def before_restart():
+        store = RegistryStore(path)
+        add_requests(store, 0, 2)
+        assert await push(SheetReplicator(store, requests_worksheet=worksheet)) is not None
+        store.close()
+
+    async def after_restart():
+        store = RegistryStore(path)
+        assert len(store.requests_in_doubt()) == 2  # replicated = 2 survived the restart
+        add_requests(store, 2, 1)
+        assert await push(SheetReplicator(store, requests_worksheet=worksheet)) is None
+        assert store.requests_in_doubt() == [] and store.pending_requests() == []
+        store.close()
+
+    asyncio.run(before_restart())
+    asyncio.run(after_restart())
+    assert user_ids(worksheet) == ["1000", "1001", "1002"]
+
+
+def test_failed_push_backs_off(store, worksheet):
+    flaky_append(worksheet, "503", "503")
+
+    async def scenario():
+        replicator = SheetReplicator(store, requests_worksheet=worksheet)
+        add_requests(store, 0, 1)
+        with pytest.raises(FakeAPIError):
+            await replicator.push()
+        first_backoff = replicator._requests_backoff
+        await replicator.push()  # within the backoff: skipped, nothing raised
+        assert worksheet.rows == []
+        replicator._requests_retry_at = 0.0
+        with pytest.raises(FakeAPIError):
+            await replicator.push()  # read-back finds nothing, the resend fails again
+        assert replicator._requests_backoff == 2 * first_backoff
+        assert await push(replicator) is None
+        assert replicator._requests_backoff == 0.0
+
+    asyncio.run(scenario())
+    assert user_ids(worksheet) == ["1000"]
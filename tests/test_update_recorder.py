@@ -0,0 +1,103 @@
+# tests/test_update_recorder.py
+import re
+
+import pytest
+
+from update_recorder import UpdateAnonymizer
+
+PHONES = [
+    "0911234567",
+    "0911 23 45 67",
+    "+251 911 234 567",
+    "0911-234-567",
+    "(011) 123 4567",
+]
+
+
+@pytest.fixture
+def anonymizer():
+    return UpdateAnonymizer(salt="test-salt", keep_texts=["Near Me | ባቅራብያዬ"])
+
+
+def digits(text):
+    return re.sub(r"\D", "", text)
+
+
+@pytest.mark.parametrize("phone", PHONES)
+def test_phone_numbers_are_masked_with_or_without_separators(anonymizer, phone):
+    scrubbed = anonymizer.scrub_text(phone)
+    assert digits(scrubbed) != digits(phone)
+    assert digits(scrubbed)[:3] == digits(phone)[:3]
+    # Same shape: separators stay where they were, so phone validation behaves the same
+    assert re.sub(r"\d", "0", scrubbed) == re.sub(r"\d", "0", phone)
+
+
+def test_phone_inside_text_is_masked(anonymizer):
+    scrubbed = anonymizer.scrub_text("call me on 0911 234 567 please")
+    assert "234 567" not in scrubbed
+    assert scrubbed.startswith("xxxx xx xx 091")
+
+
+def test_same_number_gets_same_mask_whatever_the_separators(anonymizer):
+    assert digits(anonymizer.scrub_text("0911 234 567")) == digits(anonymizer.scrub_text("0911234567"))
+
+
+def test_short_numbers_and_kept_texts_stay(anonymizer):
+    assert anonymizer.scrub_text("I need 3 plumbers, 10 20") == "x xxxx 3 xxxxxxxx, 10 20"
+    assert anonymizer.scrub_text("Near Me | ባቅራብያዬ") == "Near Me | ባቅራብያዬ"
+    assert anonymizer.scrub_text("/profiling stack 30") == "/profiling xxxxx 30"
+
+
+def test_update_names_ids_and_contact_are_anonymized(anonymizer):
+    update = {
+        "update_id": 7,
+        "message": {
+            "message_id": 42,
+            "from": {"id": 401674551, "first_name": "Abebe", "last_name": "Kebede", "username": "abebe_k"},
+            "chat": {"id": 401674551, "type": "private", "first_name": "Abebe"},
+            "text": "+251 911 234 567",
+            "contact": {"phone_number": "+251911234567", "user_id": 401674551},
+            "document": {"file_id": "BQACAgQAAx", "file_unique_id": "AgAD", "file_name": "cv.pdf"},
+            "location": {"latitude": 9.012345, "longitude": 38.761234},
+        },
+    }
+    message = anonymizer.anonymize(update)["message"]
+    user_id = message["from"]["id"]
+    assert user_id != 401674551 and user_id == message["chat"]["id"] == anonymizer.pseudonym(401674551)
+    assert message["message_id"] == 42
+    assert "Abebe" not in str(message) and "abebe_k" not in str(message) and "Kebede" not in str(message)
+    assert "contact" not in message
+    assert message["text"] != "+251 911 234 567" and message["text"].startswith("+251 ")
+    assert message["document"]["file_id"] != "BQACAgQAAx"
+    assert message["document"]["file_name"].endswith(".pdf") and "cv" not in message["document"]["file_name"]
+    assert message["location"] == {"latitude": 9.01, "longitude": 38.76}
+
+    forwarded = anonymizer.anonymize({
+        "message_id": 43,
+        "from": {"id": 401674551, "first_name": "Abebe"},
+        "forward_from": {"id": 512345678, "first_name": "Almaz"},
+        "forward_origin": {"type": "user", "date": 1700000000,
+                           "sender_user": {"id": 512345678, "first_name": "Almaz"}},
+        "via_bot": {"id": 623456789, "is_bot": True, "username": "helper_bot"},
+        "text": "forwarded",
+    })
+    assert forwarded["forward_from"]["id"] == forwarded["forward_origin"]["sender_user"]["id"] \
+        == anonymizer.pseudonym(512345678)
+    assert forwarded["via_bot"]["id"] == anonymizer.pseudonym(623456789)
+    assert "512345678" not in str(forwarded) and "623456789" not in str(forwarded) and "Almaz" not in str(forwarded)
+
+    service = anonymizer.anonymize({
+        "message_id": 44,
+        "chat": {"id": -100123, "type": "supergroup", "title": "Muya"},
+        "new_chat_members": [{"id": 512345678, "first_name": "Almaz"}, {"id": 734567890, "first_name": "Sara"}],
+        "left_chat_member": {"id": 845678901, "first_name": "Dawit"},
+    })
+    assert [member["id"] for member in service["new_chat_members"]] == [
+        anonymizer.pseudonym(512345678), anonymizer.pseudonym(734567890)]
+    assert service["left_chat_member"]["id"] == anonymizer.pseudonym(845678901)
+    assert not any(raw in str(service) for raw in ("512345678", "734567890", "845678901"))
+
+
+def test_pseudonyms_depend_on_the_salt():
+    assert UpdateAnonymizer(salt="a").pseudonym(401674551) != UpdateAnonymizer(salt="b").pseudonym(401674551)
+    assert UpdateAnonymizer(salt="a").pseudonym(-100123) < 0
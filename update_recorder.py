@@ -0,0 +1,207 @@
+# update_recorder.py
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+# When set, each bot appends its incoming updates to {RECORD_UPDATES_DIR}/{bot}.jsonl.gz
+# (replay them with replay.py).
+RECORD_UPDATES_DIR = os.environ.get("RECORD_UPDATES_DIR")
+# Key for the user ID pseudonyms. Keep it stable to link recordings across
+# restarts; without it every recording session gets a random one.
+RECORD_UPDATES_SALT = os.environ.get("RECORD_UPDATES_SALT")
+RECORD_FLUSH_INTERVAL = float(os.environ.get("RECORD_FLUSH_INTERVAL", "5"))
+RECORDING_VERSION = 1
+
+# Keys whose values identify a person, and what replaces them. List items inherit
+# their list's key, so each user in "new_chat_members" counts as an ID parent.
+_ID_PARENTS = {"from", "chat", "user", "from_user", "sender_chat", "new_chat_member", "old_chat_member",
+               "forward_from", "forward_from_chat", "sender_user", "via_bot", "left_chat_member",
+               "new_chat_members"}
+_NAME_KEYS = {"first_name", "last_name", "username", "title", "bio", "invite_link",
+              "forward_sender_name", "sender_user_name"}
+_TEXT_KEYS = {"text", "caption", "query", "address"}
+_HASH_KEYS = {"file_id", "file_unique_id", "chat_instance", "inline_message_id", "vcard"}
+_DROP_KEYS = {"contact", "photo_file", "web_app_data"}
+# Digit runs that may be written with spaces, dashes or parentheses ("0911 23 45 67",
+# "+251 911-234-567"); only those with PHONE_MIN_DIGITS or more digits are masked.
+_LONG_NUMBER_RE = re.compile(r"\+?\d[\d \t()-]{5,}\d")
+PHONE_MIN_DIGITS = 7
+
+
+class UpdateAnonymizer:
+    """
+    Turns Update dicts into something safe to keep on disk while preserving
+    what drives the handlers: user and chat IDs become stable pseudonyms (so
+    conversations still line up), names and file IDs are hashed, locations are
+    snapped to a ~1 km grid, and free text keeps its shape (length, spacing,
+    punctuation, short numbers, phone-number prefixes) with letters masked.
+    Texts listed in keep_texts (keyboard buttons, profession names) and the
+    command word of "/command ..." are kept verbatim.
+    """
+
+    def __init__(self, salt=None, keep_texts=()):
+        self.salt = (salt or secrets.token_hex(16)).encode("utf-8")
+        self.keep_texts = {text.strip().lower() for text in keep_texts if text}
+
+    def _digest(self, value, length=12) -> str:
+        return hmac.new(self.salt, str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:length]
+
+    def pseudonym(self, user_id: int) -> int:
+        """A stable ID in 10^9..2*10^9 (negated for groups), unlikely to collide for a bot's users."""
+        value = 10**9 + int(self._digest(abs(user_id), 15), 16) % 10**9
+        return -value if user_id < 0 else value
+
+    def _mask_number(self, match):
+        number = match.group(0)
+        digits = re.sub(r"\D", "", number)
+        if len(digits) < PHONE_MIN_DIGITS:
+            return number
+        fake = iter(digits[:3] + "".join(str(int(c, 16) % 10) for c in self._digest(digits, len(digits) - 3)))
+        # Keeps the separators and the "+251" / "09" style prefix so phone validation behaves the same
+        return "".join(next(fake) if c.isdigit() else c for c in number)
+
+    def scrub_text(self, text: str) -> str:
+        if text.strip().lower() in self.keep_texts:
+            return text
+        command = ""
+        if text.startswith("/"):
+            command, _, text = text.partition(" ")
+            if not text:
+                return command
+            command += " "
+        text = _LONG_NUMBER_RE.sub(self._mask_number, text)
+        return command + "".join("x" if c.isalpha() else c for c in text)
+
+    def anonymize(self, value, key=None, parent=None):
+        if isinstance(value, dict):
+            return {k: self.anonymize(v, k, key) for k, v in value.items() if k not in _DROP_KEYS}
+        if isinstance(value, list):
+            return [self.anonymize(v, key, parent) for v in value]
+        if key in ("id", "user_id", "chat_id") and isinstance(value, int) and (parent in _ID_PARENTS or key != "id"):
+            return self.pseudonym(value)
+        if isinstance(value, str):
+            if key in _NAME_KEYS:
+                return f"{key}_{self._digest(value, 8)}"
+            if key in _HASH_KEYS:
+                return self._digest(value, 24)
+            if key == "file_name":
+                return f"file_{self._digest(value, 8)}{os.path.splitext(value)[1][:8]}"
+            if key == "phone_number":
+                return _LONG_NUMBER_RE.sub(self._mask_number, value)
+            if key in _TEXT_KEYS:
+                return self.scrub_text(value)
+        if key in ("latitude", "longitude") and isinstance(value, float):
+            return round(value, 2)
+        return value
+
+
+def _open_append(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(".gz"):
+        return gzip.open(path, "at", encoding="utf-8")  # every session becomes one more gzip member
+    return open(path, "a", encoding="utf-8")
+
+
+def read_recording(path):
+    """
+    Yields (timestamp, update dict) from a recording, in order. Timestamps are
+    absolute (session start + offset), so appended sessions stay ordered.
+    """
+    started_at = 0.0
+    for line_number, entry in _entries(path):
+        if "session" in entry:
+            started_at = entry["session"]["started_at"]
+        elif "t" in entry and "u" in entry:
+            yield started_at + entry["t"], entry["u"]
+        else:
+            logger.warning(f"Skipping unexpected line {line_number} of {path}")
+
+
+def read_sessions(path):
+    """The session headers of a recording (bot name, start time, version)."""
+    return [entry["session"] for _, entry in _entries(path) if "session" in entry]
+
+
+def _entries(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    line_number = 0
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable line {line_number} of {path} (truncated write?)")
+    except (EOFError, gzip.BadGzipFile) as e:
+        # The last session of a recorder that was killed ends mid-member
+        logger.warning(f"{path} ends after line {line_number} with an incomplete block: {e}")
+
+
+class UpdateRecorder:
+    """
+    Appends every incoming Update, anonymized (see UpdateAnonymizer), to an
+    append-only JSON-lines file; `.gz` paths are gzip-compressed. Each process
+    start appends a session header ({"session": {...}}) followed by one
+    {"t": seconds since session start, "u": update} line per update. Lines
+    are buffered and flushed every RECORD_FLUSH_INTERVAL seconds and on close.
+
+    Register `record` as a TypeHandler(Update, ...) in a group before every
+    other handler so updates are captured before they are processed.
+    """
+
+    def __init__(self, path, bot_name, keep_texts=(), salt=RECORD_UPDATES_SALT):
+        self.path = path
+        self.bot_name = bot_name
+        self.anonymizer = UpdateAnonymizer(salt=salt, keep_texts=keep_texts)
+        self.recorded = 0
+        self._file = None
+        self._started = None
+        self._last_flush = 0.0
+
+    def _open(self):
+        self._file = _open_append(self.path)
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        header = {"bot": self.bot_name, "started_at": round(time.time(), 3), "version": RECORDING_VERSION}
+        self._file.write(json.dumps({"session": header}, separators=(",", ":")) + "\n")
+        logger.info(f"Recording anonymized updates to {self.path}.")
+
+    async def record(self, update, context):
+        try:
+            if self._file is None:
+                self._open()
+            entry = {"t": round(time.monotonic() - self._started, 3),
+                     "u": self.anonymizer.anonymize(update.to_dict())}
+            self._file.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+            self.recorded += 1
+            if time.monotonic() - self._last_flush >= RECORD_FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = time.monotonic()
+        except Exception as e:
+            # Recording must never get in the way of handling the update
+            logger.error(f"Could not record update {update.update_id}: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Recorded {self.recorded} update(s) to {self.path}.")
+
+
+def recorder_for(bot_name, keep_texts=()):
+    """An UpdateRecorder for bot_name when RECORD_UPDATES_DIR is set, else None."""
+    if not RECORD_UPDATES_DIR:
+        return None
+    return UpdateRecorder(os.path.join(RECORD_UPDATES_DIR, f"{bot_name}.jsonl.gz"), bot_name, keep_texts=keep_texts)
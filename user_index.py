@@ -0,0 +1,139 @@
+# user_index.py
+import logging
+import string
+
+from sheet_gateway import sheet_gateway
+
+logger = logging.getLogger(__name__)
+
+USER_ID_HEADER = "User ID"
+
+
+def column_letter_to_index(col_letter: str) -> int:
+    """Converts a sheet column letter ("A", "K", "AA") to a 0-based index."""
+    idx = 0
+    for ch in col_letter.upper():
+        idx = idx * 26 + (string.ascii_uppercase.index(ch) + 1)
+    return idx - 1
+
+
+def column_index_to_letter(col: int) -> str:
+    """Converts a 0-based column index to a sheet column letter (0 -> "A", 26 -> "AA")."""
+    letters = ""
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = string.ascii_uppercase[rem] + letters
+    return letters
+
+
+class UserIndex:
+    """
+    Resident User ID -> (row index, row record) index over the registration sheet.
+
+    The index is built from a single get_all_values() call and then kept current
+    by the write paths (append_row, update, delete_rows) so that find_user_row
+    never has to download the sheet again. Row indices are 1-based sheet rows
+    (row 1 is the header), exactly like the old get_all_records() scan returned.
+    """
+
+    def __init__(self):
+        self.header = []
+        self._by_user = {}   # user_id (str) -> row index
+        self._by_row = {}    # row index -> row record (dict keyed by header)
+        self._last_row = 1  # Last used sheet row; the header occupies row 1
+        self.is_loaded = False
+
+    async def build(self, worksheet):
+        """Builds the index from one bulk read of the worksheet."""
+        all_values = await sheet_gateway.get_all_values(worksheet)
+        self.load_values(all_values)
+        logger.info(f"User index built with {len(self._by_user)} users from '{worksheet.title}'.")
+
+    def load_values(self, all_values):
+        """(Re)loads the index from a get_all_values()-style list of rows."""
+        self.header = list(all_values[0]) if all_values else []
+        self._by_user = {}
+        self._by_row = {}
+        for row_idx, values in enumerate(all_values[1:], start=2):
+            record = self._to_record(values)
+            self._by_row[row_idx] = record
+            user_id = str(record.get(USER_ID_HEADER, "")).strip()
+            if user_id:
+                self._by_user[user_id] = row_idx
+        self._last_row = max(len(all_values), 1)
+        self.is_loaded = True
+
+    def invalidate(self):
+        """Forces a rebuild on the next lookup (e.g. after a failed write)."""
+        self.is_loaded = False
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def get(self, user_id):
+        """Returns (row_idx, record) for the user, or (None, None) if unknown."""
+        row_idx = self._by_user.get(str(user_id))
+        if row_idx is None:
+            return None, None
+        return row_idx, self._by_row[row_idx]
+
+    def append(self, values):
+        """Records a row that was appended after the last used row. Returns its index."""
+        self._last_row += 1
+        self.set_row(self._last_row, values)
+        return self._last_row
+
+    def set_row(self, row_idx, values):
+        """Records a full-row update (columns starting at A)."""
+        old = self._by_row.get(row_idx)
+        if old is not None:
+            old_user = str(old.get(USER_ID_HEADER, "")).strip()
+            if self._by_user.get(old_user) == row_idx:
+                del self._by_user[old_user]
+        record = self._to_record(values)
+        self._by_row[row_idx] = record
+        user_id = str(record.get(USER_ID_HEADER, "")).strip()
+        if user_id:
+            self._by_user[user_id] = row_idx
+        self._last_row = max(self._last_row, row_idx)
+
+    def set_cell(self, row_idx, col_letter, value):
+        """Records a single-cell update."""
+        record = self._by_row.get(row_idx)
+        col = column_letter_to_index(col_letter)
+        if record is None or col >= len(self.header):
+            # Unknown row or a column outside the header: the cheapest safe
+            # thing is to rebuild on the next lookup.
+            self.invalidate()
+            return
+        header_name = self.header[col]
+        if header_name == USER_ID_HEADER:
+            values = [record.get(h, "") for h in self.header]
+            values[col] = value
+            self.set_row(row_idx, values)
+        else:
+            record[header_name] = value
+
+    def delete_row(self, row_idx):
+        """Records a delete_rows(row_idx); every row below shifts up by one."""
+        if row_idx not in self._by_row:
+            self.invalidate()
+            return
+        by_row = {}
+        for idx, record in self._by_row.items():
+            if idx < row_idx:
+                by_row[idx] = record
+            elif idx > row_idx:
+                by_row[idx - 1] = record
+        self._by_row = by_row
+        self._by_user = {}
+        for idx, record in by_row.items():
+            user_id = str(record.get(USER_ID_HEADER, "")).strip()
+            if user_id:
+                self._by_user[user_id] = idx
+        self._last_row = max(self._last_row - 1, 1)
+
+    def _to_record(self, values):
+        values = list(values)
+        return {name: (values[i] if i < len(values) else "") for i, name in enumerate(self.header) if name}
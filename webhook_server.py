@@ -0,0 +1,131 @@
+# webhook_server.py
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+from bot_metrics import CONTENT_TYPE, metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+HEALTH_TEXT = 'Bot is running (health check)!'
+
+
+def default_secret_token(bot_token: str) -> str:
+    """Stable webhook secret derived from the bot token (only A-Z, a-z, 0-9, _ and - are allowed)."""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()[:64]
+
+
+def _health_route(health):
+    """GET handler for / and /health: the BotHealth snapshot as JSON, 503 when degraded."""
+
+    async def handle(request: web.Request) -> web.Response:
+        if health is None:
+            return web.Response(text=HEALTH_TEXT)
+        healthy, report = health.snapshot()
+        return web.json_response(report, status=200 if healthy else 503)
+
+    return handle
+
+
+async def _metrics_route(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+def build_web_app(application, secret_token: str, webhook_path: str = WEBHOOK_PATH,
+                  health=None) -> web.Application:
+    """
+    aiohttp app serving Telegram webhook POSTs on webhook_path and the health
+    check on / and /health, so one server on $PORT covers both. With a
+    bot_health.BotHealth the health check reports its snapshot. /metrics
+    serves bot_metrics in the Prometheus text format.
+    """
+
+    async def telegram_webhook(request: web.Request) -> web.Response:
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(received, secret_token):
+            logger.warning(f"Rejected webhook request from {request.remote}: bad secret token.")
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook payload: {e}", exc_info=True)
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response(status=200)
+
+    web_app = web.Application()
+    web_app.router.add_post(webhook_path, telegram_webhook)
+    web_app.router.add_get("/", _health_route(health))
+    web_app.router.add_get("/health", _health_route(health))
+    web_app.router.add_get("/metrics", _metrics_route)
+    web_app["application"] = application
+    return web_app
+
+
+async def start_status_server(health, port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """
+    Serves only the health check and /metrics, for polling mode where $PORT
+    belongs to the Flask health app. Returns the runner; await
+    runner.cleanup() to stop it.
+    """
+    web_app = web.Application()
+    web_app.router.add_get("/", _health_route(health))
+    web_app.router.add_get("/health", _health_route(health))
+    web_app.router.add_get("/metrics", _metrics_route)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Bot status server listening on {host}:{port}.")
+    return runner
+
+
+async def run_webhook(application, webhook_url: str, port: int, secret_token: str,
+                      webhook_path: str = WEBHOOK_PATH, web_app: web.Application = None, health=None):
+    """
+    Runs `application` in webhook mode until SIGTERM/SIGINT: the same
+    lifecycle as Application.run_polling (initialize, post_init, start, ...,
+    post_shutdown), with updates arriving through the aiohttp server instead
+    of getUpdates.
+    """
+    if web_app is None:
+        web_app = build_web_app(application, secret_token, webhook_path, health=health)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    runner = web.AppRunner(web_app, access_log=None)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        logger.info(f"Webhook server listening on port {port} ({webhook_path}, /health, /metrics).")
+
+        await application.bot.set_webhook(
+            url=webhook_url.rstrip("/") + webhook_path,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await application.start()
+        logger.info(f"Webhook set to {webhook_url.rstrip('/')}{webhook_path}; bot started in webhook mode.")
+
+        await stop_event.wait()
+        logger.info("Stop signal received; shutting down webhook server.")
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)